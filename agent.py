@@ -2,17 +2,15 @@
 import os, json, time, re, requests
 from typing import Any, Dict
 from pydantic import BaseModel, Field, ValidationError
-from storage import get_slots, merge_slots, log_message, recent_dialog
+from core.config import settings
+from storage import SLOT_TEMPLATE, get_slots, merge_slots, log_message, recent_dialog
+from services.response_cache import ResponseCache, last_assistant, prompt_version
+from services.prompt import build_messages, record_usage
+from services.kb import knowledge
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
 
-PRICING = ("MRV ≈ 185 USD por persona; honorarios desde $1,500 MXN; "
-           "adelanto de cita opcional desde $5,000 MXN; con adelanto el apoyo "
-           "de trámite baja a $1,000 MXN. Pueden variar según consulado y fecha.")
-PROCESS = "DS-160 → pago MRV → citas CAS/Consulado → acompañamiento hasta la decisión."
-DOCS    = "Pasaporte vigente, comprobante de ingresos/empleo o info de negocio, y plan tentativo de viaje."
-
 class AgentOut(BaseModel):
     reply: str
     quick_replies: list[str] = Field(default_factory=list)
@@ -21,14 +19,12 @@ class AgentOut(BaseModel):
     ask_delay_seconds: int = 0
     escalate_to_human: bool = False
 
-SYSTEM_PROMPT = f"""
+SYSTEM_PROMPT = """
 Eres asesor de visas en México. Tono humano, cálido y claro.
 Normas:
 - Máximo 1 pregunta por turno. No repitas saludos si ya hubo uno.
 - Usa el nombre si existe `slots.contact_name`, no en cada línea.
-- No inventes datos. Costos/tiempos válidos: {PRICING}
-- Proceso base: {PROCESS}
-- Documentos base: {DOCS}
+- No inventes datos: costos, tiempos, proceso y documentos sólo de "Información del KB".
 - Si aparece tema legal sensible (deportación, asilo, fraude, antecedentes): escalas a humano.
 
 Responde SOLO JSON con claves: reply, quick_replies, slots, followups, ask_delay_seconds, escalate_to_human.
@@ -46,6 +42,11 @@ FEW_SHOTS = [
     }, ensure_ascii=False)},
 ]
 
+PREFIX = [{"role": "system", "content": SYSTEM_PROMPT}, *FEW_SHOTS]
+
+_replies = ResponseCache("flask", settings.RESPONSE_CACHE_SIZE, settings.RESPONSE_CACHE_TTL,
+                         prompt_version(SYSTEM_PROMPT, FEW_SHOTS, OPENAI_MODEL), settings.RESPONSE_CACHE_MAX_CHARS)
+
 def strip_redundant_saludo(text: str, greeted: bool) -> str:
     if greeted and re.match(r'^\s*(hola|buen[oa]s?)\b', text or "", re.I):
         parts = re.split(r'(?<=[.!?])\s+', text, maxsplit=1)
@@ -57,8 +58,7 @@ def grounded_or_caution(text: str) -> str:
     if not text: return text
     # si detecta números sospechosos, reemplaza por texto político
     if re.search(r"\$\s*\d{5,}", text) or re.search(r"\b\d{3,5}\s*usd\b", text, re.I):
-        return ("Te comparto rangos autorizados: MRV ~185 USD pp; honorarios desde $1,500 MXN; "
-                "adelanto desde $5,000 MXN. Pueden variar según consulado y fecha.")
+        return "Te comparto rangos autorizados: " + knowledge.texts()["pricing"]
     return text
 
 def ai_reply(wa_id: str, user_text: str) -> AgentOut:
@@ -71,17 +71,23 @@ def ai_reply(wa_id: str, user_text: str) -> AgentOut:
     if not OPENAI_API_KEY:
         return fallback
 
-    dialog = "\n".join(recent_dialog(wa_id, limit=10))
-    messages = [
-        {"role": "system", "content": SYSTEM_PROMPT},
-        *FEW_SHOTS,
-        {"role": "system", "content": f"Slots actuales: {json.dumps(slots, ensure_ascii=False)}"},
-        {"role": "system", "content": f"Historial reciente:\n{dialog}"},
-        {"role": "user", "content": user_text or ""},
-    ]
+    dialog = list(recent_dialog(wa_id, limit=10))
+    key = _replies.key(user_text, slots, knowledge.digest(), last_assistant(dialog))
+    hit = _replies.get(key)
+    if hit:
+        out = AgentOut.model_validate(hit)
+        if out.slots:
+            merge_slots(wa_id, out.slots)
+        return out
+
+    # prefijo estable (system + few-shots) primero; fragmentos del KB, slots compactos e historial con presupuesto
+    messages, _ = build_messages("flask", PREFIX, slots, SLOT_TEMPLATE, dialog,
+                                 user_text, settings.PROMPT_TOKEN_BUDGET,
+                                 context=knowledge.context(user_text, last_assistant(dialog)))
     payload = {
         "model": OPENAI_MODEL,
         "messages": messages,
+        "prompt_cache_key": f"flask-{_replies.version}-{knowledge.digest()[:12]}",
         "response_format": {"type": "json_object"},
         "temperature": 0.4,
         "max_tokens": 450
@@ -95,12 +101,16 @@ def ai_reply(wa_id: str, user_text: str) -> AgentOut:
         )
         if resp.status_code != 200:
             return fallback
-        content = resp.json()["choices"][0]["message"]["content"]
+        body = resp.json()
+        record_usage("flask", body.get("usage"))
+        content = body["choices"][0]["message"]["content"]
         raw = json.loads(content)
         out = AgentOut.model_validate(raw)
 
         greeted = slots.get("stage") not in (None, "new", "ask_name")
         out.reply = grounded_or_caution(strip_redundant_saludo(out.reply, greeted))
+        _replies.put(key, out.model_dump(), (body.get("usage") or {}).get("total_tokens", 0),
+                     slots.get("contact_name"))
 
         if out.slots:
             merge_slots(wa_id, out.slots)
@@ -1,15 +1,26 @@
 # app.py
-import os, re, json, time, hmac, hashlib, random
-from typing import Any, Dict
-from collections import OrderedDict
+import asyncio, atexit, os, re, json, time, hmac, hashlib, random, threading
+from typing import Any, Dict, Optional, Union
 from flask import Flask, request, abort
 from dotenv import load_dotenv
 
-from storage import init_db, get_slots, merge_slots, log_message
+import storage
+from storage import DB_PATH, init_db, get_slots, merge_slots, log_message
 from whatsapp import send_text, mark_as_read, normalize_mx
 from agent import ai_reply
-from validators import EMAIL_RX, GREET_ONLY_RX, NAME_HINT_RX, extract_email, extract_mx_phone
-from human_override import request_human_reply, submit_human_reply, pending_requests
+from validators import EMAIL_RX, NAME_HINT_RX, extract_email, extract_mx_phone
+from services.policy import intents
+from services.lanes import ThreadLanes
+from services.dedupe import SQLiteDedupe
+from services.outbound import Dispatcher, ThreadedDispatcher
+from services.outbox import Outbox
+from services.backend_sqlite import SQLiteBackend
+from services.whatsapp import GraphError, HOLD, PERMANENT
+from services.receipts import Receipts
+from services.prompt import load_encoder
+from services.kb import knowledge
+from core.config import settings
+from human_override import open_handoff, submit_human_reply, reopen_handoff, pending_requests
 from monitoring import webhook_requests, wa_send_ok, wa_send_error, llm_latency
 from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
 
@@ -18,27 +29,80 @@ PORT = int(os.getenv("PORT", "3000"))
 VERIFY_SIGNATURE = bool(int(os.getenv("VERIFY_SIGNATURE", "0")))
 APP_SECRET = os.getenv("APP_SECRET", "")
 WHATSAPP_VERIFY_TOKEN = os.getenv("WHATSAPP_VERIFY_TOKEN", "mi_verify_2025")
+DEDUPE_TTL_SECONDS = float(os.getenv("DEDUPE_TTL_SECONDS", str(7 * 24 * 3600)))
 
 app = Flask(__name__)
 init_db()
+knowledge.current()     # mapea el artefacto (o indexa KB/) al importar, no en el primer mensaje
+# tiktoken en segundo plano; hasta que cargue, los prompts se miden con la estimación
+threading.Thread(target=load_encoder, daemon=True, name="tiktoken").start()
 
 def log(*a): print(time.strftime("[%H:%M:%S]"), *a, flush=True)
 
-class LRUSet:
-    def __init__(self, cap=5000):
-        self.cap = cap
-        self.d = OrderedDict()
-    def add_if_new(self, key: str) -> bool:
-        if not key: return True
-        if key in self.d:
-            self.d.move_to_end(key)
-            return False
-        self.d[key] = None
-        if len(self.d) > self.cap:
-            self.d.popitem(last=False)
-        return True
-
-DEDUP = LRUSet(5000)
+DEDUP = SQLiteDedupe(DB_PATH, DEDUPE_TTL_SECONDS)  # durable: sobrevive reinicios y se comparte entre workers
+LANES = ThreadLanes()  # un turno a la vez por wa_id entre hilos de Flask
+# envíos en un hilo con event loop: límite global, FIFO por número y retrasos sin time.sleep.
+# Todo pasa por la tabla `outbox` de la misma BD (como la API): reintentos por clase de error,
+# dead-letter, y el turno queda en messages al encolarse, en orden con los del usuario.
+OUTBOUND = ThreadedDispatcher(Dispatcher("flask", settings.OUTBOUND_RATE, settings.OUTBOUND_BURST,
+                                         settings.OUTBOUND_WORKERS))
+STORE = SQLiteBackend(DB_PATH, turns=storage)
+
+async def _graph_send(wa_id: str, text: str) -> Optional[str]:
+    ok, info = await asyncio.to_thread(send_text, wa_id, text)
+    if not ok:
+        kind = info if info in HOLD | PERMANENT else "TRANSIENT"
+        wa_send_error.labels(kind).inc(); log("WA send:", False, info)
+        raise GraphError(kind, detail=info)
+    wa_send_ok.inc()
+    try:
+        return ((json.loads(info).get("messages") or [{}])[0]).get("id")
+    except ValueError:
+        return None
+
+OUTBOX = Outbox(OUTBOUND.dispatcher, settings.OUTBOX_MAX_ATTEMPTS, settings.OUTBOX_BACKOFF_BASE,
+                settings.OUTBOX_BACKOFF_CAP, settings.OUTBOX_POLL_SECONDS, settings.OUTBOX_LEASE_SECONDS,
+                store=lambda: STORE, send=_graph_send)
+
+async def _await(fut):
+    return await fut
+
+def send(wa_id: str, text: str, delay: float = 0.0, key: Optional[str] = None, log: Union[bool, str] = True):
+    """Registra el envío (y `log` en messages) y regresa; sale desde el hilo de envíos. El future
+    dice si salió al primer intento (si no, el outbox reintenta); None si `key` ya estaba."""
+    if not OUTBOX.dispatcher.running:
+        OUTBOUND.run(OUTBOX.start()).result()
+    fut = OUTBOUND.run(OUTBOX.put(wa_id, text, key, delay, log=log)).result(timeout=30)
+    return None if fut is None else OUTBOUND.run(_await(fut))
+
+async def _mark_read(wamid: str, typing: bool):
+    ok, info = await asyncio.to_thread(mark_as_read, wamid, typing)
+    if not ok:
+        log("WA read:", False, info)
+
+# acuses de lectura en el mismo hilo de envíos, con su propio Dispatcher y ventana de agrupado
+RECEIPTS = Receipts(Dispatcher("flask-receipts", settings.RECEIPTS_RATE, settings.RECEIPTS_RATE,
+                               settings.RECEIPTS_WORKERS), settings.RECEIPTS_WINDOW_SECONDS, _mark_read)
+
+def mark_read(wa_id: str, wamid: str, typing: bool = False):
+    """No bloquea el request: el acuse se agrupa y sale desde el hilo de envíos."""
+    if not RECEIPTS.dispatcher.running:
+        OUTBOUND.run(RECEIPTS.start()).result()
+    OUTBOUND.call(RECEIPTS.mark, wa_id, wamid, typing)
+
+@atexit.register
+def _drain_outbound():
+    # al salir o reciclarse el worker (gunicorn sale con sys.exit): se intenta enviar lo encolado
+    # antes de cerrar el hilo; lo que no salga queda pending en `outbox` y lo retoma el siguiente
+    if not OUTBOUND.running:
+        return
+    for svc in (RECEIPTS, OUTBOX):
+        if svc.dispatcher.running:
+            try:
+                OUTBOUND.run(svc.stop(settings.OUTBOUND_DRAIN_SECONDS)).result(settings.OUTBOUND_DRAIN_SECONDS + 5)
+            except Exception as e:
+                log("cierre de envíos:", repr(e))
+    OUTBOUND.close(settings.OUTBOUND_DRAIN_SECONDS)
 
 @app.get("/")
 def root(): return "OK", 200
@@ -59,8 +123,23 @@ def admin_reply():
     data = request.get_json(silent=True) or {}
     wa_id = data.get("wa_id")
     text  = data.get("text")
-    ok = submit_human_reply(wa_id, text or "")
-    return ({"ok": True} if ok else {"ok": False, "error": "no pending/expired"}), 200
+    expires_at = submit_human_reply(wa_id, text or "")
+    if expires_at is None:
+        return {"ok": False, "error": "no pending/expired"}, 200
+    # entrega directa: la ventana ya se cerró, el turno escalado no está esperando
+    # queda en el outbox (y en messages) antes de responder; una llave por ventana
+    with LANES.hold(wa_id):
+        try:
+            fut = send(wa_id, text, key=f"override:{wa_id}:{expires_at}")
+        except Exception as e:
+            reopen_handoff(wa_id, expires_at)      # no se registró: el agente puede volver a enviarla
+            return {"ok": False, "info": repr(e)}, 200
+    try:
+        ok = fut is None or fut.result(timeout=60)
+    except Exception:           # TimeoutError: sigue en el outbox
+        ok = False
+    # False: no salió al primer intento; el outbox reintenta (ver GET /outbox/dead si se agota)
+    return {"ok": True, "info": "sent" if ok else "queued"}, 200
 
 def verify_sig(req) -> bool:
     if not VERIFY_SIGNATURE: return True
@@ -83,6 +162,88 @@ def extract_text(msg: Dict[str, Any]):
         option_id = btn.get("id") or lst.get("id")
     return text, mtype, option_id
 
+def handle_message(value: Dict[str, Any], msg: Dict[str, Any]):
+    wamid = msg.get("id")
+    wa_id = msg.get("from")
+    slots = get_slots(wa_id)
+    key = lambda part: f"{wamid}:{part}" if wamid else None     # idempotencia en el outbox
+
+    # Capturar nombre del profile una sola vez
+    if not slots.get("contact_name"):
+        profile = ((value.get("contacts") or [{}])[0].get("profile") or {})
+        pname = profile.get("name")
+        if pname:
+            toks = re.findall(r"[A-Za-zÁÉÍÓÚÜÑáéíóúüñ]+", pname)
+            if toks:
+                merge_slots(wa_id, {"contact_name": toks[0].capitalize()})
+
+    text, mtype, option_id = extract_text(msg)
+    log("Tipo:", mtype, "| Texto:", repr(text))
+    if wamid:
+        mark_read(wa_id, wamid)
+    if not text:
+        if mtype == "audio":
+            send(wa_id, "Recibí tu audio 🙌 dame un momento para escucharlo.", key=key("ack"), log=False)
+        elif mtype in ("image", "document", "video"):
+            send(wa_id, "Recibí el archivo 👍 ¿Seguimos con requisitos o te paso costos?", key=key("ack"), log=False)
+        return
+
+    log_message(wa_id, "user", text)
+
+    # Extrae email/phone si vinieron
+    to_merge = {}
+    em = extract_email(text)
+    ph = extract_mx_phone(text)
+    if em: to_merge["contact_email"] = em
+    if ph: to_merge["contact_phone"] = ph
+    if to_merge: merge_slots(wa_id, to_merge)
+
+    # una sola pasada del motor de intents (saludo, nombre, ...) sobre el texto normalizado
+    hits = intents.classify(text)
+
+    # Nombre declarado (“soy…/me llamo…”)
+    if not slots.get("contact_name") and "nombre" in hits:
+        m = re.search(r"\b(me llamo|mi nombre es|soy)\s+([A-Za-zÁÉÍÓÚÜÑáéíóúüñ]+)", text, re.I)
+        if m:
+            name = m.group(2).strip().split()[0].capitalize()
+            merge_slots(wa_id, {"contact_name": name, "stage":"ask_need"})
+            send(wa_id, f"Mucho gusto, {name}. Cuéntame brevemente qué necesitas (renovar, primera vez o dudas).",
+                 key=key("r"), log=f"Mucho gusto, {name}...")
+            return
+
+    # Saludo puro sin nombre → pedir nombre una vez
+    if "saludo" in hits and not slots.get("contact_name"):
+        merge_slots(wa_id, {"stage":"ask_name"})
+        send(wa_id, "Hola 🙂 ¿Con quién tengo el gusto?", key=key("r"))
+        return
+
+    # ---- IA principal ----
+    if wamid and settings.TYPING_INDICATOR:
+        mark_read(wa_id, wamid, typing=True)      # "escribiendo…" mientras responde la IA
+    user_for_llm = option_id or text
+    t0 = time.time()
+    out = ai_reply(wa_id, user_for_llm)
+    llm_latency.observe(time.time() - t0)
+
+    # typing human-like: timer del dispatcher, el hilo del request no espera
+    delay = min(max(out.ask_delay_seconds, 0), 2) + random.uniform(0.4, 1.0)
+
+    # envía respuesta
+    send(wa_id, out.reply or "Listo ✅", delay, key("r"))
+
+    # followup corto, después de la respuesta en la misma fila
+    if out.followups:
+        send(wa_id, out.followups[0], settings.FOLLOWUP_GAP_SECONDS, key("f0"))
+
+    # escalar a humano
+    if out.escalate_to_human:
+        merge_slots(wa_id, {"stage":"escalado"})
+        send(wa_id, "Gracias por la info 🙏 Lo reviso con mi supervisor y te escribo en breve.",
+             key=key("hold"), log=False)
+        # abre ventana de override (5 min); la respuesta llega por /admin/reply
+        open_handoff(wa_id, ttl_seconds=300)
+
+
 @app.route("/webhook", methods=["GET", "POST"])
 def webhook():
     webhook_requests.inc()
@@ -120,93 +281,8 @@ def webhook():
                     log("dup-skip", wamid)
                     continue
 
-                wa_id = msg.get("from")
-                slots = get_slots(wa_id)
-
-                # Capturar nombre del profile una sola vez
-                if not slots.get("contact_name"):
-                    profile = ((value.get("contacts") or [{}])[0].get("profile") or {})
-                    pname = profile.get("name")
-                    if pname:
-                        toks = re.findall(r"[A-Za-zÁÉÍÓÚÜÑáéíóúüñ]+", pname)
-                        if toks:
-                            merge_slots(wa_id, {"contact_name": toks[0].capitalize()})
-
-                text, mtype, option_id = extract_text(msg)
-                log("Tipo:", mtype, "| Texto:", repr(text))
-                if not text:
-                    if mtype == "audio":
-                        send_text(wa_id, "Recibí tu audio 🙌 dame un momento para escucharlo.")
-                    elif mtype in ("image", "document", "video"):
-                        send_text(wa_id, "Recibí el archivo 👍 ¿Seguimos con requisitos o te paso costos?")
-                    continue
-
-                log_message(wa_id, "user", text)
-
-                # Extrae email/phone si vinieron
-                to_merge = {}
-                em = extract_email(text)
-                ph = extract_mx_phone(text)
-                if em: to_merge["contact_email"] = em
-                if ph: to_merge["contact_phone"] = ph
-                if to_merge: merge_slots(wa_id, to_merge)
-
-                tlow = text.lower()
-
-                # Nombre declarado (“soy…/me llamo…”)
-                if not slots.get("contact_name"):
-                    m = re.search(r"\b(me llamo|mi nombre es|soy)\s+([A-Za-zÁÉÍÓÚÜÑáéíóúüñ]+)", text, re.I)
-                    if m:
-                        name = m.group(2).strip().split()[0].capitalize()
-                        merge_slots(wa_id, {"contact_name": name, "stage":"ask_need"})
-                        send_text(wa_id, f"Mucho gusto, {name}. Cuéntame brevemente qué necesitas (renovar, primera vez o dudas).")
-                        log_message(wa_id, "assistant", f"Mucho gusto, {name}...")
-                        continue
-
-                # Saludo puro sin nombre → pedir nombre una vez
-                if GREET_ONLY_RX.match(tlow) and not slots.get("contact_name"):
-                    merge_slots(wa_id, {"stage":"ask_name"})
-                    send_text(wa_id, "Hola 🙂 ¿Con quién tengo el gusto?")
-                    log_message(wa_id, "assistant", "Hola 🙂 ¿Con quién tengo el gusto?")
-                    continue
-
-                # ---- IA principal ----
-                user_for_llm = option_id or text
-                t0 = time.time()
-                out = ai_reply(wa_id, user_for_llm)
-                llm_latency.observe(time.time() - t0)
-
-                # typing human-like
-                delay = min(max(out.ask_delay_seconds, 0), 2)
-                if delay: time.sleep(delay)
-                time.sleep(random.uniform(0.4, 1.0))
-
-                # envía respuesta
-                ok, info = send_text(wa_id, out.reply or "Listo ✅")
-                if ok: wa_send_ok.inc()
-                else: wa_send_error.labels(info).inc()
-                log("WA send:", ok, info)
-                log_message(wa_id, "assistant", out.reply or "Listo ✅")
-
-                # followup corto
-                if out.followups:
-                    time.sleep(0.6)
-                    send_text(wa_id, out.followups[0])
-                    log_message(wa_id, "assistant", out.followups[0])
-
-                # escalar a humano
-                if out.escalate_to_human:
-                    merge_slots(wa_id, {"stage":"escalado"})
-                    send_text(wa_id, "Gracias por la info 🙏 Lo reviso con mi supervisor y te escribo en breve.")
-                    # abre ventana de override (5 min)
-                    human = request_human_reply(wa_id, ttl_seconds=300)
-                    if human:
-                        send_text(wa_id, human)
-                        log_message(wa_id, "assistant", human)
-
-                # marca leído
-                if wamid:
-                    mark_as_read(wamid)
+                with LANES.hold(msg.get("from")):
+                    handle_message(value, msg)
 
     return "ok", 200
 
@@ -1,28 +1,43 @@
 # human_override.py
-import time, queue
+import time
 from typing import Dict, Optional
+from storage import DB_PATH
+from services.db import get_store
 
-_QUEUES: Dict[str, queue.Queue] = {}
-_TTL: Dict[str, float] = {}
+# Ventanas de respuesta humana para app.py (Flask). Viven en la tabla `overrides`, así que
+# sobreviven reinicios y cualquier worker puede atender /admin/reply. Nada espera: escalar sólo
+# abre la ventana y el vencimiento se aplica al consultar (sin hilos ni timers).
 
-def request_human_reply(wa_id: str, ttl_seconds: int = 300) -> Optional[str]:
-    q = _QUEUES.setdefault(wa_id, queue.Queue())
-    _TTL[wa_id] = time.time() + ttl_seconds
-    try:
-        return q.get(timeout=ttl_seconds)
-    except queue.Empty:
-        _TTL.pop(wa_id, None)
-        return None
+def _db():
+    return get_store(DB_PATH)
+
+def open_handoff(wa_id: str, ttl_seconds: int = 300):
+    _db().execute(
+        "INSERT INTO overrides(wa_id,expires_at,reply) VALUES(?,?,NULL) "
+        "ON CONFLICT(wa_id) DO UPDATE SET expires_at=excluded.expires_at, reply=NULL",
+        (wa_id, time.time() + ttl_seconds))
+
+def claim_handoff(wa_id: str) -> Optional[float]:
+    """Cierra la ventana si sigue viva y devuelve su vencimiento. Sólo quien la cierra recibe
+    un valor: ese entrega la respuesta (y la reabre con `reopen_handoff` si el envío falla)."""
+    row = _db().execute(lambda con: con.execute(
+        "DELETE FROM overrides WHERE wa_id=? AND expires_at > ? RETURNING expires_at",
+        (wa_id, time.time())).fetchone())
+    return row[0] if row else None
 
-def submit_human_reply(wa_id: str, text: str) -> bool:
-    q = _QUEUES.get(wa_id)
-    exp = _TTL.get(wa_id, 0)
-    if not q or time.time() > exp:
-        return False
-    q.put(text)
-    _TTL.pop(wa_id, None)
-    return True
+def reopen_handoff(wa_id: str, expires_at: float):
+    """Devuelve la ventana tras un envío fallido, para que el agente pueda reintentar. Si en
+    medio se volvió a escalar, se queda la ventana nueva."""
+    _db().execute("INSERT INTO overrides(wa_id,expires_at,reply) VALUES(?,?,NULL) ON CONFLICT(wa_id) DO NOTHING",
+                  (wa_id, expires_at))
+
+def submit_human_reply(wa_id: Optional[str], text: str) -> Optional[float]:
+    if not (wa_id and text):
+        return None
+    return claim_handoff(wa_id)
 
 def pending_requests() -> Dict[str, int]:
+    # las vencidas se quedan en la tabla (una fila por wa_id) y la siguiente escalada las pisa
     now = time.time()
-    return {k: int(_TTL[k] - now) for k in list(_TTL.keys()) if _TTL[k] > now}
+    rows = _db().query("SELECT wa_id, expires_at FROM overrides WHERE reply IS NULL AND expires_at > ?", (now,))
+    return {w: int(exp - now) for w, exp in rows}
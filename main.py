@@ -5,6 +5,7 @@ from openai import OpenAI
 from fastapi import FastAPI, Query, HTTPException, Request
 from fastapi.responses import PlainTextResponse, JSONResponse
 import os, json, requests
+from services.kb import knowledge
 
 # --- Cargar .env ---
 BASE_DIR = Path(__file__).resolve().parent
@@ -14,6 +15,7 @@ client = OpenAI()
 AI_MODEL = os.getenv("AI_MODEL", "gpt-4o-mini")
 
 app = FastAPI(title="Visa Sales Agent API", version="1.0.0")
+knowledge.current()     # precios/tiempos de KB/politica.md; sin KB válido no arranca
 
 # --- ENV ---
 WHATSAPP_TOKEN   = os.getenv("WHATSAPP_TOKEN")
@@ -126,9 +128,8 @@ SELLER_SYSTEM_PROMPT = (
     "'Permíteme para poder escucharlo'. "
     "Flujo: saluda → detecta interés → preguntas graduales (visa/relación; "
     "ubicación; empresa si trabajo; tiempo laborando; ingreso mensual; propiedades/vehículos; deudas; hijos; historial migratorio/visa previa; problemas legales*). "
-    "Explica costos orientativos B1/B2: MRV aprox. 185 USD (sujeto a cambio), "
-    "trámite base $1,500 MXN, 'adelanto de cita' $5,000 MXN y entonces trámite baja a $1,000 MXN; "
-    "con adelanto, tiempos estimados ~4–6 meses. Cierra ofreciendo acompañamiento y seguimiento. "
+    "Explica costos orientativos B1/B2 sólo con estos datos: {pricing} {tiempos} "
+    "Cierra ofreciendo acompañamiento y seguimiento. "
     "Siempre una sola pregunta al final. Marca de cierre amable."
     "\n*Si detectas palabras de problema legal fuerte, responde profesional y neutro sin asesoría legal."
 )
@@ -136,7 +137,7 @@ SELLER_SYSTEM_PROMPT = (
 def ai_reply(from_wa: str, user_text: str) -> str:
     history = CONVO.get(from_wa, [])
 
-    messages = [{"role":"system","content": SELLER_SYSTEM_PROMPT}]
+    messages = [{"role":"system","content": SELLER_SYSTEM_PROMPT.format(**knowledge.texts())}]
     messages.extend(history)
     messages.append({"role":"user","content": user_text})
 
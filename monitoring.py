@@ -1,7 +1,113 @@
 # monitoring.py
-from prometheus_client import Counter, Histogram
+from prometheus_client import Counter, Gauge, Histogram
 
 webhook_requests = Counter("wa_webhook_requests_total", "Entradas al webhook")
 wa_send_ok = Counter("wa_send_ok_total", "Mensajes enviados OK")
 wa_send_error = Counter("wa_send_error_total", "Mensajes enviados con error", ["reason"])
 llm_latency = Histogram("llm_latency_seconds", "Latencia de llamada al LLM (s)")
+first_message = Histogram("first_message_seconds", "Desde que arranca el turno hasta el primer mensaje enviado (s)",
+                          ["mode"], buckets=(.25, .5, .75, 1, 1.5, 2, 3, 4, 6, 8, 12))
+
+# Ingesta asíncrona del webhook (FastAPI)
+ingest_depth = Gauge("ingest_queue_depth", "Mensajes aceptados sin terminar (en cola o en su carril)")
+ingest_enqueued = Counter("ingest_enqueued_total", "Mensajes encolados")
+ingest_rejected = Counter("ingest_rejected_total", "Mensajes rechazados por cola llena")
+ingest_wait = Histogram("ingest_wait_seconds", "Tiempo en cola antes de procesar (s)")
+ingest_process = Histogram("ingest_process_seconds", "Tiempo de proceso por mensaje, con la espera en su carril (s)")
+
+# Carriles por conversación (wa_id)
+lane_depth = Gauge("lane_depth", "Turnos esperando o corriendo en carriles por wa_id", ["kind"])
+lane_active = Gauge("lane_active", "Carriles (wa_id) con turnos en curso", ["kind"])
+lane_wait = Histogram("lane_wait_seconds", "Espera para tomar el carril de un wa_id (s)", ["kind"])
+
+# Agrupación de ráfagas (debounce) por wa_id
+coalesce_batch = Histogram("coalesce_batch_size", "Mensajes de usuario unidos en un solo turno",
+                           buckets=(1, 2, 3, 4, 5, 8, 13))
+coalesce_pending = Gauge("coalesce_pending", "Conversaciones con ventana de agrupación abierta")
+
+# Clientes HTTP compartidos (OpenAI / Graph)
+http_requests = Counter("http_client_requests_total", "Requests salientes por host", ["host"])
+http_connects = Counter("http_client_connects_total", "Conexiones TCP nuevas por host", ["host"])
+http_reuse_ratio = Gauge("http_client_reuse_ratio", "Fracción de requests que reusaron conexión", ["host"])
+http_pool_saturation = Gauge("http_client_pool_saturation", "Conexiones ocupadas / máximo del pool", ["host"])
+
+# SQLite: escritor único con group commit
+db_write_batch = Histogram("db_write_batch_size", "Escrituras por COMMIT",
+                           buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512))
+db_write_wait = Histogram("db_write_wait_seconds", "Desde encolar la escritura hasta su COMMIT (s)")
+
+# Salud del event loop (FastAPI)
+loop_lag = Histogram("event_loop_lag_seconds", "Retraso del event loop sobre el sleep esperado (s)",
+                     buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5))
+
+# Caché de slots (LRU + TTL)
+slot_cache_hits = Counter("slot_cache_hits_total", "Lecturas de slots servidas desde caché", ["cache"])
+slot_cache_misses = Counter("slot_cache_misses_total", "Lecturas de slots que fueron a la BD", ["cache"])
+slot_cache_evictions = Counter("slot_cache_evictions_total", "Entradas expulsadas", ["cache", "reason"])
+slot_cache_size = Gauge("slot_cache_size", "Conversaciones en caché de slots", ["cache"])
+
+# Historial reciente en memoria (ring buffer por wa_id)
+dialog_buffer_reads = Counter("dialog_buffer_reads_total", "Lecturas de recent_dialog", ["buffer", "result"])
+dialog_buffer_size = Gauge("dialog_buffer_size", "Conversaciones con historial en memoria", ["buffer"])
+
+# Archivo frío de mensajes
+archive_rows = Counter("archive_rows_moved_total", "Turnos movidos de messages al archivo")
+archive_run = Histogram("archive_run_seconds", "Duración de cada compactación (s)")
+
+# Dedupe de webhooks (wamid)
+dedupe_checks = Counter("dedupe_checks_total", "Chequeos de wamid por resultado", ["backend", "result"])
+dedupe_size = Gauge("dedupe_store_size", "Llaves vivas en el store de dedupe", ["backend"])
+bloom_checks = Counter("dedupe_bloom_checks_total", "Consultas al filtro Bloom", ["result"])
+bloom_false_positive = Counter("dedupe_bloom_false_positive_total", "\"Quizá visto\" que el store exacto dio por nuevo")
+bloom_bytes = Gauge("dedupe_bloom_bytes", "Memoria del filtro Bloom (bytes)")
+
+# Escalamientos a humano
+handoff_events = Counter("handoff_events_total", "Escalamientos por evento", ["event"])
+handoff_timers = Gauge("handoff_timers", "Ventanas de respuesta humana con vencimiento agendado")
+
+# Consola de agentes (SSE)
+console_subscribers = Gauge("console_subscribers", "Consolas conectadas al stream")
+console_events = Counter("console_events_total", "Eventos publicados a las consolas", ["event"])
+console_dropped = Counter("console_dropped_total", "Eventos descartados por consolas atrasadas")
+
+# Caché de respuestas del LLM
+response_cache_lookups = Counter("response_cache_lookups_total", "Consultas a la caché de respuestas", ["cache", "result"])
+response_cache_tokens_saved = Counter("response_cache_tokens_saved_total", "Tokens de OpenAI evitados por hits", ["cache"])
+response_cache_size = Gauge("response_cache_size", "Respuestas en caché", ["cache"])
+
+# Prompt del agente
+prompt_tokens = Histogram("prompt_tokens", "Tokens estimados del prompt por turno", ["agent", "part"],
+                          buckets=(100, 200, 300, 400, 600, 800, 1000, 1200, 1600, 2400, 3200))
+prompt_dialog_dropped = Counter("prompt_dialog_dropped_total", "Líneas de historial recortadas por presupuesto", ["agent"])
+llm_prompt_tokens = Counter("llm_tokens_total", "Tokens reportados por OpenAI", ["agent", "kind"])
+
+# Resúmenes de conversación
+summary_runs = Counter("summary_runs_total", "Resúmenes generados por resultado", ["result"])
+summary_seconds = Histogram("summary_seconds", "Duración de cada resumen (s)")
+
+# Clasificador local de intents (desvío de llamadas al LLM)
+classifier_decisions = Counter("classifier_decisions_total", "Turnos contestados sin LLM vs. enviados al LLM", ["result"])
+classifier_seconds = Histogram("classifier_seconds", "Tiempo de clasificación por mensaje (s)",
+                               buckets=(.00001, .000025, .00005, .0001, .00025, .0005, .001, .0025))
+
+# Recuperación sobre el KB (BM25 en memoria)
+kb_search_seconds = Histogram("kb_search_seconds", "Tiempo de búsqueda en el índice del KB (s)",
+                              buckets=(.00001, .000025, .00005, .0001, .00025, .0005, .001, .0025))
+kb_reloads = Counter("kb_reloads_total", "Recargas del índice del KB al cambiar archivos", ["result"])
+kb_loads = Counter("kb_loads_total", "Cargas del KB según origen (artefacto mapeado o archivos fuente)", ["source"])
+kb_chunks = Gauge("kb_chunks", "Fragmentos en el índice del KB")
+
+# Envíos salientes (token bucket global + FIFO por destinatario)
+outbound_depth = Gauge("outbound_queue_depth", "Mensajes salientes pendientes, incluidos los programados", ["dispatcher"])
+outbound_wait = Histogram("outbound_wait_seconds", "Espera desde que un mensaje está listo hasta que se envía (s)",
+                          ["dispatcher"])
+outbound_send = Histogram("outbound_send_seconds", "Duración del envío a Graph (s)", ["dispatcher"])
+outbound_sent = Counter("outbound_sent_total", "Mensajes salientes procesados", ["dispatcher", "result"])
+
+# Outbox durable de envíos
+outbox_results = Counter("outbox_results_total", "Intentos de envío del outbox por resultado", ["kind", "result"])
+outbox_errors = Counter("outbox_errors_total", "Errores de Graph por clase", ["error"])
+outbox_due = Gauge("outbox_due", "Filas pendientes vencidas en el último sondeo")
+
+# Acuses de lectura diferidos
+receipts_marked = Counter("receipts_marked_total", "Acuses pedidos: nuevos o absorbidos por uno pendiente", ["result"])
@@ -1,17 +1,25 @@
+import asyncio
+from datetime import date
 from fastapi import APIRouter
 from pydantic import BaseModel
 from typing import Dict, Any
-from services.memory import load_slots, merge_slots
+from services.memory_async import load_slots, merge_slots
+from services.archive import conversation
 
 router = APIRouter()
 
 @router.get("/{wa_id}")
-def get_slots(wa_id: str):
-    return load_slots(wa_id)
+async def get_slots(wa_id: str):
+    return await load_slots(wa_id)
 
 class MergeReq(BaseModel):
     data: Dict[str, Any]
 
 @router.put("/{wa_id}")
-def put_slots(wa_id: str, r: MergeReq):
-    return merge_slots(wa_id, r.data or {})
+async def put_slots(wa_id: str, r: MergeReq):
+    return await merge_slots(wa_id, r.data or {})
+
+@router.get("/{wa_id}/history")
+async def history(wa_id: str, since: date | None = None, until: date | None = None):
+    """Conversación completa para auditoría (incluye turnos ya archivados)."""
+    return await asyncio.to_thread(conversation, wa_id, since, until)
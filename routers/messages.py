@@ -1,6 +1,6 @@
 from fastapi import APIRouter
 from pydantic import BaseModel
-from services.whatsapp import send_text
+from services.outbox import outbox
 
 router = APIRouter()
 
@@ -10,5 +10,5 @@ class SendReq(BaseModel):
 
 @router.post("/send")
 async def send(r: SendReq):
-    await send_text(r.to, r.body)
-    return {"ok": True}
+    sent = await outbox.send(r.to, r.body, log=False)
+    return {"ok": True, "sent": sent}      # sent=False: quedó en el outbox para reintento
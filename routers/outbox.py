@@ -0,0 +1,15 @@
+from fastapi import APIRouter, HTTPException
+from services.backend import backend
+
+router = APIRouter()
+
+@router.get("/dead")
+async def dead_letters(limit: int = 100):
+    """Envíos que fallaron de forma permanente o agotaron reintentos (vista outbox_dead)."""
+    return await backend().outbox_dead(limit)
+
+@router.post("/dead/{id}/retry")
+async def retry(id: int):
+    if not await backend().outbox_requeue(id):
+        raise HTTPException(404, "not in dead-letter")
+    return {"ok": True}
@@ -1,18 +1,32 @@
 from fastapi import APIRouter
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from services.overrides import pending, submit_human
+from services.overrides import handoffs
+from services.broker import console, frame
 
 router = APIRouter()
 
 @router.get("/pending")
-def list_pending():
-    return pending()
+async def list_pending():
+    return await handoffs.pending()
 
 class OverrideReq(BaseModel):
     wa_id: str
     text: str
 
 @router.post("/reply")
-def reply(r: OverrideReq):
-    ok = submit_human(r.wa_id, r.text)
+async def reply(r: OverrideReq):
+    ok = await handoffs.submit(r.wa_id, r.text)
     return {"ok": ok}
+
+@router.get("/stream")
+async def stream():
+    """SSE para consolas: escalamientos, turnos de conversaciones escaladas y cuenta regresiva."""
+    sub = console.subscribe()
+    try:
+        first = frame("pending", await handoffs.pending())
+    except Exception:
+        console.unsubscribe(sub)
+        raise
+    return StreamingResponse(console.stream(sub, first), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
@@ -1,15 +1,63 @@
 import os 
 from fastapi import APIRouter, Query, Request, HTTPException
 from fastapi.responses import PlainTextResponse
-import hmac, hashlib, re, time
+import asyncio, hmac, hashlib, json, re, time
+from contextlib import asynccontextmanager
 from core.config import settings
 from services.dedupe import dedupe
-from services.whatsapp import send_text, mark_as_read
-from services.memory import load_slots, merge_slots, log_turn, recent_dialog
-from services.policy import quick_intent_router, grounding
-from services.agent import infer_json
-
-router = APIRouter(tags=["webhook"])
+from services.ingest import ingest
+from services.lanes import lanes
+from services.coalesce import Coalescer
+from services import http_clients
+from services.backend import backend, close_backend
+from services.loop_lag import watch as watch_loop_lag
+from services.archive import run_periodically as archive_periodically
+from services.overrides import handoffs
+from services.broker import console
+from services.outbox import outbox
+from services.receipts import receipts
+from services.memory_async import load_slots, merge_slots, log_turn, dialog_context
+from services.summaries import summarizer
+from services.policy import quick_intent_router, grounding, deflect, load_classifier
+from services.agent import infer_json, infer_json_stream
+from services.prompt import load_encoder
+from services.kb import knowledge
+from monitoring import first_message
+
+@asynccontextmanager
+async def lifespan(app):
+    await backend().start()
+    await dedupe.start()
+    await http_clients.start()
+    await asyncio.to_thread(knowledge.current)      # artefacto mmap / índice antes del primer turno
+    await asyncio.to_thread(load_classifier)
+    await outbox.start()
+    await receipts.start()
+    await ingest.start(handle_message)
+    await handoffs.start(_deliver_human)
+    bg = [asyncio.create_task(watch_loop_lag(settings.LOOP_LAG_INTERVAL)),
+          asyncio.create_task(dedupe.purge_forever(settings.DEDUPE_PURGE_SECONDS)),
+          asyncio.create_task(console.tick_forever(settings.CONSOLE_TICK_SECONDS, handoffs.pending)),
+          asyncio.create_task(asyncio.to_thread(load_encoder))]     # tiktoken sin bloquear el arranque
+    if settings.ARCHIVE_EVERY_HOURS > 0:
+        bg.append(asyncio.create_task(archive_periodically(settings.ARCHIVE_EVERY_HOURS)))
+    yield
+    for t in bg:
+        t.cancel()
+    # lo que no alcance a procesarse ya se marcó visto y se contestó 200: liberar su wamid
+    # para que el reintento de Meta no se descarte como duplicado
+    for _, msg in await ingest.stop(settings.INGEST_DRAIN_SECONDS):
+        await dedupe.discard(msg.get("id"))
+    await lanes.drain(settings.INGEST_DRAIN_SECONDS)
+    await burst.drain()
+    await handoffs.stop()
+    await summarizer.drain()
+    await receipts.stop(settings.OUTBOUND_DRAIN_SECONDS)
+    await outbox.stop(settings.OUTBOUND_DRAIN_SECONDS)
+    await http_clients.close()
+    await close_backend()
+
+router = APIRouter(tags=["webhook"], lifespan=lifespan)
 
 VERIFY_TOKEN = os.getenv("MI_VERIFY_TOKEN", "MI_TOKEN_SEGURO")
 
@@ -50,10 +98,12 @@ async def receive(request: Request):
     if not _verify_sig(request, body):
         raise HTTPException(403, "bad signature")
 
-    data = await request.json()
+    data = json.loads(body or b"{}")
     if data.get("object") != "whatsapp_business_account":
         return {"ok": True}
 
+    # solo encolar: el trabajo pesado (LLM, envíos) lo hacen los workers de ingesta
+    rejected = 0
     for entry in data.get("entry", []):
         for change in entry.get("changes", []):
             value = change.get("value", {})
@@ -64,62 +114,140 @@ async def receive(request: Request):
 
             for msg in value.get("messages", []):
                 wamid = msg.get("id")
-                if not dedupe.add_if_new(wamid):
-                    continue
-
-                wa_id = msg.get("from")
-                text = None
-                if msg.get("type") == "text":
-                    text = (msg.get("text") or {}).get("body")
-                elif msg.get("type") == "interactive":
-                    inter = msg.get("interactive") or {}
-                    btn = (inter.get("button_reply") or {})
-                    lst = (inter.get("list_reply") or {})
-                    text = btn.get("title") or lst.get("title") or btn.get("id") or lst.get("id")
-
-                slots = load_slots(wa_id)
-
-                # 1) toma nombre del perfil si no existe
-                if not slots.get("contact_name"):
-                    profile = ((value.get("contacts") or [{}])[0].get("profile") or {})
-                    pname = profile.get("name")
-                    if pname:
-                        toks = re.findall(r"[A-Za-zÁÉÍÓÚÜÑáéíóúüñ]+", pname)
-                        if toks:
-                            merge_slots(wa_id, {"contact_name": toks[0].capitalize()})
-
-                # 2) sin texto → ack amable
-                if not text:
-                    await send_text(wa_id, "Recibí tu mensaje 🙌 ¿Quieres que te pase costos o requisitos?")
-                    continue
-
-                log_turn(wa_id, "user", text)
-
-                # 3) router determinista
-                routed = quick_intent_router(wa_id, text)
-                if routed:
-                    reply = grounding(routed)
-                    await send_text(wa_id, reply)
-                    log_turn(wa_id, "assistant", reply)
+                if not await dedupe.add_if_new(wamid):
                     continue
+                if not ingest.offer((value, msg)):
+                    # cola llena: que Meta reintente este wamid más tarde
+                    await dedupe.discard(wamid)
+                    rejected += 1
 
-                # 4) IA principal (JSON validado)
-                dialog = recent_dialog(wa_id, limit=10)
-                out = await infer_json(wa_id, text, slots, dialog)
-
-                # 5) enviar y persistir
-                await send_text(wa_id, out.reply or "Listo ✅")
-                log_turn(wa_id, "assistant", out.reply or "Listo ✅")
-
-                if out.followups:
-                    await send_text(wa_id, out.followups[0])
-                    log_turn(wa_id, "assistant", out.followups[0])
-
-                if out.slots:
-                    merge_slots(wa_id, out.slots)
-
-                mid = msg.get("id")
-                if mid:
-                    await mark_as_read(mid)
-
+    if rejected:
+        raise HTTPException(503, "ingest queue full")
     return {"ok": True}
+
+async def handle_message(item):
+    value, msg = item
+    # un solo turno a la vez por wa_id, en orden de llegada; el worker de ingesta sólo encola
+    # en la fila del wa_id y sigue con el siguiente mensaje. El mensaje cuenta contra la cola de
+    # ingesta hasta que su turno termina.
+    return lanes.submit(msg.get("from"), lambda: _handle(value, msg),
+                        dropped=lambda: dedupe.discard(msg.get("id")))
+
+async def _handle(value, msg):
+    wa_id = msg.get("from")
+    text = None
+    if msg.get("type") == "text":
+        text = (msg.get("text") or {}).get("body")
+    elif msg.get("type") == "interactive":
+        inter = msg.get("interactive") or {}
+        btn = (inter.get("button_reply") or {})
+        lst = (inter.get("list_reply") or {})
+        text = btn.get("title") or lst.get("title") or btn.get("id") or lst.get("id")
+    # acuse diferido: no espera a Graph y en una ráfaga sólo sale el del último mensaje
+    receipts.mark(wa_id, msg.get("id"))
+
+    slots = await load_slots(wa_id)
+
+    # 1) toma nombre del perfil si no existe
+    if not slots.get("contact_name"):
+        profile = ((value.get("contacts") or [{}])[0].get("profile") or {})
+        pname = profile.get("name")
+        if pname:
+            toks = re.findall(r"[A-Za-zÁÉÍÓÚÜÑáéíóúüñ]+", pname)
+            if toks:
+                await merge_slots(wa_id, {"contact_name": toks[0].capitalize()})
+
+    # 2) sin texto → ack amable
+    if not text:
+        await outbox.send(wa_id, "Recibí tu mensaje 🙌 ¿Quieres que te pase costos o requisitos?",
+                          f"{msg['id']}:ack" if msg.get("id") else None, log=False)
+        return
+
+    await log_turn(wa_id, "user", text)
+    if slots.get("stage") == "escalado":
+        # contexto en vivo para el agente que atiende la conversación
+        console.publish("turn", {"wa_id": wa_id, "role": "user", "text": text, "ts": int(time.time())})
+
+    if settings.DEBOUNCE_SECONDS > 0:
+        burst.add(wa_id, (text, msg.get("id")))
+        return
+    await _turn(wa_id, text, [msg.get("id")])
+
+async def _flush_burst(wa_id: str, items):
+    async with lanes.hold(wa_id):
+        await _turn(wa_id, "\n".join(t for t, _ in items), [mid for _, mid in items])
+
+burst = Coalescer(settings.DEBOUNCE_SECONDS, settings.DEBOUNCE_MAX_SECONDS, _flush_burst)
+
+async def _turn(wa_id: str, text: str, wamids):
+    """Un turno de respuesta; `text` puede traer varios mensajes del usuario ya registrados.
+    Cada envío lleva llave "<último wamid>:<parte>" en el outbox: si el turno se reprocesa, lo ya
+    registrado no se vuelve a mandar. La respuesta queda en messages al encolarse, en orden."""
+    t0 = time.monotonic()
+    slots = await load_slots(wa_id)
+    mid = next((m for m in reversed(wamids) if m), None)
+    key = lambda part: f"{mid}:{part}" if mid else None
+
+    # 3) router determinista; si no matchea, el clasificador local con umbral de confianza
+    routed = quick_intent_router(wa_id, text) or deflect(text)
+    if routed:
+        reply = grounding(routed)
+        await outbox.send(wa_id, reply, key("r"))
+        first_message.labels("router").observe(time.monotonic() - t0)
+        summarizer.note(wa_id, len(wamids) + 1)
+        return
+
+    mode = "stream" if settings.LLM_STREAM else "full"
+    first_new = False       # False si el turno se reprocesa y la primera parte ya estaba registrada
+    async def send_first(part: str, delay: float = 0.0, part_key: str = "r0", log: bool = False):
+        nonlocal first_new
+        fut = await outbox.put(wa_id, part, key(part_key), delay, log=log)
+        first_new = fut is not None
+        if fut is not None:
+            await fut
+        first_message.labels(mode).observe(time.monotonic() - t0)
+
+    if settings.TYPING_INDICATOR:
+        receipts.mark(wa_id, mid, typing=True)      # "escribiendo…" mientras piensa la IA
+
+    # 4) IA principal (JSON validado); en stream la primera oración ya sale aquí.
+    # Con resumen va todo lo que éste aún no cubre; el presupuesto de tokens recorta.
+    summary, dialog = await dialog_context(wa_id, 10, settings.SUMMARY_TAIL_MAX)
+    if settings.LLM_STREAM:
+        out, early = await infer_json_stream(wa_id, text, slots, dialog, send_first,
+                                             settings.STREAM_FIRST_MIN_CHARS, summary=summary)
+    else:
+        out, early = await infer_json(wa_id, text, slots, dialog, summary=summary), None
+
+    # 5) enviar lo que falte y persistir la respuesta completa; ask_delay_seconds es un timer
+    # del dispatcher (no bloquea el worker) y el followup sale después, en la misma fila
+    reply = (out.reply or "Listo ✅").strip()
+    delay = min(max(out.ask_delay_seconds, 0), settings.OUTBOUND_MAX_DELAY)
+    if early and reply.startswith(early):
+        rest = reply[len(early):].strip()
+        if rest:
+            await outbox.send(wa_id, rest, key("r1"), delay, log=reply)
+        elif first_new:
+            await log_turn(wa_id, "assistant", reply)      # ya salió completa en el envío temprano
+    else:
+        await send_first(reply, delay, "r", log=True)
+
+    if out.followups:
+        await outbox.put(wa_id, out.followups[0], key("f0"), settings.FOLLOWUP_GAP_SECONDS)
+
+    if out.slots:
+        await merge_slots(wa_id, out.slots)
+
+    # 6) escalar: abre la ventana y sigue; la respuesta llega por /overrides/reply
+    if out.escalate_to_human:
+        await merge_slots(wa_id, {"stage": "escalado"})
+        hold = "Gracias por la info 🙏 Lo reviso con mi supervisor y te escribo en breve."
+        await outbox.send(wa_id, hold, key("hold"))
+        await handoffs.escalate(wa_id)
+
+    # usuario(s) + respuesta; el resumen se rehace aparte cada N turnos
+    summarizer.note(wa_id, len(wamids) + 1)
+
+async def _deliver_human(wa_id: str, text: str, key: str):
+    async with lanes.hold(wa_id):
+        await outbox.send(wa_id, text, key)
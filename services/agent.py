@@ -1,7 +1,14 @@
-import os, json, time, httpx
-from typing import Any, Dict, List
+import asyncio, os, json, time
+import httpx
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 from pydantic import BaseModel, Field, ValidationError
 from core.config import settings
+from services.http_clients import client
+from services.reply_stream import ReplyScanner, first_sentence
+from services.response_cache import ResponseCache, last_assistant, prompt_version
+from services.prompt import build_messages, record_usage
+from services.kb import knowledge
+from services.slots import SLOT_TEMPLATE
 
 class AgentOut(BaseModel):
     reply: str
@@ -13,33 +20,123 @@ class AgentOut(BaseModel):
 
 SYSTEM = """
 Eres asesor de visas (MX). Tono cálido y claro. Máximo 1 pregunta por turno.
-No inventes costos/plazos. Responde SOLO JSON: reply, quick_replies, slots, followups, ask_delay_seconds, escalate_to_human.
+Costos, plazos, proceso y documentos sólo de "Información del KB"; si no viene ahí, no lo inventes.
+Responde SOLO JSON: reply, quick_replies, slots, followups, ask_delay_seconds, escalate_to_human.
 """
 
-async def infer_json(wa_id: str, user_text: str, slots: dict, dialog: list[str]) -> AgentOut:
-    payload = {
+FALLBACK = "¿Te comparto costos, proceso o documentos?"
+
+replies = ResponseCache("llm", settings.RESPONSE_CACHE_SIZE, settings.RESPONSE_CACHE_TTL,
+                        prompt_version(SYSTEM, settings.OPENAI_MODEL), settings.RESPONSE_CACHE_MAX_CHARS)
+
+PREFIX = [{"role": "system", "content": SYSTEM}]
+
+def _payload(user_text: str, slots: dict, dialog: list[str], summary: Optional[str] = None) -> Dict[str, Any]:
+    messages, _ = build_messages("llm", PREFIX, slots, SLOT_TEMPLATE, dialog, user_text,
+                                 settings.PROMPT_TOKEN_BUDGET, summary=summary,
+                                 context=knowledge.context(user_text, last_assistant(dialog)))
+    return {
       "model": settings.OPENAI_MODEL,
-      "messages": [
-        {"role":"system","content": SYSTEM},
-        {"role":"system","content": f"Slots: {json.dumps(slots, ensure_ascii=False)}"},
-        {"role":"system","content": "Historial:\n" + "\n".join(dialog)},
-        {"role":"user","content": user_text or ""}
-      ],
+      "messages": messages,
+      # enruta al mismo caché de prompts del proveedor mientras no cambien prompt ni KB
+      "prompt_cache_key": f"llm-{replies.version}-{knowledge.digest()[:12]}",
       "response_format": {"type": "json_object"},
       "temperature": 0.4,
       "max_tokens": 450
     }
-    async with httpx.AsyncClient(timeout=40) as client:
-        r = await client.post(
-            "https://api.openai.com/v1/chat/completions",
-            headers={"Authorization": f"Bearer {settings.OPENAI_API_KEY}",
-                     "Content-Type": "application/json"},
-            json=payload
-        )
-    if r.status_code != 200:
-        return AgentOut(reply="¿Te comparto costos, proceso o documentos?")
+
+def _parse(content: str) -> Optional[AgentOut]:
     try:
-        content = r.json()["choices"][0]["message"]["content"]
         return AgentOut.model_validate(json.loads(content))
-    except (KeyError, ValidationError, json.JSONDecodeError):
-        return AgentOut(reply="¿Te comparto costos, proceso o documentos?")
+    except (ValidationError, json.JSONDecodeError):
+        return None
+
+def _cached(key: Optional[str]) -> Optional[AgentOut]:
+    hit = replies.get(key)
+    return AgentOut.model_validate(hit) if hit else None
+
+def _remember(key: Optional[str], out: Optional[AgentOut], tokens: int, slots: dict) -> AgentOut:
+    if out is None:
+        return AgentOut(reply=FALLBACK)
+    replies.put(key, out.model_dump(), tokens, slots.get("contact_name"))
+    return out
+
+async def infer_json(wa_id: str, user_text: str, slots: dict, dialog: list[str],
+                     summary: Optional[str] = None) -> AgentOut:
+    key = replies.key(user_text, slots, knowledge.digest(), last_assistant(dialog))
+    hit = _cached(key)
+    if hit:
+        return hit
+    r = await client("openai").post("/chat/completions", json=_payload(user_text, slots, dialog, summary))
+    if r.status_code != 200:
+        return AgentOut(reply=FALLBACK)
+    try:
+        body = r.json()
+        out = _parse(body["choices"][0]["message"]["content"])
+    except (KeyError, IndexError, json.JSONDecodeError):
+        return AgentOut(reply=FALLBACK)
+    usage = body.get("usage") or {}
+    record_usage("llm", usage)
+    return _remember(key, out, usage.get("total_tokens", 0), slots)
+
+async def infer_json_stream(wa_id: str, user_text: str, slots: dict, dialog: list[str],
+                            on_first: Callable[[str], Awaitable[Any]],
+                            min_chars: int = 0, summary: Optional[str] = None) -> Tuple[AgentOut, Optional[str]]:
+    """Como infer_json pero con stream=True: en cuanto `reply` trae una oración completa se
+    manda con on_first (en paralelo, el stream sigue leyéndose). Devuelve (out, enviado) donde
+    `enviado` es el texto ya mandado o None; slots/followups se aplican con `out` al final.
+    Si algo falla después del envío temprano no se manda FALLBACK encima: `out.reply` es la
+    respuesta hasta donde se alcanzó a leer (como mínimo lo ya enviado).
+    Un hit de caché regresa de inmediato sin envío temprano."""
+    key = replies.key(user_text, slots, knowledge.digest(), last_assistant(dialog))
+    hit = _cached(key)
+    if hit:
+        return hit, None
+    payload = {**_payload(user_text, slots, dialog, summary), "stream": True, "stream_options": {"include_usage": True}}
+    scanner, parts, tokens = ReplyScanner(), [], 0
+    sent: Optional[str] = None
+    task: Optional[asyncio.Task] = None
+    ok = False
+    try:
+        async with client("openai").stream("POST", "/chat/completions", json=payload) as r:
+            if r.status_code != 200:
+                await r.aread()
+                return AgentOut(reply=FALLBACK), None
+            async for line in r.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                chunk = json.loads(data)
+                if chunk.get("usage"):
+                    record_usage("llm", chunk["usage"])
+                    tokens = chunk["usage"].get("total_tokens", 0)
+                delta = ((chunk.get("choices") or [{}])[0].get("delta") or {}).get("content")
+                if not delta:
+                    continue
+                parts.append(delta)
+                if not scanner.done:
+                    scanner.feed(delta)     # se sigue leyendo `reply` por si el JSON final falla
+                    first = first_sentence(scanner.text, min_chars) if sent is None else None
+                    if first:
+                        sent = first
+                        task = asyncio.create_task(on_first(first))
+        ok = True
+    except (httpx.HTTPError, json.JSONDecodeError) as e:
+        print("ERROR stream LLM:", repr(e))
+    finally:
+        if task is not None:
+            try:
+                await task
+            except Exception as e:
+                print("ERROR early send:", repr(e))
+                sent = None     # no salió: que se mande la respuesta completa
+    out = _parse("".join(parts)) if ok else None
+    if out is None and sent is not None:
+        # ya salió la primera oración: completar con lo que se decodificó de `reply`, nada más
+        text = scanner.text.strip()
+        return AgentOut(reply=text if scanner.done and text.startswith(sent) else sent), sent
+    if not ok:
+        return AgentOut(reply=FALLBACK), sent
+    return _remember(key, out, tokens, slots), sent
@@ -1,6 +1,7 @@
 # services/ai_seller.py
 from openai import OpenAI
 from core.config import settings
+from services.kb import knowledge
 
 client = OpenAI()  # usa OPENAI_API_KEY del .env
 CONVO: dict[str, list[dict]] = {}       # memoria corta por número (10 turnos)
@@ -13,14 +14,13 @@ PROMPT = (
     "'Permíteme para poder escucharlo'. Flujo de calificación: visa/relación; ubicación; "
     "si trabajan en la misma empresa; tiempo laborando; ingreso mensual; propiedades/vehículos; "
     "deudas; hijos; historial migratorio/visa previa; problemas legales. "
-    "Para visa B1/B2: MRV ≈ 185 USD (sujeto a cambio), trámite base $1,500 MXN; "
-    "con 'adelanto de cita' $5,000 MXN el trámite baja a $1,000 MXN; tiempos con adelanto ~4–6 meses. "
+    "Para visa B1/B2 usa sólo estos datos: {pricing} {tiempos} "
     "Siempre cierra ofreciendo acompañamiento y seguimiento, y deja una sola pregunta."
 )
 
 def ai_reply(user_id: str, text: str) -> str:
     hist = CONVO.get(user_id, [])
-    msgs = [{"role": "system", "content": PROMPT}, *hist, {"role": "user", "content": text}]
+    msgs = [{"role": "system", "content": PROMPT.format(**knowledge.texts())}, *hist, {"role": "user", "content": text}]
 
     try:
         r = client.chat.completions.create(
@@ -0,0 +1,147 @@
+"""Archivo frío de `messages`: mueve turnos viejos a JSONL.gz por día y los borra de la tabla
+caliente. Uso:
+
+    python -m services.archive compact [--db agent.db] [--older-than-days 30]
+    python -m services.archive read WA_ID [--since 2025-01-01] [--until 2025-02-01]
+"""
+import argparse, asyncio, gzip, json, os, time
+from datetime import date, datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from core.config import settings
+from services import memory
+from services.db import Store, get_store
+from services.migrations import migrate
+from monitoring import archive_rows, archive_run
+
+# candidatos: más viejos que el corte y fuera de los últimos `keep` turnos de su wa_id
+_SELECT = """
+SELECT id, wa_id, role, text, ts FROM messages
+WHERE ts < ? AND id < COALESCE((
+    SELECT m2.id FROM messages m2 WHERE m2.wa_id = messages.wa_id
+    ORDER BY m2.id DESC LIMIT 1 OFFSET ?), 0)
+ORDER BY id LIMIT ?
+"""
+
+def _day(ts: int) -> date:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).date()
+
+def _partition(root: str, d: date) -> str:
+    return os.path.join(root, f"{d:%Y}", f"{d:%m}", f"messages-{d:%Y-%m-%d}.jsonl.gz")
+
+def _append(path: str, rows: List[Dict[str, Any]]):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # cada corrida agrega un miembro gzip nuevo; gzip los lee como un solo stream
+    with open(path, "ab") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="ab") as gz:
+            for r in rows:
+                gz.write((json.dumps(r, ensure_ascii=False) + "\n").encode())
+        raw.flush()
+        os.fsync(raw.fileno())
+
+def compact(store: Store, archive_dir: str, older_than_days: float,
+            keep_last: int = 20, batch: int = 5000,
+            forget: Optional[Callable[[str], None]] = None) -> Dict[str, int]:
+    """Archiva y borra por lotes. Primero se escribe (fsync) el archivo y luego se borra,
+    así que una caída a la mitad sólo puede duplicar filas en el archivo, nunca perderlas.
+    `forget(wa_id)` se llama por cada wa_id con turnos borrados (buffer de diálogo en memoria)."""
+    t0 = time.monotonic()
+    cutoff = int(time.time() - older_than_days * 86400)
+    moved = 0
+    while True:
+        rows = store.query(_SELECT, (cutoff, max(keep_last, 1) - 1, batch)) if keep_last > 0 else \
+            store.query("SELECT id, wa_id, role, text, ts FROM messages WHERE ts < ? ORDER BY id LIMIT ?",
+                        (cutoff, batch))
+        if not rows:
+            break
+        by_day: Dict[date, List[Dict[str, Any]]] = {}
+        for id_, wa_id, role, text, ts in rows:
+            by_day.setdefault(_day(ts), []).append(
+                {"id": id_, "wa_id": wa_id, "role": role, "text": text, "ts": ts})
+        for d, part in by_day.items():
+            _append(_partition(archive_dir, d), part)
+        ids = [(r[0],) for r in rows]
+        store.execute(lambda con: con.executemany("DELETE FROM messages WHERE id=?", ids))
+        if forget:
+            for wa_id in {r[1] for r in rows}:
+                forget(wa_id)
+        moved += len(rows)
+        archive_rows.inc(len(rows))
+        if len(rows) < batch:
+            break
+    # recorta el WAL para que no crezca con los DELETE; las páginas libres se reusan
+    busy, wal_pages, _ = store.one("PRAGMA wal_checkpoint(TRUNCATE)")
+    archive_run.observe(time.monotonic() - t0)
+    return {"moved": moved, "checkpoint_busy": busy, "wal_pages": wal_pages}
+
+def _days(archive_dir: str, since: Optional[date], until: Optional[date]) -> Iterator[str]:
+    for dirpath, _, files in os.walk(archive_dir):
+        for f in files:
+            if not (f.startswith("messages-") and f.endswith(".jsonl.gz")):
+                continue
+            d = date.fromisoformat(f[len("messages-"):-len(".jsonl.gz")])
+            if (since and d < since) or (until and d > until):
+                continue
+            yield os.path.join(dirpath, f)
+
+def read_archived(wa_id: str, archive_dir: Optional[str] = None,
+                  since: Optional[date] = None, until: Optional[date] = None) -> List[Dict[str, Any]]:
+    """Turnos archivados de un wa_id (para auditoría), ordenados por id y sin duplicados."""
+    seen: Dict[int, Dict[str, Any]] = {}
+    for path in _days(archive_dir or settings.ARCHIVE_DIR, since, until):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                r = json.loads(line)
+                if r["wa_id"] == wa_id:
+                    seen[r["id"]] = r
+    return [seen[k] for k in sorted(seen)]
+
+def conversation(wa_id: str, since: Optional[date] = None, until: Optional[date] = None,
+                 store: Optional[Store] = None) -> List[Dict[str, Any]]:
+    """Conversación completa: archivo frío + tabla caliente."""
+    rows = read_archived(wa_id, settings.ARCHIVE_DIR, since, until)
+    store = store or get_store(settings.DB_PATH)
+    hot = store.query("SELECT id, wa_id, role, text, ts FROM messages WHERE wa_id=? ORDER BY id", (wa_id,))
+    last = rows[-1]["id"] if rows else 0
+    for id_, w, role, text, ts in hot:
+        d = _day(ts)
+        if id_ > last and not ((since and d < since) or (until and d > until)):
+            rows.append({"id": id_, "wa_id": w, "role": role, "text": text, "ts": ts})
+    return rows
+
+async def run_periodically(every_hours: float):
+    """Tarea de fondo para el lifespan: compacta settings.DB_PATH cada `every_hours`."""
+    while True:
+        await asyncio.sleep(every_hours * 3600)
+        try:
+            res = await asyncio.to_thread(compact, get_store(settings.DB_PATH), settings.ARCHIVE_DIR,
+                                          settings.ARCHIVE_AFTER_DAYS, settings.ARCHIVE_KEEP_LAST,
+                                          forget=memory.forget_turn)
+            print("archive:", res)
+        except Exception as e:
+            print("ERROR archive:", repr(e))
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m services.archive")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    c = sub.add_parser("compact", help="mueve turnos viejos al archivo")
+    c.add_argument("--db", default=settings.DB_PATH)
+    c.add_argument("--dir", default=settings.ARCHIVE_DIR)
+    c.add_argument("--older-than-days", type=float, default=settings.ARCHIVE_AFTER_DAYS)
+    c.add_argument("--keep-last", type=int, default=settings.ARCHIVE_KEEP_LAST)
+    r = sub.add_parser("read", help="imprime turnos archivados de un wa_id")
+    r.add_argument("wa_id")
+    r.add_argument("--dir", default=settings.ARCHIVE_DIR)
+    r.add_argument("--since", type=date.fromisoformat)
+    r.add_argument("--until", type=date.fromisoformat)
+    a = ap.parse_args(argv)
+
+    if a.cmd == "compact":
+        store = get_store(a.db)
+        migrate(store)
+        print(json.dumps(compact(store, a.dir, a.older_than_days, a.keep_last)))
+    else:
+        for row in read_archived(a.wa_id, a.dir, a.since, a.until):
+            print(json.dumps(row, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Tuple
+from core.config import settings
+
+class Backend(ABC):
+    """Estado compartido del bot: slots, mensajes, dedupe y ventanas de override.
+    Implementaciones: SQLite (un nodo) y Postgres (varios workers/hosts)."""
+    async def start(self): ...
+    async def close(self): ...
+
+    # slots / mensajes
+    @abstractmethod
+    async def load_slots(self, wa_id: str) -> Dict[str, Any]: ...
+    @abstractmethod
+    async def merge_slots(self, wa_id: str, new: Dict[str, Any]) -> Dict[str, Any]: ...
+    @abstractmethod
+    async def log_turn(self, wa_id: str, role: str, text: str): ...
+    @abstractmethod
+    async def recent_dialog(self, wa_id: str, limit: int = 10) -> List[str]: ...
+
+    # resúmenes acumulados por conversación
+    @abstractmethod
+    async def load_summary(self, wa_id: str) -> Optional[Tuple[str, int]]:
+        """(texto, último messages.id cubierto) o None si aún no hay resumen."""
+    @abstractmethod
+    async def save_summary(self, wa_id: str, text: str, upto_id: int): ...
+    @abstractmethod
+    async def dialog_after(self, wa_id: str, after_id: int, limit: int) -> List[Tuple[int, str]]:
+        """Turnos (id, "rol: texto") posteriores a `after_id`, del más viejo al más nuevo."""
+
+    # dedupe de webhooks
+    @abstractmethod
+    async def dedupe_add_if_new(self, key: str, ttl: float) -> bool:
+        """True si `key` no se había visto (o ya expiró); la registra por `ttl` segundos."""
+    @abstractmethod
+    async def dedupe_discard(self, key: str): ...
+    @abstractmethod
+    async def dedupe_purge(self) -> int:
+        """Borra llaves expiradas; devuelve cuántas quedan."""
+    @abstractmethod
+    async def dedupe_recent(self, expires_after: float, limit: int) -> List[str]:
+        """Llaves que vencen después de `expires_after` (las registradas recientemente)."""
+
+    # ventanas de respuesta humana
+    @abstractmethod
+    async def override_open(self, wa_id: str, ttl: float): ...
+    @abstractmethod
+    async def override_submit(self, wa_id: str, text: str) -> bool:
+        """Deja la respuesta del humano si la ventana sigue abierta; False si no hay/expiró."""
+    @abstractmethod
+    async def override_reply(self, wa_id: str) -> Optional[Tuple[str, float]]:
+        """(respuesta, expires_at) si ya contestaron, sin cerrar la ventana."""
+    @abstractmethod
+    async def override_take(self, wa_id: str) -> Optional[str]:
+        """Saca (y cierra) la respuesta entregada, si ya hay una."""
+    @abstractmethod
+    async def override_cancel(self, wa_id: str): ...
+    @abstractmethod
+    async def override_expire(self, wa_id: str) -> bool:
+        """Cierra la ventana sólo si venció sin respuesta; False si se renovó o ya contestaron."""
+    @abstractmethod
+    async def override_load(self) -> List[Tuple[str, float, Optional[str]]]:
+        """Todas las ventanas guardadas (wa_id, expires_at, reply), para retomarlas al arrancar."""
+    @abstractmethod
+    async def override_pending(self) -> Dict[str, int]: ...
+
+    # outbox de envíos (durable, idempotente por `key`)
+    @abstractmethod
+    async def outbox_put(self, key: str, wa_id: str, kind: str, body: str,
+                         log_text: Optional[str], next_at: float) -> Optional[int]:
+        """id de la fila nueva, o None si `key` ya existía (ese envío ya se registró). En la misma
+        transacción registra `log_text` en messages como turno del asistente, para que quede en
+        orden con los mensajes del usuario aunque la entrega se retrase."""
+    @abstractmethod
+    async def outbox_claim(self, id: int, lease: float) -> Optional[Tuple[str, str, int]]:
+        """Toma la fila para enviarla: (kind, body, intentos). None si ya no está pendiente
+        o si un texto anterior al mismo wa_id sigue sin salir (orden FIFO)."""
+    @abstractmethod
+    async def outbox_sent(self, id: int, provider_id: Optional[str]): ...
+    @abstractmethod
+    async def outbox_fail(self, id: int, error: str, retry_at: Optional[float]):
+        """retry_at=None manda la fila a dead-letter y borra su turno de messages (no se entregó);
+        si no, vuelve a pending para esa hora."""
+    @abstractmethod
+    async def outbox_due(self, limit: int) -> List[Tuple[int, str]]:
+        """(id, wa_id) pendientes ya vencidos, en orden, sin los que esperan a un texto anterior
+        (OUTBOX_READY): un wa_id atorado en reintentos no se vuelve a despachar en cada sondeo.
+        Antes recupera leases vencidos."""
+    @abstractmethod
+    async def outbox_dead(self, limit: int = 100) -> List[Dict[str, Any]]: ...
+    @abstractmethod
+    async def outbox_requeue(self, id: int) -> bool:
+        """Regresa una fila de dead-letter a pending (reintento manual) y vuelve a registrar su
+        turno en messages, ahora al final de la conversación."""
+    @abstractmethod
+    async def outbox_purge(self, before: float) -> int:
+        """Borra filas enviadas antes de `before`; dead-letter se conserva."""
+
+# Un texto espera a que salgan los textos anteriores al mismo wa_id; los acuses de lectura no
+# llevan orden. OUTBOX_CLAIM toma una fila lista (pending -> sending con lease). SQLite y Postgres.
+OUTBOX_READY = (
+    "NOT (kind='text' AND EXISTS ("
+    "SELECT 1 FROM outbox o WHERE o.wa_id=outbox.wa_id AND o.id<outbox.id "
+    "AND o.kind='text' AND o.status IN ('pending','sending')))")
+OUTBOX_CLAIM = (
+    "UPDATE outbox SET status='sending', next_at={lease}, attempts=attempts+1 "
+    "WHERE id={id} AND status='pending' AND " + OUTBOX_READY + " "
+    "RETURNING kind, body, attempts")
+
+def clean_slots(new: Dict[str, Any], template: Dict[str, Any]) -> Dict[str, Any]:
+    """Mismo filtro que merge_slots: sólo llaves conocidas y valores no vacíos."""
+    return {k: v for k, v in (new or {}).items() if k in template and v not in (None, "", [], {})}
+
+_BACKEND: Optional[Backend] = None
+
+def backend() -> Backend:
+    global _BACKEND
+    if _BACKEND is None:
+        kind = settings.STORAGE_BACKEND
+        if kind == "postgres":
+            from services.backend_pg import PostgresBackend
+            _BACKEND = PostgresBackend(settings.DATABASE_URL, settings.PG_POOL_MIN, settings.PG_POOL_MAX)
+        elif kind == "sqlite":
+            from services.backend_sqlite import SQLiteBackend
+            _BACKEND = SQLiteBackend(settings.DB_PATH)
+        else:
+            raise ValueError(f"STORAGE_BACKEND desconocido: {kind!r}")
+    return _BACKEND
+
+async def close_backend():
+    global _BACKEND
+    if _BACKEND is not None:
+        await _BACKEND.close()
+        _BACKEND = None
@@ -0,0 +1,284 @@
+import json, time
+from typing import Any, Dict, List, Optional, Tuple
+import asyncpg
+from services.backend import Backend, OUTBOX_CLAIM, OUTBOX_READY, clean_slots
+from services.slots import SLOT_TEMPLATE
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS slots (
+  wa_id TEXT PRIMARY KEY,
+  json  JSONB NOT NULL,
+  updated_at BIGINT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+  id BIGSERIAL PRIMARY KEY,
+  wa_id TEXT NOT NULL,
+  role TEXT NOT NULL,
+  text TEXT NOT NULL,
+  ts   BIGINT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_messages_wa_id_id ON messages(wa_id, id);
+CREATE TABLE IF NOT EXISTS dedupe (
+  key TEXT PRIMARY KEY,
+  expires_at DOUBLE PRECISION NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_dedupe_expires ON dedupe(expires_at);
+CREATE TABLE IF NOT EXISTS overrides (
+  wa_id TEXT PRIMARY KEY,
+  expires_at DOUBLE PRECISION NOT NULL,
+  reply TEXT
+);
+CREATE TABLE IF NOT EXISTS summaries (
+  wa_id TEXT PRIMARY KEY,
+  text  TEXT NOT NULL,
+  upto_id BIGINT NOT NULL,
+  updated_at BIGINT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS outbox (
+  id BIGSERIAL PRIMARY KEY,
+  key TEXT NOT NULL UNIQUE,
+  wa_id TEXT NOT NULL,
+  kind TEXT NOT NULL,
+  body TEXT NOT NULL,
+  log_text TEXT,
+  status TEXT NOT NULL,
+  attempts INTEGER NOT NULL DEFAULT 0,
+  next_at DOUBLE PRECISION NOT NULL,
+  last_error TEXT,
+  provider_id TEXT,
+  created_at DOUBLE PRECISION NOT NULL,
+  sent_at DOUBLE PRECISION
+);
+ALTER TABLE outbox ADD COLUMN IF NOT EXISTS msg_id BIGINT;  -- turno en messages; se borra si va a dead-letter
+CREATE INDEX IF NOT EXISTS idx_outbox_status_next ON outbox(status, next_at);
+CREATE INDEX IF NOT EXISTS idx_outbox_wa_id_id ON outbox(wa_id, id);
+CREATE OR REPLACE VIEW outbox_dead AS
+  SELECT id, key, wa_id, kind, body, attempts, last_error, created_at
+  FROM outbox WHERE status = 'dead';
+"""
+
+class PostgresBackend(Backend):
+    """Backend compartido entre workers/hosts. Todas las escrituras son upserts atómicos
+    (ON CONFLICT), así que no hace falta coordinar procesos."""
+    def __init__(self, dsn: str, min_size: int = 2, max_size: int = 20):
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.pool: Optional[asyncpg.Pool] = None
+
+    async def start(self):
+        if self.pool is None:
+            self.pool = await asyncpg.create_pool(self.dsn, min_size=self.min_size, max_size=self.max_size)
+            async with self.pool.acquire() as con:
+                # varios workers arrancan a la vez: serializa el DDL con un advisory lock
+                async with con.transaction():
+                    await con.execute("SELECT pg_advisory_xact_lock(727001)")
+                    await con.execute(SCHEMA)
+
+    async def close(self):
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    async def _pool(self) -> asyncpg.Pool:
+        if self.pool is None:
+            await self.start()
+        return self.pool
+
+    async def load_slots(self, wa_id: str) -> Dict[str, Any]:
+        pool = await self._pool()
+        raw = await pool.fetchval("SELECT json FROM slots WHERE wa_id=$1", wa_id)
+        return {**SLOT_TEMPLATE, **json.loads(raw)} if raw else dict(SLOT_TEMPLATE)
+
+    async def merge_slots(self, wa_id: str, new: Dict[str, Any]) -> Dict[str, Any]:
+        patch = clean_slots(new, SLOT_TEMPLATE)
+        if not patch:
+            return await self.load_slots(wa_id)
+        pool = await self._pool()
+        # el merge lo hace Postgres (jsonb ||) para que dos nodos no se pisen
+        raw = await pool.fetchval(
+            "INSERT INTO slots(wa_id,json,updated_at) VALUES($1,$2::jsonb,$3) "
+            "ON CONFLICT (wa_id) DO UPDATE SET json = slots.json || excluded.json, "
+            "updated_at = excluded.updated_at RETURNING json",
+            wa_id, json.dumps(patch, ensure_ascii=False), int(time.time()))
+        return {**SLOT_TEMPLATE, **json.loads(raw)}
+
+    async def log_turn(self, wa_id: str, role: str, text: str):
+        pool = await self._pool()
+        await pool.execute("INSERT INTO messages(wa_id,role,text,ts) VALUES($1,$2,$3,$4)",
+                           wa_id, role, text, int(time.time()))
+
+    async def recent_dialog(self, wa_id: str, limit: int = 10) -> List[str]:
+        pool = await self._pool()
+        rows = await pool.fetch(
+            "SELECT role||': '||text AS line FROM messages WHERE wa_id=$1 ORDER BY id DESC LIMIT $2",
+            wa_id, limit)
+        return [r["line"] for r in reversed(rows)]
+
+    async def load_summary(self, wa_id: str) -> Optional[Tuple[str, int]]:
+        pool = await self._pool()
+        row = await pool.fetchrow("SELECT text, upto_id FROM summaries WHERE wa_id=$1", wa_id)
+        return (row["text"], row["upto_id"]) if row else None
+
+    async def save_summary(self, wa_id: str, text: str, upto_id: int):
+        pool = await self._pool()
+        # nunca retroceder: si otro worker ya resumió más adelante, se queda el suyo
+        await pool.execute(
+            "INSERT INTO summaries(wa_id,text,upto_id,updated_at) VALUES($1,$2,$3,$4) "
+            "ON CONFLICT (wa_id) DO UPDATE SET text = excluded.text, upto_id = excluded.upto_id, "
+            "updated_at = excluded.updated_at WHERE excluded.upto_id > summaries.upto_id",
+            wa_id, text, upto_id, int(time.time()))
+
+    async def dialog_after(self, wa_id: str, after_id: int, limit: int) -> List[Tuple[int, str]]:
+        pool = await self._pool()
+        rows = await pool.fetch(
+            "SELECT id, role||': '||text AS line FROM messages WHERE wa_id=$1 AND id>$2 ORDER BY id LIMIT $3",
+            wa_id, after_id, limit)
+        return [(r["id"], r["line"]) for r in rows]
+
+    async def dedupe_add_if_new(self, key: str, ttl: float) -> bool:
+        pool = await self._pool()
+        now = time.time()
+        hit = await pool.fetchval(
+            "INSERT INTO dedupe(key,expires_at) VALUES($1,$2) "
+            "ON CONFLICT (key) DO UPDATE SET expires_at = excluded.expires_at "
+            "WHERE dedupe.expires_at < $3 RETURNING 1",
+            key, now + ttl, now)
+        return hit is not None
+
+    async def dedupe_discard(self, key: str):
+        pool = await self._pool()
+        await pool.execute("DELETE FROM dedupe WHERE key=$1", key)
+
+    async def dedupe_purge(self) -> int:
+        pool = await self._pool()
+        await pool.execute("DELETE FROM dedupe WHERE expires_at < $1", time.time())
+        return await pool.fetchval("SELECT COUNT(*) FROM dedupe")
+
+    async def dedupe_recent(self, expires_after: float, limit: int) -> List[str]:
+        pool = await self._pool()
+        rows = await pool.fetch("SELECT key FROM dedupe WHERE expires_at > $1 LIMIT $2", expires_after, limit)
+        return [r["key"] for r in rows]
+
+    async def override_open(self, wa_id: str, ttl: float):
+        pool = await self._pool()
+        await pool.execute(
+            "INSERT INTO overrides(wa_id,expires_at,reply) VALUES($1,$2,NULL) "
+            "ON CONFLICT (wa_id) DO UPDATE SET expires_at = excluded.expires_at, reply = NULL",
+            wa_id, time.time() + ttl)
+
+    async def override_submit(self, wa_id: str, text: str) -> bool:
+        pool = await self._pool()
+        res = await pool.execute(
+            "UPDATE overrides SET reply=$1 WHERE wa_id=$2 AND reply IS NULL AND expires_at > $3",
+            text, wa_id, time.time())
+        return res == "UPDATE 1"
+
+    async def override_reply(self, wa_id: str) -> Optional[Tuple[str, float]]:
+        pool = await self._pool()
+        row = await pool.fetchrow(
+            "SELECT reply, expires_at FROM overrides WHERE wa_id=$1 AND reply IS NOT NULL", wa_id)
+        return (row["reply"], row["expires_at"]) if row else None
+
+    async def override_take(self, wa_id: str) -> Optional[str]:
+        pool = await self._pool()
+        return await pool.fetchval(
+            "DELETE FROM overrides WHERE wa_id=$1 AND reply IS NOT NULL RETURNING reply", wa_id)
+
+    async def override_cancel(self, wa_id: str):
+        pool = await self._pool()
+        await pool.execute("DELETE FROM overrides WHERE wa_id=$1", wa_id)
+
+    async def override_pending(self) -> Dict[str, int]:
+        pool = await self._pool()
+        now = time.time()
+        rows = await pool.fetch(
+            "SELECT wa_id, expires_at FROM overrides WHERE reply IS NULL AND expires_at > $1", now)
+        return {r["wa_id"]: int(r["expires_at"] - now) for r in rows}
+
+    async def override_expire(self, wa_id: str) -> bool:
+        pool = await self._pool()
+        res = await pool.execute(
+            "DELETE FROM overrides WHERE wa_id=$1 AND reply IS NULL AND expires_at <= $2",
+            wa_id, time.time())
+        return res == "DELETE 1"
+
+    async def override_load(self) -> List[Tuple[str, float, Optional[str]]]:
+        pool = await self._pool()
+        rows = await pool.fetch("SELECT wa_id, expires_at, reply FROM overrides")
+        return [(r["wa_id"], r["expires_at"], r["reply"]) for r in rows]
+
+    async def outbox_put(self, key: str, wa_id: str, kind: str, body: str,
+                         log_text: Optional[str], next_at: float) -> Optional[int]:
+        pool = await self._pool()
+        async with pool.acquire() as con:
+            async with con.transaction():
+                id = await con.fetchval(
+                    "INSERT INTO outbox(key,wa_id,kind,body,log_text,status,next_at,created_at) "
+                    "VALUES($1,$2,$3,$4,$5,'pending',$6,$7) ON CONFLICT (key) DO NOTHING RETURNING id",
+                    key, wa_id, kind, body, log_text, next_at, time.time())
+                if id is not None and log_text:
+                    await con.execute(
+                        "WITH m AS (INSERT INTO messages(wa_id,role,text,ts) VALUES($1,'assistant',$2,$3) "
+                        "RETURNING id) UPDATE outbox SET msg_id=(SELECT id FROM m) WHERE id=$4",
+                        wa_id, log_text, int(time.time()), id)
+                return id
+
+    async def outbox_claim(self, id: int, lease: float) -> Optional[Tuple[str, str, int]]:
+        pool = await self._pool()
+        row = await pool.fetchrow(OUTBOX_CLAIM.format(lease="$1", id="$2"), time.time() + lease, id)
+        return (row["kind"], row["body"], row["attempts"]) if row else None
+
+    async def outbox_sent(self, id: int, provider_id: Optional[str]):
+        pool = await self._pool()
+        await pool.execute(
+            "UPDATE outbox SET status='sent', provider_id=$1, sent_at=$2, last_error=NULL WHERE id=$3",
+            provider_id, time.time(), id)
+
+    async def outbox_fail(self, id: int, error: str, retry_at: Optional[float]):
+        pool = await self._pool()
+        if retry_at is None:
+            async with pool.acquire() as con:
+                async with con.transaction():
+                    msg_id = await con.fetchval("SELECT msg_id FROM outbox WHERE id=$1 FOR UPDATE", id)
+                    await con.execute("UPDATE outbox SET status='dead', last_error=$1, msg_id=NULL WHERE id=$2",
+                                      error, id)
+                    if msg_id is not None:
+                        await con.execute("DELETE FROM messages WHERE id=$1", msg_id)
+        else:
+            await pool.execute("UPDATE outbox SET status='pending', next_at=$1, last_error=$2 WHERE id=$3",
+                               retry_at, error, id)
+
+    async def outbox_due(self, limit: int) -> List[Tuple[int, str]]:
+        pool = await self._pool()
+        now = time.time()
+        await pool.execute("UPDATE outbox SET status='pending' WHERE status='sending' AND next_at < $1", now)
+        rows = await pool.fetch(
+            "SELECT id, wa_id FROM outbox WHERE status='pending' AND next_at <= $1 "
+            "AND " + OUTBOX_READY + " ORDER BY id LIMIT $2",
+            now, limit)
+        return [(r["id"], r["wa_id"]) for r in rows]
+
+    async def outbox_dead(self, limit: int = 100) -> List[Dict[str, Any]]:
+        pool = await self._pool()
+        rows = await pool.fetch("SELECT * FROM outbox_dead ORDER BY id DESC LIMIT $1", limit)
+        return [dict(r) for r in rows]
+
+    async def outbox_requeue(self, id: int) -> bool:
+        pool = await self._pool()
+        async with pool.acquire() as con:
+            async with con.transaction():
+                row = await con.fetchrow(
+                    "UPDATE outbox SET status='pending', attempts=0, next_at=$1 "
+                    "WHERE id=$2 AND status='dead' RETURNING wa_id, log_text", time.time(), id)
+                if row is not None and row["log_text"]:
+                    await con.execute(
+                        "WITH m AS (INSERT INTO messages(wa_id,role,text,ts) VALUES($1,'assistant',$2,$3) "
+                        "RETURNING id) UPDATE outbox SET msg_id=(SELECT id FROM m) WHERE id=$4",
+                        row["wa_id"], row["log_text"], int(time.time()), id)
+                return row is not None
+
+    async def outbox_purge(self, before: float) -> int:
+        pool = await self._pool()
+        res = await pool.execute("DELETE FROM outbox WHERE status='sent' AND sent_at < $1", before)
+        return int(res.split()[-1])
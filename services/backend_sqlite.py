@@ -0,0 +1,218 @@
+import asyncio, time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Dict, List, Optional, Tuple
+from core.config import settings
+from services import memory
+from services.backend import Backend, OUTBOX_CLAIM, OUTBOX_READY
+from services.db import get_store
+from services.dedupe import SQLiteDedupe
+
+class SQLiteBackend(Backend):
+    """Backend de un solo nodo. Slots/mensajes pasan por services.memory (caché, ring buffer,
+    group commit); todo corre en un executor propio para no bloquear el loop. `turns` es el
+    módulo cuyo buffer de diálogo se avisa al registrar turnos del outbox (storage en app.py)."""
+    def __init__(self, path: str, turns=memory):
+        self.path = path
+        self.turns = turns
+        self._dedupe = SQLiteDedupe(path, settings.DEDUPE_TTL_SECONDS)
+        self._pool = ThreadPoolExecutor(max_workers=settings.DB_EXECUTOR_WORKERS, thread_name_prefix="db")
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._pool, partial(fn, *args))
+
+    def _db(self):
+        return get_store(self.path)
+
+    async def close(self):
+        self._pool.shutdown(wait=True)
+
+    async def load_slots(self, wa_id: str) -> Dict[str, Any]:
+        return await self._run(memory.load_slots, wa_id)
+
+    async def merge_slots(self, wa_id: str, new: Dict[str, Any]) -> Dict[str, Any]:
+        return await self._run(memory.merge_slots, wa_id, new)
+
+    async def log_turn(self, wa_id: str, role: str, text: str):
+        await self._run(memory.log_turn, wa_id, role, text)
+
+    async def recent_dialog(self, wa_id: str, limit: int = 10) -> List[str]:
+        return await self._run(memory.recent_dialog, wa_id, limit)
+
+    # ---- resúmenes ----
+    async def load_summary(self, wa_id: str) -> Optional[Tuple[str, int]]:
+        row = await self._run(self._db().one, "SELECT text, upto_id FROM summaries WHERE wa_id=?", (wa_id,))
+        return (row[0], row[1]) if row else None
+
+    async def save_summary(self, wa_id: str, text: str, upto_id: int):
+        await self._run(self._db().execute,
+                        "INSERT INTO summaries(wa_id,text,upto_id,updated_at) VALUES(?,?,?,?) "
+                        "ON CONFLICT(wa_id) DO UPDATE SET text=excluded.text, upto_id=excluded.upto_id, "
+                        "updated_at=excluded.updated_at WHERE excluded.upto_id > summaries.upto_id",
+                        (wa_id, text, upto_id, int(time.time())))
+
+    async def dialog_after(self, wa_id: str, after_id: int, limit: int) -> List[Tuple[int, str]]:
+        return await self._run(self._db().query,
+                               "SELECT id, role||': '||text FROM messages WHERE wa_id=? AND id>? "
+                               "ORDER BY id LIMIT ?", (wa_id, after_id, limit))
+
+    # ---- dedupe ----
+    async def dedupe_add_if_new(self, key: str, ttl: float) -> bool:
+        return await self._run(self._dedupe.insert, key, ttl)
+
+    async def dedupe_discard(self, key: str):
+        await self._run(self._dedupe.discard, key)
+
+    async def dedupe_purge(self) -> int:
+        return await self._run(self._dedupe.purge)
+
+    async def dedupe_recent(self, expires_after: float, limit: int) -> List[str]:
+        return await self._run(self._dedupe.recent, expires_after, limit)
+
+    # ---- overrides ----
+    def _open(self, wa_id: str, ttl: float):
+        self._db().execute(
+            "INSERT INTO overrides(wa_id,expires_at,reply) VALUES(?,?,NULL) "
+            "ON CONFLICT(wa_id) DO UPDATE SET expires_at=excluded.expires_at, reply=NULL",
+            (wa_id, time.time() + ttl))
+
+    def _submit(self, wa_id: str, text: str) -> bool:
+        n = self._db().execute(
+            "UPDATE overrides SET reply=? WHERE wa_id=? AND reply IS NULL AND expires_at > ?",
+            (text, wa_id, time.time()))
+        return n == 1
+
+    def _take(self, wa_id: str) -> Optional[str]:
+        def run(con):
+            row = con.execute("SELECT reply FROM overrides WHERE wa_id=? AND reply IS NOT NULL",
+                              (wa_id,)).fetchone()
+            if row:
+                con.execute("DELETE FROM overrides WHERE wa_id=?", (wa_id,))
+            return row[0] if row else None
+        return self._db().execute(run)
+
+    def _pending(self) -> Dict[str, int]:
+        now = time.time()
+        rows = self._db().query(
+            "SELECT wa_id, expires_at FROM overrides WHERE reply IS NULL AND expires_at > ?", (now,))
+        return {w: int(exp - now) for w, exp in rows}
+
+    async def override_open(self, wa_id: str, ttl: float):
+        await self._run(self._open, wa_id, ttl)
+
+    async def override_submit(self, wa_id: str, text: str) -> bool:
+        return await self._run(self._submit, wa_id, text)
+
+    async def override_reply(self, wa_id: str) -> Optional[Tuple[str, float]]:
+        row = await self._run(self._db().one,
+                              "SELECT reply, expires_at FROM overrides WHERE wa_id=? AND reply IS NOT NULL",
+                              (wa_id,))
+        return tuple(row) if row else None
+
+    async def override_take(self, wa_id: str) -> Optional[str]:
+        return await self._run(self._take, wa_id)
+
+    async def override_cancel(self, wa_id: str):
+        await self._run(self._db().execute, "DELETE FROM overrides WHERE wa_id=?", (wa_id,))
+
+    async def override_pending(self) -> Dict[str, int]:
+        return await self._run(self._pending)
+
+    async def override_expire(self, wa_id: str) -> bool:
+        n = await self._run(self._db().execute,
+                            "DELETE FROM overrides WHERE wa_id=? AND reply IS NULL AND expires_at <= ?",
+                            (wa_id, time.time()))
+        return n == 1
+
+    async def override_load(self) -> List[Tuple[str, float, Optional[str]]]:
+        return await self._run(self._db().query, "SELECT wa_id, expires_at, reply FROM overrides")
+
+    # ---- outbox ----
+    def _outbox_put(self, key, wa_id, kind, body, log_text, next_at) -> Optional[int]:
+        def run(con):
+            cur = con.execute(
+                "INSERT INTO outbox(key,wa_id,kind,body,log_text,status,next_at,created_at) "
+                "VALUES(?,?,?,?,?,'pending',?,?) ON CONFLICT(key) DO NOTHING",
+                (key, wa_id, kind, body, log_text, next_at, time.time()))
+            if cur.rowcount != 1:
+                return None
+            id = cur.lastrowid
+            if log_text:
+                con.execute("UPDATE outbox SET msg_id=? WHERE id=?",
+                            (self.turns.insert_turn(con, wa_id, "assistant", log_text), id))
+            return id
+        id = self._db().execute(run)
+        if id is not None and log_text:
+            self.turns.note_turn(wa_id, "assistant", log_text)
+        return id
+
+    async def outbox_put(self, key: str, wa_id: str, kind: str, body: str,
+                         log_text: Optional[str], next_at: float) -> Optional[int]:
+        return await self._run(self._outbox_put, key, wa_id, kind, body, log_text, next_at)
+
+    async def outbox_claim(self, id: int, lease: float) -> Optional[Tuple[str, str, int]]:
+        sql = OUTBOX_CLAIM.format(lease="?", id="?")
+        row = await self._run(self._db().execute,
+                              lambda con: con.execute(sql, (time.time() + lease, id)).fetchone())
+        return tuple(row) if row else None
+
+    async def outbox_sent(self, id: int, provider_id: Optional[str]):
+        await self._run(self._db().execute,
+                        "UPDATE outbox SET status='sent', provider_id=?, sent_at=?, last_error=NULL WHERE id=?",
+                        (provider_id, time.time(), id))
+
+    def _outbox_dead(self, id, error):
+        def run(con):
+            row = con.execute("SELECT wa_id, msg_id FROM outbox WHERE id=?", (id,)).fetchone()
+            con.execute("UPDATE outbox SET status='dead', last_error=?, msg_id=NULL WHERE id=?", (error, id))
+            if row and row[1] is not None:
+                con.execute("DELETE FROM messages WHERE id=?", (row[1],))
+                return row[0]
+            return None
+        wa_id = self._db().execute(run)
+        if wa_id is not None:
+            self.turns.forget_turn(wa_id)
+
+    async def outbox_fail(self, id: int, error: str, retry_at: Optional[float]):
+        if retry_at is None:
+            await self._run(self._outbox_dead, id, error)
+        else:
+            await self._run(self._db().execute,
+                            "UPDATE outbox SET status='pending', next_at=?, last_error=? WHERE id=?",
+                            (retry_at, error, id))
+
+    async def outbox_due(self, limit: int) -> List[Tuple[int, str]]:
+        now = time.time()
+        await self._run(self._db().execute,
+                        "UPDATE outbox SET status='pending' WHERE status='sending' AND next_at < ?", (now,))
+        return await self._run(self._db().query,
+                               "SELECT id, wa_id FROM outbox WHERE status='pending' AND next_at <= ? "
+                               "AND " + OUTBOX_READY + " ORDER BY id LIMIT ?", (now, limit))
+
+    async def outbox_dead(self, limit: int = 100) -> List[Dict[str, Any]]:
+        rows = await self._run(self._db().query,
+                               "SELECT id, key, wa_id, kind, body, attempts, last_error, created_at "
+                               "FROM outbox_dead ORDER BY id DESC LIMIT ?", (limit,))
+        cols = ("id", "key", "wa_id", "kind", "body", "attempts", "last_error", "created_at")
+        return [dict(zip(cols, r)) for r in rows]
+
+    def _outbox_requeue(self, id) -> bool:
+        def run(con):
+            row = con.execute("UPDATE outbox SET status='pending', attempts=0, next_at=? "
+                              "WHERE id=? AND status='dead' RETURNING wa_id, log_text",
+                              (time.time(), id)).fetchone()
+            if row and row[1]:
+                con.execute("UPDATE outbox SET msg_id=? WHERE id=?",
+                            (self.turns.insert_turn(con, row[0], "assistant", row[1]), id))
+            return row
+        row = self._db().execute(run)
+        if row and row[1]:
+            self.turns.note_turn(row[0], "assistant", row[1])
+        return row is not None
+
+    async def outbox_requeue(self, id: int) -> bool:
+        return await self._run(self._outbox_requeue, id)
+
+    async def outbox_purge(self, before: float) -> int:
+        return await self._run(self._db().execute,
+                               "DELETE FROM outbox WHERE status='sent' AND sent_at < ?", (before,))
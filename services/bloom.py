@@ -0,0 +1,133 @@
+import asyncio, hashlib, math, time
+from typing import Dict, List
+from monitoring import bloom_checks, bloom_false_positive, bloom_bytes
+
+class RotatingBloom:
+    """Bloom filter partido en rebanadas de tiempo: se inserta en la rebanada actual y se
+    consulta en todas; al rotar se limpia la más vieja, así el horizonte queda acotado sin
+    guardar las llaves. `fp_rate` es el presupuesto de falsos positivos del conjunto."""
+    def __init__(self, horizon: float, slices: int, capacity: int, fp_rate: float):
+        self.slices = slices
+        self.slice_seconds = horizon / slices
+        n = max(1, math.ceil(capacity / slices))          # llaves esperadas por rebanada
+        p = fp_rate / (slices + 1)                          # la unión suma los fp de cada rebanada
+        self.m = max(8, math.ceil(-n * math.log(p) / (math.log(2) ** 2)))
+        self.k = max(1, round(self.m / n * math.log(2)))
+        # slices + 1 para cubrir siempre al menos `horizon` hacia atrás
+        self._bits: List[bytearray] = [bytearray((self.m + 7) // 8) for _ in range(slices + 1)]
+        self._epoch = int(time.time() // self.slice_seconds)
+        bloom_bytes.set(self.nbytes)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(len(b) for b in self._bits)
+
+    def _rotate(self):
+        epoch = int(time.time() // self.slice_seconds)
+        steps = min(epoch - self._epoch, len(self._bits))
+        for i in range(1, steps + 1):
+            b = self._bits[(self._epoch + i) % len(self._bits)]
+            b[:] = bytes(len(b))
+        if steps > 0:
+            self._epoch = epoch
+
+    def _positions(self, key: str) -> List[int]:
+        # doble hashing (Kirsch–Mitzenmacher): k posiciones a partir de dos enteros de 64 bits
+        d = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(d[:8], "little")
+        h2 = int.from_bytes(d[8:], "little") | 1
+        m = self.m
+        return [(h1 + i * h2) % m for i in range(self.k)]
+
+    def __contains__(self, key: str) -> bool:
+        self._rotate()
+        pos = self._positions(key)
+        for b in self._bits:
+            if all(b[p >> 3] & (1 << (p & 7)) for p in pos):
+                return True
+        return False
+
+    def add(self, key: str):
+        self._rotate()
+        b = self._bits[self._epoch % len(self._bits)]
+        for p in self._positions(key):
+            b[p >> 3] |= 1 << (p & 7)
+
+class BloomDedupe:
+    """Frente probabilístico para un Dedupe exacto. Si el filtro dice "nunca visto" se responde
+    nuevo al instante y el registro en el store exacto va en segundo plano; sólo los "quizá visto"
+    consultan el store. `start()` precarga el filtro con las llaves del store dentro del horizonte
+    (reinicios); mientras no esté caliente se consulta el store para todo. El filtro es por
+    proceso: úsalo cuando este proceso recibe todas las entregas (un worker o ruteo fijo), si no
+    un reintento en otro worker se vería como nuevo. El horizonte debe cubrir el TTL del dedupe:
+    una llave que ya salió del filtro se daría por nueva aunque siga en el store."""
+    def __init__(self, exact, bloom: RotatingBloom, horizon: float, capacity: int, ttl: float):
+        if horizon < ttl:
+            raise ValueError(f"horizonte del filtro Bloom ({horizon:.0f}s) menor que el TTL del dedupe ({ttl:.0f}s)")
+        self.exact = exact
+        self.bloom = bloom
+        self.horizon = horizon
+        self.capacity = capacity
+        self.kind = exact.kind
+        self.warm = False
+        self._pending: Dict[str, asyncio.Task] = {}
+
+    async def start(self):
+        """Precarga el filtro; si el store no puede listar llaves, se queda en modo exacto."""
+        try:
+            keys = await self.exact.recent(time.time() - self.horizon, self.capacity)
+        except Exception as e:
+            print("ERROR dedupe bloom warmup:", repr(e))
+            return
+        if keys is None:
+            print("dedupe: el store", self.kind, "no lista llaves; filtro Bloom desactivado")
+            return
+        for k in keys:
+            self.bloom.add(k)
+        self.warm = True
+
+    def _registered(self, t: asyncio.Task, key: str):
+        self._pending.pop(key, None)
+        if t.cancelled():
+            return
+        if t.exception() is not None:
+            print("ERROR dedupe registro:", key, repr(t.exception()))
+        elif t.result() is False:
+            bloom_checks.labels("late_dup").inc()    # ya estaba en el store (otro worker)
+
+    async def add_if_new(self, key: str) -> bool:
+        if not key:
+            return True
+        if not self.warm:
+            new = await self.exact.add_if_new(key)
+            self.bloom.add(key)
+            return new
+        if key not in self.bloom:
+            bloom_checks.labels("definitely_new").inc()
+            self.bloom.add(key)
+            t = asyncio.create_task(self.exact.add_if_new(key))
+            self._pending[key] = t
+            t.add_done_callback(lambda _t, k=key: self._registered(_t, k))
+            return True
+        bloom_checks.labels("maybe_seen").inc()
+        if key in self._pending:      # reintento mientras el registro sigue en vuelo
+            return False
+        new = await self.exact.add_if_new(key)
+        if new:
+            bloom_false_positive.inc()
+        return new
+
+    async def discard(self, key: str):
+        t = self._pending.pop(key, None)
+        if t is not None:
+            await asyncio.gather(t, return_exceptions=True)
+        await self.exact.discard(key)
+
+    async def purge(self):
+        return await self.exact.purge()
+
+    async def recent(self, since: float, limit: int):
+        return await self.exact.recent(since, limit)
+
+    async def purge_forever(self, every: float):
+        await self.exact.purge_forever(every)
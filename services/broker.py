@@ -0,0 +1,71 @@
+import asyncio, json, time
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+from core.config import settings
+from monitoring import console_subscribers, console_events, console_dropped
+
+def frame(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+class Subscription:
+    __slots__ = ("q",)
+    def __init__(self, maxsize: int):
+        self.q: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+
+class Broker:
+    """Fan-out en memoria para las consolas de agentes: publish() no espera a nadie; cada
+    suscriptor tiene su cola acotada y, si se atrasa, pierde los eventos más viejos."""
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._subs: Set[Subscription] = set()
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subs)
+
+    def subscribe(self) -> Subscription:
+        sub = Subscription(self.maxsize)
+        self._subs.add(sub)
+        console_subscribers.set(len(self._subs))
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        self._subs.discard(sub)
+        console_subscribers.set(len(self._subs))
+
+    def publish(self, event: str, data: Dict[str, Any]):
+        if not self._subs:
+            return
+        console_events.labels(event).inc()
+        # se serializa una vez para todas las consolas
+        f = frame(event, data)
+        for sub in self._subs:
+            if sub.q.full():
+                sub.q.get_nowait()
+                console_dropped.inc()
+            sub.q.put_nowait(f)
+
+    async def stream(self, sub: Subscription, first: Optional[str] = None, heartbeat: float = 15.0):
+        """Generador SSE para una suscripción; comentarios `:` como keep-alive."""
+        try:
+            if first:
+                yield first
+            while True:
+                try:
+                    yield await asyncio.wait_for(sub.q.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+        finally:
+            self.unsubscribe(sub)
+
+    async def tick_forever(self, every: float, pending: Callable[[], Awaitable[Dict[str, int]]]):
+        """Cuenta regresiva de ventanas: una consulta al store por tick, no por consola."""
+        while True:
+            await asyncio.sleep(every)
+            if not self._subs:
+                continue
+            try:
+                self.publish("ttl", {"ts": int(time.time()), "pending": await pending()})
+            except Exception as e:
+                print("ERROR console tick:", repr(e))
+
+console = Broker(settings.CONSOLE_QUEUE_MAX)
@@ -0,0 +1,178 @@
+import argparse, gzip, json, math, random, sqlite3, time, zlib
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from services.intents import IntentEngine
+from services.kb import KB_DIR, ROOT, load_faq
+from services.text_norm import normalize
+
+OTHER = "otro"      # no se contesta sola: va al LLM
+Example = Tuple[str, str]
+
+def features(norm: str, dim: int) -> List[int]:
+    """n-gramas hasheados (crc32, estable entre procesos): palabras, bigramas y trigramas
+    de caracteres, que aguantan typos y conjugaciones."""
+    toks = norm.split()
+    grams = [f"w:{t}" for t in toks] + [f"b:{a} {b}" for a, b in zip(toks, toks[1:])]
+    padded = f" {norm} "
+    grams += [padded[i:i + 3] for i in range(len(padded) - 2)]
+    return sorted({zlib.crc32(g.encode()) % dim for g in grams})
+
+class Model:
+    """Regresión logística multiclase (softmax) sobre features binarias hasheadas."""
+    def __init__(self, labels: Sequence[str], dim: int):
+        self.labels = list(labels)
+        self.dim = dim
+        self.w: List[Dict[int, float]] = [{} for _ in self.labels]
+        self.b: List[float] = [0.0] * len(self.labels)
+
+    def _scores(self, feats: List[int]) -> List[float]:
+        x = 1.0 / math.sqrt(len(feats) or 1)
+        return [bias + x * sum(w.get(i, 0.0) for i in feats) for w, bias in zip(self.w, self.b)]
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        s = self._scores(features(normalize(text), self.dim))
+        top = max(s)
+        exps = [math.exp(v - top) for v in s]
+        k = exps.index(1.0)
+        return self.labels[k], 1.0 / sum(exps)
+
+    def fit(self, data: List[Example], epochs: int = 40, lr: float = 1.0, l2: float = 1e-5, seed: int = 7):
+        idx = {l: k for k, l in enumerate(self.labels)}
+        rows = [(features(normalize(t), self.dim), idx[l]) for t, l in data]
+        rnd = random.Random(seed)
+        for ep in range(epochs):
+            rnd.shuffle(rows)
+            step = lr / (1 + ep * 0.3)
+            for feats, y in rows:
+                s = self._scores(feats)
+                top = max(s)
+                exps = [math.exp(v - top) for v in s]
+                z = sum(exps)
+                x = 1.0 / math.sqrt(len(feats) or 1)
+                for k, e in enumerate(exps):
+                    g = e / z - (1.0 if k == y else 0.0)
+                    if abs(g) < 1e-6:
+                        continue
+                    w = self.w[k]
+                    for i in feats:
+                        w[i] = w.get(i, 0.0) * (1 - step * l2) - step * g * x
+                    self.b[k] -= step * g
+        return self
+
+    def save(self, path: Path, prune: float = 1e-4):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        blob = {"dim": self.dim, "labels": self.labels, "b": self.b,
+                "w": [{str(i): round(v, 5) for i, v in w.items() if abs(v) > prune} for w in self.w]}
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            json.dump(blob, f, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, path: Path) -> "Model":
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            blob = json.load(f)
+        m = cls(blob["labels"], blob["dim"])
+        m.b = blob["b"]
+        m.w = [{int(i): v for i, v in w.items()} for w in blob["w"]]
+        return m
+
+# ---- datos de entrenamiento ----
+
+def kb_examples(engine: IntentEngine) -> List[Example]:
+    """Semillas del KB: palabras clave de intents con respuesta, preguntas del FAQ y
+    KB/examples/labeled.jsonl (etiquetado a mano)."""
+    out: List[Example] = []
+    spec = json.loads((KB_DIR / "intents.json").read_text(encoding="utf-8"))
+    for it in spec["intents"]:
+        if it["name"] in engine.replies:
+            out += [(kw.replace("*", ""), it["name"]) for kw in it["keywords"]]
+    out += [(f.question, f.label) for f in load_faq()]
+    labeled = KB_DIR / "examples" / "labeled.jsonl"
+    if labeled.exists():
+        for line in labeled.read_text(encoding="utf-8").splitlines():
+            if line.strip():
+                row = json.loads(line)
+                out.append((row["text"], row["label"]))
+    return out
+
+def db_examples(db_path: str, engine: IntentEngine, limit: int = 50000) -> List[Example]:
+    """Mensajes reales de usuario etiquetados por el router de reglas (supervisión débil). Sólo
+    se usan los que las reglas contestan: lo que no reconocen no es necesariamente OTHER (puede
+    ser una pregunta del FAQ dicha de otra forma, justo lo que el modelo debe desviar); los
+    ejemplos de OTHER vienen de labeled.jsonl."""
+    con = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        rows = con.execute("SELECT text FROM messages WHERE role='user' ORDER BY id DESC LIMIT ?",
+                           (limit,)).fetchall()
+    finally:
+        con.close()
+    out: List[Example] = []
+    for (t,) in rows:
+        label = engine.best(t, with_reply=True) if t and len(t) < 300 else None
+        if label:
+            out.append((t, label))
+    return out
+
+def dataset(db_path: Optional[str], engine: IntentEngine) -> List[Example]:
+    data = kb_examples(engine)
+    if db_path and Path(db_path).exists():
+        seen = {normalize(t) for t, _ in data}     # lo etiquetado a mano manda
+        data += [(t, l) for t, l in db_examples(db_path, engine) if normalize(t) not in seen]
+    return data
+
+def train(data: List[Example], dim: int, epochs: int = 40) -> Model:
+    labels = sorted({l for _, l in data} | {OTHER})
+    return Model(labels, dim).fit(data, epochs=epochs)
+
+def evaluate(model: Model, data: Iterable[Example], threshold: float) -> Dict[str, float]:
+    """Exactitud, tasa de desvío (se contesta sin LLM) y precisión de lo desviado."""
+    n = ok = deflected = right = 0
+    t0 = time.perf_counter()
+    for text, want in data:
+        got, p = model.predict(text)
+        n += 1
+        ok += got == want
+        if got != OTHER and p >= threshold:
+            deflected += 1
+            right += got == want
+    dt = time.perf_counter() - t0
+    return {"n": n, "accuracy": ok / max(n, 1), "deflection": deflected / max(n, 1),
+            "precision": right / max(deflected, 1), "us_per_msg": dt / max(n, 1) * 1e6}
+
+def main(argv: Optional[List[str]] = None):
+    from core.config import settings
+    ap = argparse.ArgumentParser(prog="python -m services.classifier",
+                                 description="Clasificador local de intents (n-gramas hasheados + softmax).")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    for name in ("train", "eval"):
+        p = sub.add_parser(name)
+        p.add_argument("--db", default=settings.DB_PATH, help="SQLite con la tabla messages ('' = sólo KB)")
+        p.add_argument("--dim", type=int, default=settings.CLASSIFIER_DIM)
+        p.add_argument("--threshold", type=float, default=settings.CLASSIFIER_THRESHOLD)
+        p.add_argument("--epochs", type=int, default=40)
+    sub.choices["train"].add_argument("--out", default=settings.CLASSIFIER_PATH)
+    sub.choices["eval"].add_argument("--holdout", type=float, default=0.25)
+    args = ap.parse_args(argv)
+
+    engine = IntentEngine.load(settings.INTENTS_PATH)
+    data = dataset(args.db or None, engine)
+    if args.cmd == "train":
+        model = train(data, args.dim, args.epochs)
+        out = Path(args.out) if Path(args.out).is_absolute() else ROOT / args.out
+        model.save(out)
+        r = evaluate(model, data, args.threshold)
+        print(f"{len(data)} ejemplos, {len(model.labels)} etiquetas -> {out}")
+        print(f"entrenamiento: exactitud {r['accuracy']:.1%}, desvío {r['deflection']:.1%}, "
+              f"{r['us_per_msg']:.0f} µs/msg")
+        return
+    rnd = random.Random(1)
+    rnd.shuffle(data)
+    cut = int(len(data) * (1 - args.holdout))
+    model = train(data[:cut], args.dim, args.epochs)
+    print(f"{cut} para entrenar, {len(data) - cut} de prueba")
+    print(f"{'umbral':>7}{'exactitud':>11}{'desvío':>9}{'precisión':>11}{'µs/msg':>8}")
+    for thr in sorted({0.5, 0.6, 0.7, 0.8, 0.9, args.threshold}):
+        r = evaluate(model, data[cut:], thr)
+        print(f"{thr:>7.2f}{r['accuracy']:>11.1%}{r['deflection']:>9.1%}{r['precision']:>11.1%}{r['us_per_msg']:>8.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+from monitoring import coalesce_batch, coalesce_pending
+
+Flush = Callable[[str, List[Any]], Awaitable[None]]
+
+class _Buf:
+    __slots__ = ("items", "first", "handle")
+    def __init__(self, first: float):
+        self.items: List[Any] = []
+        self.first = first
+        self.handle: Optional[asyncio.TimerHandle] = None
+
+class Coalescer:
+    """Junta ráfagas por llave: cada item nuevo reinicia la ventana (`window` s) sin pasar de
+    `max_window` s desde el primero; al vencer llama flush(key, items) una sola vez."""
+    def __init__(self, window: float, max_window: float, flush: Flush):
+        self.window = window
+        self.max_window = max(max_window, window)
+        self._flush = flush
+        self._bufs: Dict[str, _Buf] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def add(self, key: str, item: Any):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        buf = self._bufs.get(key)
+        if buf is None:
+            buf = self._bufs[key] = _Buf(now)
+            coalesce_pending.inc()
+        buf.items.append(item)
+        if buf.handle:
+            buf.handle.cancel()
+        buf.handle = loop.call_at(min(now + self.window, buf.first + self.max_window), self._fire, key)
+
+    def _fire(self, key: str):
+        buf = self._bufs.pop(key, None)
+        if buf is None:
+            return
+        coalesce_pending.dec()
+        coalesce_batch.observe(len(buf.items))
+        task = asyncio.create_task(self._run(key, buf.items))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, key: str, items: List[Any]):
+        try:
+            await self._flush(key, items)
+        except Exception as e:
+            print("ERROR coalesce flush:", key, repr(e))
+
+    async def drain(self):
+        """Vacía todas las ventanas abiertas y espera a que terminen (apagado)."""
+        for key, buf in list(self._bufs.items()):
+            if buf.handle:
+                buf.handle.cancel()
+            self._fire(key)
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
@@ -0,0 +1,188 @@
+import atexit, queue, sqlite3, threading, time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union
+from core.config import settings
+from monitoring import db_write_batch, db_write_wait
+
+Write = Union[str, Callable[[sqlite3.Connection], Any]]
+
+class _Alone:
+    """Operación que corre sola en el hilo escritor, fuera de la transacción de un lote."""
+    __slots__ = ("fn",)
+    def __init__(self, fn: Callable[[sqlite3.Connection], Any]):
+        self.fn = fn
+
+class Store:
+    """Conexiones SQLite de larga vida para un archivo: un solo escritor (hilo) que agrupa
+    las escrituras encoladas en una transacción cada pocos ms, y un pool de lectores. Cada
+    escritura del lote va en su SAVEPOINT: si falla se deshace sólo ella."""
+    def __init__(self, path: str, readers: int = 4, batch_ms: float = 2,
+                 max_batch: int = 512, mmap_mb: int = 256, cache_mb: int = 64):
+        self.path = path
+        self.batch_s = batch_ms / 1000
+        self.max_batch = max_batch
+        self.mmap_mb = mmap_mb
+        self.cache_mb = cache_mb
+        self._max_readers = readers
+        self._readers: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._n_readers = 0
+        self._mu = threading.Lock()
+        self._wq: "queue.Queue" = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name=f"sqlite-writer:{path}", daemon=True)
+        self._wcon = self._connect()
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        con = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        con.execute("PRAGMA journal_mode=WAL;")
+        con.execute("PRAGMA synchronous=NORMAL;")
+        con.execute(f"PRAGMA mmap_size={self.mmap_mb * 1024 * 1024};")
+        con.execute(f"PRAGMA cache_size=-{self.cache_mb * 1024};")
+        con.execute("PRAGMA temp_store=MEMORY;")
+        con.execute("PRAGMA busy_timeout=5000;")
+        return con
+
+    # ---- lecturas ----
+    @contextmanager
+    def reader(self):
+        try:
+            con = self._readers.get_nowait()
+        except queue.Empty:
+            with self._mu:
+                grow = self._n_readers < self._max_readers
+                if grow: self._n_readers += 1
+            con = self._connect() if grow else self._readers.get()
+        try:
+            yield con
+        finally:
+            self._readers.put(con)
+
+    def query(self, sql: str, params: Sequence[Any] = ()) -> List[tuple]:
+        with self.reader() as con:
+            return con.execute(sql, params).fetchall()
+
+    def one(self, sql: str, params: Sequence[Any] = ()) -> Optional[tuple]:
+        with self.reader() as con:
+            return con.execute(sql, params).fetchone()
+
+    # ---- escrituras ----
+    def submit(self, op: Write, params: Sequence[Any] = ()) -> Future:
+        """Encola una escritura (SQL o callable(con)); el Future se resuelve tras el COMMIT.
+        Para SQL el resultado es rowcount; para callables, lo que devuelva."""
+        fut: Future = Future()
+        self._wq.put((op, params, fut, time.monotonic()))
+        return fut
+
+    def execute(self, op: Write, params: Sequence[Any] = ()) -> Any:
+        return self.submit(op, params).result()
+
+    def alone(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        """Corre `fn(con)` sola, entre lotes y sin transacción abierta: para lo que maneja su
+        propia transacción (executescript, migraciones)."""
+        return self.submit(_Alone(fn)).result()
+
+    def script(self, sql: str):
+        self.alone(lambda con: con.executescript(sql))
+
+    def _write_loop(self):
+        con = self._wcon
+        held = None
+        while True:
+            item, held = held or self._wq.get(), None
+            if item is None:
+                break
+            if isinstance(item[0], _Alone):
+                self._run_alone(con, item)
+                continue
+            batch = [item]
+            deadline = time.monotonic() + self.batch_s
+            stop = False
+            while len(batch) < self.max_batch:
+                try:
+                    nxt = self._wq.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if nxt is None:
+                    stop = True; break
+                if isinstance(nxt[0], _Alone):
+                    held = nxt; break       # después de cerrar este lote
+                batch.append(nxt)
+            self._commit(con, batch)
+            if stop:
+                break
+        con.close()
+
+    def _run_alone(self, con: sqlite3.Connection, item):
+        op, _, fut, _ = item
+        try:
+            fut.set_result(op.fn(con))
+        except Exception as e:
+            if con.in_transaction:
+                con.execute("ROLLBACK")
+            fut.set_exception(e)
+
+    def _commit(self, con: sqlite3.Connection, batch: list):
+        done = []
+        try:
+            con.execute("BEGIN IMMEDIATE")
+            for op, params, fut, t0 in batch:
+                con.execute("SAVEPOINT op")
+                try:
+                    res = op(con) if callable(op) else con.execute(op, params).rowcount
+                except Exception as e:
+                    # deshace sólo lo que escribió esta operación (callables con varias sentencias)
+                    con.execute("ROLLBACK TO op")
+                    con.execute("RELEASE op")
+                    fut.set_exception(e)
+                    continue
+                if not con.in_transaction:
+                    # la operación cerró la transacción (COMMIT propio): ya no se puede aislar
+                    con.execute("BEGIN IMMEDIATE")
+                    fut.set_exception(RuntimeError("la escritura hizo COMMIT dentro del lote; usa Store.alone"))
+                    continue
+                con.execute("RELEASE op")
+                done.append((fut, res, t0))
+            con.execute("COMMIT")
+        except Exception as e:
+            if con.in_transaction:
+                con.execute("ROLLBACK")
+            for _, _, fut, _ in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        now = time.monotonic()
+        db_write_batch.observe(len(batch))
+        for fut, res, t0 in done:
+            db_write_wait.observe(now - t0)
+            fut.set_result(res)
+
+    def close(self):
+        self._wq.put(None)
+        self._writer.join()
+        while not self._readers.empty():
+            self._readers.get_nowait().close()
+
+_STORES: Dict[str, Store] = {}
+_LOCK = threading.Lock()
+
+def get_store(path: str) -> Store:
+    """Store compartido por archivo dentro del proceso."""
+    s = _STORES.get(path)
+    if s is None:
+        with _LOCK:
+            s = _STORES.get(path)
+            if s is None:
+                s = _STORES[path] = Store(path, readers=settings.SQLITE_READERS,
+                                          batch_ms=settings.SQLITE_BATCH_MS,
+                                          max_batch=settings.SQLITE_MAX_BATCH,
+                                          mmap_mb=settings.SQLITE_MMAP_MB,
+                                          cache_mb=settings.SQLITE_CACHE_MB)
+    return s
+
+@atexit.register
+def close_all():
+    with _LOCK:
+        for s in _STORES.values():
+            s.close()
+        _STORES.clear()
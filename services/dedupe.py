@@ -1,4 +1,10 @@
+import asyncio, threading, time
+from abc import ABC, abstractmethod
 from collections import OrderedDict
+from typing import List, Optional
+from core.config import settings
+from services.db import get_store
+from monitoring import dedupe_checks, dedupe_size
 
 class LRUSet:
     def __init__(self, cap=5000):
@@ -14,5 +20,199 @@ class LRUSet:
         if len(self.d) > self.cap:
             self.d.popitem(last=False)
         return True
+    def discard(self, key: str):
+        self.d.pop(key, None)
 
-dedupe = LRUSet(5000)
+def _count(kind: str, new: bool) -> bool:
+    dedupe_checks.labels(kind, "new" if new else "dup").inc()
+    return new
+
+class TTLSet:
+    """Set en memoria con expiración. Como el TTL es fijo, el orden de inserción es el orden de
+    expiración: purgar es sacar del frente (O(1) amortizado). `cap` acota la memoria."""
+    kind = "memory"
+
+    def __init__(self, ttl: float, cap: int):
+        self.ttl = ttl
+        self.cap = cap
+        self._d: "OrderedDict[str, float]" = OrderedDict()
+        self._mu = threading.Lock()
+
+    def _expire(self, now: float):
+        while self._d:
+            key, exp = next(iter(self._d.items()))
+            if exp > now and len(self._d) <= self.cap:
+                break
+            self._d.popitem(last=False)
+
+    def add_if_new(self, key: str) -> bool:
+        if not key:
+            return True
+        now = time.time()
+        with self._mu:
+            exp = self._d.get(key)
+            new = exp is None or exp <= now
+            if new:
+                self._d.pop(key, None)
+                self._d[key] = now + self.ttl
+                self._expire(now)
+            dedupe_size.labels(self.kind).set(len(self._d))
+        return _count(self.kind, new)
+
+    def discard(self, key: str):
+        with self._mu:
+            self._d.pop(key, None)
+
+    def purge(self) -> int:
+        with self._mu:
+            self._expire(time.time())
+            n = len(self._d)
+        dedupe_size.labels(self.kind).set(n)
+        return n
+
+    def recent(self, since: float) -> List[str]:
+        with self._mu:
+            return [k for k, exp in self._d.items() if exp - self.ttl >= since]
+
+class SQLiteDedupe:
+    """Dedupe durable en la tabla `dedupe` (sobrevive reinicios, compartida por los workers
+    que usan el mismo archivo). Un upsert condicional decide "nuevo" en una sola escritura."""
+    kind = "sqlite"
+
+    def __init__(self, path: str, ttl: float):
+        self.path = path
+        self.ttl = ttl
+
+    def insert(self, key: str, ttl: float) -> bool:
+        now = time.time()
+        n = get_store(self.path).execute(
+            "INSERT INTO dedupe(key,expires_at) VALUES(?,?) "
+            "ON CONFLICT(key) DO UPDATE SET expires_at=excluded.expires_at WHERE dedupe.expires_at < ?",
+            (key, now + ttl, now))
+        return n == 1
+
+    def add_if_new(self, key: str) -> bool:
+        if not key:
+            return True
+        return _count(self.kind, self.insert(key, self.ttl))
+
+    def discard(self, key: str):
+        get_store(self.path).execute("DELETE FROM dedupe WHERE key=?", (key,))
+
+    def purge(self) -> int:
+        db = get_store(self.path)
+        db.execute("DELETE FROM dedupe WHERE expires_at < ?", (time.time(),))
+        n = db.one("SELECT COUNT(*) FROM dedupe")[0]
+        dedupe_size.labels(self.kind).set(n)
+        return n
+
+    def recent(self, expires_after: float, limit: int) -> List[str]:
+        return [k for (k,) in get_store(self.path).query(
+            "SELECT key FROM dedupe WHERE expires_at > ? LIMIT ?", (expires_after, limit))]
+
+class Dedupe(ABC):
+    """Interfaz async que usa el webhook: add_if_new / discard / purge."""
+    kind = "?"
+    @abstractmethod
+    async def add_if_new(self, key: str) -> bool: ...
+    @abstractmethod
+    async def discard(self, key: str): ...
+    async def purge(self) -> Optional[int]: return None
+    async def start(self): pass
+    async def recent(self, since: float, limit: int) -> Optional[List[str]]:
+        """Llaves registradas desde `since` (epoch), para precargar el filtro Bloom; None si el
+        store no puede listarlas."""
+        return None
+
+    async def purge_forever(self, every: float):
+        while True:
+            await asyncio.sleep(every)
+            try:
+                await self.purge()
+            except Exception as e:
+                print("ERROR dedupe purge:", repr(e))
+
+class MemoryDedupe(Dedupe):
+    kind = "memory"
+    def __init__(self, ttl: float, cap: int):
+        self.set = TTLSet(ttl, cap)
+    async def add_if_new(self, key: str) -> bool:
+        return self.set.add_if_new(key)
+    async def discard(self, key: str):
+        self.set.discard(key)
+    async def purge(self) -> int:
+        return self.set.purge()
+    async def recent(self, since: float, limit: int) -> List[str]:
+        return self.set.recent(since)[-limit:]
+
+class StoreDedupe(Dedupe):
+    """Sobre el backend de almacenamiento (SQLite o Postgres, según STORAGE_BACKEND)."""
+    def __init__(self, ttl: float):
+        from services.backend import backend
+        self._backend = backend
+        self.ttl = ttl
+        self.kind = settings.STORAGE_BACKEND
+    async def add_if_new(self, key: str) -> bool:
+        if not key:
+            return True
+        return _count(self.kind, await self._backend().dedupe_add_if_new(key, self.ttl))
+    async def discard(self, key: str):
+        await self._backend().dedupe_discard(key)
+    async def purge(self) -> int:
+        n = await self._backend().dedupe_purge()
+        dedupe_size.labels(self.kind).set(n)
+        return n
+    async def recent(self, since: float, limit: int) -> List[str]:
+        return await self._backend().dedupe_recent(since + self.ttl, limit)
+
+class RedisDedupe(Dedupe):
+    """Cualquier servidor con protocolo Redis: SET NX EX es atómico y la expiración es nativa."""
+    kind = "redis"
+    def __init__(self, url: str, ttl: float, prefix: str = "wamid:"):
+        import redis.asyncio as aioredis
+        self.r = aioredis.from_url(url)
+        self.ttl = int(ttl)
+        self.prefix = prefix
+    async def add_if_new(self, key: str) -> bool:
+        if not key:
+            return True
+        ok = await self.r.set(self.prefix + key, 1, nx=True, ex=self.ttl)
+        return _count(self.kind, bool(ok))
+    async def discard(self, key: str):
+        await self.r.delete(self.prefix + key)
+    async def purge(self) -> int:
+        # la expiración es nativa; sólo se cuentan las llaves propias (la BD puede compartirse)
+        n = 0
+        async for _ in self.r.scan_iter(match=self.prefix + "*", count=1000):
+            n += 1
+        dedupe_size.labels(self.kind).set(n)
+        return n
+    async def recent(self, since: float, limit: int) -> List[str]:
+        # sin hora de registro: todas las vigentes (el TTL nativo ya acota)
+        out = []
+        async for k in self.r.scan_iter(match=self.prefix + "*", count=1000):
+            out.append((k.decode() if isinstance(k, bytes) else k)[len(self.prefix):])
+            if len(out) >= limit:
+                break
+        return out
+
+def _exact() -> Dedupe:
+    kind, ttl = settings.DEDUPE_BACKEND, settings.DEDUPE_TTL_SECONDS
+    if kind == "memory":
+        return MemoryDedupe(ttl, settings.DEDUPE_MAX_KEYS)
+    if kind == "store":
+        return StoreDedupe(ttl)
+    if kind == "redis":
+        return RedisDedupe(settings.REDIS_URL, ttl, settings.DEDUPE_REDIS_PREFIX)
+    raise ValueError(f"DEDUPE_BACKEND desconocido: {kind!r}")
+
+def make_dedupe() -> Dedupe:
+    exact = _exact()
+    if not settings.DEDUPE_BLOOM:
+        return exact
+    from services.bloom import BloomDedupe, RotatingBloom
+    return BloomDedupe(exact, RotatingBloom(settings.DEDUPE_BLOOM_HORIZON, settings.DEDUPE_BLOOM_SLICES,
+                                            settings.DEDUPE_BLOOM_CAPACITY, settings.DEDUPE_BLOOM_FP),
+                       settings.DEDUPE_BLOOM_HORIZON, settings.DEDUPE_BLOOM_CAPACITY, settings.DEDUPE_TTL_SECONDS)
+
+dedupe = make_dedupe()
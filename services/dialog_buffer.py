@@ -0,0 +1,65 @@
+import threading
+from collections import OrderedDict, deque
+from typing import Callable, Dict, List, Optional
+from monitoring import dialog_buffer_reads, dialog_buffer_size
+
+Loader = Callable[[str, int], List[str]]
+
+class DialogBuffer:
+    """Últimos `turns` renglones ("role: text") por wa_id en memoria. Se calienta desde disco
+    la primera vez que se pide un wa_id y después se alimenta con cada log_turn."""
+    def __init__(self, name: str, turns: int, max_convos: int, loader: Loader):
+        self.name = name
+        self.turns = turns
+        self.max_convos = max_convos
+        self._load = loader
+        self._d: "OrderedDict[str, deque]" = OrderedDict()
+        # wa_id -> [generación, cargas en curso]; append/invalidate suben la generación y una
+        # carga sólo entra al buffer si la generación no cambió mientras leía de disco
+        self._warming: Dict[str, List[int]] = {}
+        self._mu = threading.Lock()
+
+    def recent(self, wa_id: str, limit: int) -> Optional[List[str]]:
+        """None si `limit` excede lo que guardamos (el caller va a disco)."""
+        if limit > self.turns:
+            return None
+        with self._mu:
+            buf = self._d.get(wa_id)
+            if buf is not None:
+                self._d.move_to_end(wa_id)
+                dialog_buffer_reads.labels(self.name, "hit").inc()
+                return list(buf)[-limit:] if limit > 0 else []
+            w = self._warming.setdefault(wa_id, [0, 0])
+            w[1] += 1
+            gen = w[0]
+        dialog_buffer_reads.labels(self.name, "warm").inc()
+        rows = None
+        try:
+            rows = self._load(wa_id, self.turns)
+        finally:
+            with self._mu:
+                w = self._warming[wa_id]
+                if rows is not None and w[0] == gen and wa_id not in self._d:
+                    self._d[wa_id] = deque(rows, maxlen=self.turns)
+                    while len(self._d) > self.max_convos:
+                        self._d.popitem(last=False)
+                    dialog_buffer_size.labels(self.name).set(len(self._d))
+                w[1] -= 1
+                if w[1] == 0:
+                    del self._warming[wa_id]
+        return rows[-limit:] if limit > 0 else []
+
+    def append(self, wa_id: str, line: str):
+        with self._mu:
+            buf = self._d.get(wa_id)
+            if buf is not None:
+                buf.append(line)
+            elif wa_id in self._warming:
+                self._warming[wa_id][0] += 1
+
+    def invalidate(self, wa_id: str):
+        with self._mu:
+            self._d.pop(wa_id, None)
+            if wa_id in self._warming:
+                self._warming[wa_id][0] += 1
+            dialog_buffer_size.labels(self.name).set(len(self._d))
@@ -0,0 +1,65 @@
+import httpx
+from typing import Dict
+from core.config import settings
+from monitoring import http_requests, http_connects, http_reuse_ratio, http_pool_saturation
+
+class _MeteredTransport(httpx.AsyncHTTPTransport):
+    """Transport con keep-alive que cuenta conexiones nuevas vs. requests (ratio de reuso)
+    y muestrea qué tan lleno está el pool antes de cada request."""
+    def __init__(self, name: str, limits: httpx.Limits, **kw):
+        super().__init__(limits=limits, **kw)
+        self.name = name
+        self.max = limits.max_connections or 1
+        self.requests = 0
+        self.connects = 0
+
+    async def _trace(self, event: str, info: dict):
+        if event == "connection.connect_tcp.complete":
+            self.connects += 1
+            http_connects.labels(self.name).inc()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        pool = getattr(self, "_pool", None)
+        if pool is not None:
+            busy = sum(1 for c in pool.connections if not c.is_idle())
+            http_pool_saturation.labels(self.name).set(busy / self.max)
+        request.extensions = {**request.extensions, "trace": self._trace}
+        self.requests += 1
+        http_requests.labels(self.name).inc()
+        try:
+            return await super().handle_async_request(request)
+        finally:
+            http_reuse_ratio.labels(self.name).set(1 - self.connects / self.requests)
+
+def _make(name: str) -> httpx.AsyncClient:
+    if name == "openai":
+        base, timeout = "https://api.openai.com/v1", settings.HTTP_TIMEOUT_OPENAI
+        headers = {"Authorization": f"Bearer {settings.OPENAI_API_KEY}"}
+    elif name == "graph":
+        base, timeout = f"https://graph.facebook.com/{settings.GRAPH_VER}", settings.HTTP_TIMEOUT_GRAPH
+        headers = {"Authorization": f"Bearer {settings.WHATSAPP_TOKEN}"}
+    else:
+        raise KeyError(name)
+    limits = httpx.Limits(max_connections=settings.HTTP_MAX_CONNECTIONS,
+                          max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE,
+                          keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY)
+    transport = _MeteredTransport(name, limits, http2=settings.HTTP2, retries=1)
+    return httpx.AsyncClient(base_url=base, headers=headers, timeout=timeout, transport=transport)
+
+_CLIENTS: Dict[str, httpx.AsyncClient] = {}
+
+def client(name: str) -> httpx.AsyncClient:
+    """Cliente compartido por host ('openai' | 'graph'); vive lo que vive la app."""
+    c = _CLIENTS.get(name)
+    if c is None or c.is_closed:
+        c = _CLIENTS[name] = _make(name)
+    return c
+
+async def start():
+    for name in ("openai", "graph"):
+        client(name)
+
+async def close():
+    for c in list(_CLIENTS.values()):
+        await c.aclose()
+    _CLIENTS.clear()
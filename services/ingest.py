@@ -0,0 +1,90 @@
+import asyncio, time
+from typing import Any, Awaitable, Callable, List, Optional
+from core.config import settings
+from monitoring import ingest_depth, ingest_enqueued, ingest_rejected, ingest_wait, ingest_process
+
+# El handler puede devolver un awaitable con el trabajo que sigue después (p.ej. el turno ya
+# encolado en la fila de su wa_id); el mensaje ocupa su lugar en la cola hasta que termine.
+Handler = Callable[[Any], Awaitable[Optional[Awaitable]]]
+
+class IngestQueue:
+    """Cola acotada en memoria + pool de workers para procesar mensajes fuera del webhook.
+    `maxsize` cuenta los mensajes aceptados y aún no terminados, no sólo los que esperan en la
+    cola: si los turnos se acumulan en las filas por wa_id, `offer` rechaza (503) igual."""
+    def __init__(self, maxsize: int, workers: int):
+        self.maxsize = maxsize
+        self.workers = workers
+        self._q: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._handler: Optional[Handler] = None
+        self._open = 0                      # aceptados sin terminar (en cola o en su fila)
+        self._idle: Optional[asyncio.Event] = None
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self, handler: Handler):
+        if self.running:
+            return
+        self._handler = handler
+        self._q = asyncio.Queue()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._tasks = [asyncio.create_task(self._worker(i), name=f"ingest-{i}")
+                       for i in range(self.workers)]
+
+    def offer(self, item: Any) -> bool:
+        """Encola sin bloquear. False si ya hay `maxsize` mensajes sin terminar (backpressure)."""
+        if self._open >= self.maxsize:
+            ingest_rejected.inc()
+            return False
+        self._q.put_nowait((time.monotonic(), item))
+        self._open += 1
+        self._idle.clear()
+        ingest_enqueued.inc()
+        ingest_depth.set(self._open)
+        return True
+
+    def _finish(self, t0: float, *_):
+        ingest_process.observe(time.monotonic() - t0)
+        self._open -= 1
+        ingest_depth.set(self._open)
+        if self._open == 0:
+            self._idle.set()
+
+    async def _worker(self, n: int):
+        while True:
+            t_in, item = await self._q.get()
+            t0 = time.monotonic()
+            ingest_wait.observe(t0 - t_in)
+            pending = None
+            try:
+                pending = await self._handler(item)
+            except Exception as e:
+                print(f"ERROR ingest-{n}:", repr(e))
+            if pending is None:
+                self._finish(t0)
+            else:
+                asyncio.ensure_future(pending).add_done_callback(lambda f, t0=t0: self._finish(t0))
+
+    async def stop(self, timeout: float) -> List[Any]:
+        """Espera (hasta `timeout` s) a que terminen los mensajes aceptados y apaga los workers.
+        Devuelve los que seguían en la cola sin tomar, para que el caller los libere."""
+        if not self.running:
+            return []
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            print("WARN ingest: drain timeout, sin terminar:", self._open)
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        left = []
+        while not self._q.empty():
+            left.append(self._q.get_nowait()[1])
+            self._finish(time.monotonic())
+        return left
+
+ingest = IngestQueue(settings.INGEST_QUEUE_MAX, settings.INGEST_WORKERS)
@@ -0,0 +1,91 @@
+import json, re
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+from services.text_norm import normalize
+
+ROOT = Path(__file__).resolve().parents[1]
+
+class _Node:
+    __slots__ = ("children", "key")
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        self.key: Optional[int] = None
+
+def _tok(ch: str) -> str:
+    return r"\w*" if ch == "*" else r"\s" if ch == " " else re.escape(ch)
+
+def _emit(node: _Node) -> str:
+    alts = [_tok(ch) + _emit(child) for ch, child in sorted(node.children.items())]
+    if node.key is not None:
+        alts.append(f"(?P<k{node.key}>)")     # marca vacía: lastgroup dice qué palabra fue
+    return alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+
+class IntentEngine:
+    """Todas las intents en una sola regex compilada sobre el texto normalizado: una pasada
+    por mensaje sin importar cuántas intents o palabras clave haya. Palabras con '*' al final
+    son prefijos; whole=true exige que el mensaje completo sea la frase."""
+    def __init__(self, spec: Dict[str, Any]):
+        self.typos: Dict[str, str] = spec.get("typos", {})
+        self.priority: Dict[str, int] = {}
+        self.replies: Dict[str, str] = {}
+        self._owner: Dict[str, str] = {}          # "k12" -> intent
+        for it in spec["intents"]:
+            name = it["name"]
+            self.priority[name] = it.get("priority", 0)
+            if it.get("reply"):
+                self.replies[name] = it["reply"]
+        words, whole = self._trie(spec, False), self._trie(spec, True)
+        self._words = re.compile(r"\b(?:" + _emit(words) + r")\b") if words.children else None
+        self._whole = re.compile(_emit(whole)) if whole.children else None
+
+    def _trie(self, spec: Dict[str, Any], whole: bool) -> _Node:
+        """Alternación factorizada como trie: los prefijos comunes se comparan una sola vez, así
+        el costo casi no crece con el número de palabras (a diferencia de a|b|c|... plano)."""
+        root = _Node()
+        for it in spec["intents"]:
+            if bool(it.get("whole")) != whole:
+                continue
+            for kw in it["keywords"]:
+                key = len(self._owner)
+                self._owner[f"k{key}"] = it["name"]
+                node = root
+                for ch in kw:
+                    node = node.children.setdefault(ch, _Node())
+                if node.key is not None:
+                    # la marca es una sola por nodo: la segunda intent se tragaría a la primera
+                    raise ValueError(f"palabra clave repetida {kw!r}: "
+                                     f"{self._owner[f'k{node.key}']} y {it['name']}")
+                node.key = key
+        return root
+
+    @classmethod
+    def load(cls, path: str) -> "IntentEngine":
+        p = Path(path)
+        if not p.is_absolute():
+            p = ROOT / p
+        return cls(json.loads(p.read_text(encoding="utf-8")))
+
+    def normalize(self, text: str) -> str:
+        """Sin acentos/puntuación/letras repetidas y con typos comunes corregidos."""
+        return " ".join(self.typos.get(t, t) for t in normalize(text).split())
+
+    def classify(self, text: str) -> List[str]:
+        """Intents presentes, de mayor a menor prioridad."""
+        return sorted(self.match(self.normalize(text)), key=self.priority.__getitem__, reverse=True)
+
+    def match(self, norm: str) -> Set[str]:
+        """Intents en un texto ya normalizado."""
+        hits: Set[str] = set()
+        if self._words:
+            hits.update(self._owner[m.lastgroup] for m in self._words.finditer(norm))
+        if self._whole:
+            m = self._whole.fullmatch(norm)
+            if m:
+                hits.add(self._owner[m.lastgroup])
+        return hits
+
+    def best(self, text: str, with_reply: bool = False) -> Optional[str]:
+        for name in self.classify(text):
+            if not with_reply or name in self.replies:
+                return name
+        return None
@@ -0,0 +1,288 @@
+import hashlib, heapq, math, re, threading, time
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from core.config import settings
+from services.text_norm import normalize
+from monitoring import kb_search_seconds, kb_reloads, kb_loads, kb_chunks
+
+ROOT = Path(__file__).resolve().parents[1]
+KB_DIR = ROOT / "KB"
+
+class FAQ(NamedTuple):
+    label: str       # "faq:<slug de la pregunta>", estable mientras no cambie la pregunta
+    question: str
+    answer: str
+
+_Q = re.compile(r"^\*\*(.+?)\*\*\s*$")
+
+def load_faq(path: Path = KB_DIR / "faq.md") -> List[FAQ]:
+    """Pares pregunta/respuesta de faq.md: `**pregunta**` seguida de su respuesta."""
+    out: List[FAQ] = []
+    q, body = None, []
+    def flush():
+        if q and body:
+            slug = "-".join(normalize(q).split())[:40]
+            out.append(FAQ(f"faq:{slug}", q, "\n".join(body).strip()))
+    for line in path.read_text(encoding="utf-8").splitlines():
+        m = _Q.match(line.strip())
+        if m:
+            flush()
+            q, body = m.group(1).strip(), []
+        elif q and line.strip():
+            body.append(line.strip())
+    flush()
+    return out
+
+_SECTION = re.compile(r"^##\s+(.+?)\s*\((\w+)\)\s*$")
+
+def load_sections(path: Path = KB_DIR / "politica.md") -> Dict[str, Tuple[str, str]]:
+    """Secciones `## Título (llave)` de politica.md -> {llave: (título, texto)}."""
+    out: Dict[str, Tuple[str, str]] = {}
+    key, title, body = None, "", []
+    def flush():
+        if key and body:
+            out[key] = (title, " ".join(body))
+    for line in path.read_text(encoding="utf-8").splitlines():
+        m = _SECTION.match(line.strip())
+        if m:
+            flush()
+            title, key, body = m.group(1), m.group(2), []
+        elif key and line.strip():
+            body.append(line.strip())
+    flush()
+    return out
+
+# ---------- fragmentos ----------
+
+class Chunk(NamedTuple):
+    source: str      # "faq.md#2", "politica.md#pricing"...
+    text: str
+
+_ITEM = re.compile(r"^\s*(\d+[\).]|[-*])\s+")
+
+def chunk_markdown(name: str, text: str) -> List[Chunk]:
+    """Un fragmento por párrafo; en listas, uno por renglón (son ideas sueltas)."""
+    out: List[Chunk] = []
+    for para in re.split(r"\n\s*\n", text):
+        lines = [l.strip() for l in para.splitlines() if l.strip()]
+        if not lines:
+            continue
+        if all(_ITEM.match(l) for l in lines):
+            out += [Chunk(f"{name}#{len(out) + i}", l) for i, l in enumerate(lines)]
+        else:
+            out.append(Chunk(f"{name}#{len(out)}", " ".join(lines)))
+    return out
+
+def chunk_yaml(name: str, text: str) -> List[Chunk]:
+    """Un fragmento por llave de primer nivel, con su bloque indentado."""
+    out: List[Chunk] = []
+    block: List[str] = []
+    for line in text.splitlines() + ["~"]:
+        if line.strip() and not line[0].isspace() and block:
+            key = block[0].split(":", 1)[0]
+            out.append(Chunk(f"{name}#{key}", " ".join(l.strip() for l in block)))
+            block = []
+        if line.strip():
+            block.append(line)
+    return out
+
+# ---------- BM25 ----------
+
+_STOP = frozenset(("a al como con de del el en es la las lo los me mi o para pero por que se si "
+                   "su sus te tu un una y ya yo le les nos mas muy hay eso esta este visa").split())
+
+def terms(text: str) -> List[str]:
+    """Palabras normalizadas sin vacías, con un stem tosco: sin plural y cortadas a 5 letras
+    ("citas" -> "cita", "documentos" -> "docum", "renovación"/"renovar" -> "renov")."""
+    out = []
+    for w in normalize(text).split():
+        if w in _STOP:
+            continue
+        if len(w) > 3 and w.endswith("s"):
+            w = w[:-1]
+        out.append(w[:5])
+    return out
+
+class BM25:
+    """Índice invertido en memoria. Como tf y la longitud de cada fragmento no cambian, el peso
+    BM25 de cada (término, fragmento) se calcula al construir: buscar es sumar listas cortas."""
+    def __init__(self, chunks: List[Chunk], k1: float = 1.2, b: float = 0.75):
+        self.chunks = chunks
+        docs = [terms(c.text) for c in chunks]
+        avg = sum(map(len, docs)) / max(1, len(docs)) or 1.0
+        tf: Dict[str, Dict[int, int]] = {}
+        for i, d in enumerate(docs):
+            for t in d:
+                tf.setdefault(t, {})
+                tf[t][i] = tf[t].get(i, 0) + 1
+        n = len(docs)
+        self.postings: Dict[str, List[Tuple[int, float]]] = {}
+        for t, per_doc in tf.items():
+            idf = math.log(1 + (n - len(per_doc) + 0.5) / (len(per_doc) + 0.5))
+            self.postings[t] = [(i, idf * f * (k1 + 1) / (f + k1 * (1 - b + b * len(docs[i]) / avg)))
+                                for i, f in per_doc.items()]
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    def search(self, query: str, k: int) -> List[Tuple[float, Chunk]]:
+        scores: Dict[int, float] = {}
+        for t in set(terms(query)):
+            for i, w in self.postings.get(t, ()):
+                scores[i] = scores.get(i, 0.0) + w
+        best = heapq.nlargest(k, scores.items(), key=lambda kv: kv[1])
+        return [(s, self.chunks[i]) for i, s in best]
+
+# ---------- KB con recarga en caliente ----------
+
+def kb_files(root: Path = KB_DIR) -> List[Path]:
+    return sorted([*root.glob("*.md"), *root.glob("*.yaml"), *root.glob("examples/*.md")])
+
+def source_stamp(root: Path = KB_DIR) -> List[List]:
+    """[ruta relativa, mtime_ns, tamaño] de cada archivo del KB: barato, sin leer contenido."""
+    return [[str(p.relative_to(root)), p.stat().st_mtime_ns, p.stat().st_size] for p in kb_files(root)]
+
+def content_hash(root: Path = KB_DIR) -> str:
+    """sha256 del contenido (ruta relativa + bytes) de los archivos del KB, independiente de mtimes."""
+    h = hashlib.sha256()
+    for p in kb_files(root):
+        h.update(str(p.relative_to(root)).encode() + b"\0")
+        h.update(p.read_bytes() + b"\0")
+    return h.hexdigest()
+
+# llaves de politica.md que usan los prompts (ai_seller, main.py) y KB/intents.json
+REQUIRED_SECTIONS = ("pricing", "process", "docs", "tiempos")
+
+def check_sections(texts) -> None:
+    missing = set(REQUIRED_SECTIONS) - texts.keys()
+    if missing:
+        raise ValueError(f"politica.md sin secciones: {sorted(missing)}")
+
+class Snapshot:
+    """Lo que se leyó del KB en una pasada: índice, datos autorizados, respuestas del FAQ y la
+    huella del contenido (`digest`), que entra en las llaves de caché."""
+    def __init__(self, texts: Dict[str, str], answers: Dict[str, str], index, digest: str,
+                 stamp: tuple = (), source: str = "sources", sources: tuple = ()):
+        self.texts = texts
+        self.answers = answers
+        self.index = index          # BM25 (desde fuentes) o MappedIndex (artefacto)
+        self.digest = digest
+        self.stamp = stamp
+        self.source = source
+        self.sources = sources      # source_stamp() con el que se compiló el artefacto
+
+    @classmethod
+    def from_sources(cls, root: Path = KB_DIR, stamp: tuple = (), digest: Optional[str] = None) -> "Snapshot":
+        sections = load_sections(root / "politica.md")
+        check_sections(sections)
+        faq = load_faq(root / "faq.md")
+
+        chunks = [Chunk(f"politica.md#{k}", f"{title}: {v}") for k, (title, v) in sections.items()]
+        chunks += [Chunk(f"faq.md#{f.label[4:]}", f"{f.question} {f.answer}") for f in faq]
+        for p in kb_files(root):
+            if p.name in ("politica.md", "faq.md"):
+                continue
+            text = p.read_text(encoding="utf-8")
+            name = str(p.relative_to(root))
+            chunks += chunk_yaml(name, text) if p.suffix == ".yaml" else chunk_markdown(name, text)
+        return cls({k: v for k, (_, v) in sections.items()}, {f.label: f.answer for f in faq},
+                   BM25(chunks), digest or content_hash(root), stamp)
+
+class Knowledge:
+    """KB indexado. Si `artifact` (salida de `python -m services.kb_artifact build`) existe y
+    corresponde al contenido actual se mapea en memoria; si no, se indexa desde los archivos.
+    Revisa mtimes a lo más cada `check_every` s (en la llamada, sin hilos) y recarga si algo
+    cambió; si la recarga falla se sigue sirviendo la versión anterior."""
+    def __init__(self, root: Path = KB_DIR, check_every: float = 5.0, artifact: Optional[Path] = None):
+        self.root = root
+        self.check_every = check_every
+        self.artifact = artifact
+        self._snap: Optional[Snapshot] = None
+        self._checked = 0.0
+        self._failed: Optional[tuple] = None     # versión que no se pudo cargar: no reintentar
+        self._mu = threading.Lock()
+
+    def _stamp(self) -> tuple:
+        files = kb_files(self.root)
+        if self.artifact is not None and self.artifact.exists():
+            files.append(self.artifact)
+        return tuple((str(p), p.stat().st_mtime_ns, p.stat().st_size) for p in files)
+
+    def _load(self, stamp: tuple) -> Snapshot:
+        digest = None
+        if self.artifact is not None and self.artifact.exists():
+            from services.kb_artifact import load_artifact
+            try:
+                snap = load_artifact(self.artifact)
+                check_sections(snap.texts)
+                # mismas fuentes (ruta, mtime, tamaño) que al compilar: no hace falta leerlas
+                # todas para hashear; si difieren (p. ej. checkout nuevo) se compara el contenido
+                if snap.sources == tuple(map(tuple, source_stamp(self.root))):
+                    snap.stamp = stamp
+                    return snap
+                digest = content_hash(self.root)
+                if snap.digest == digest:
+                    snap.stamp = stamp
+                    return snap
+                print("KB: artefacto desactualizado", self.artifact,
+                      "- indexando desde KB/; corre `python -m services.kb_artifact build`")
+            except Exception as e:
+                # cualquier artefacto ilegible cae a las fuentes, también en la primera carga
+                print("ERROR artefacto KB:", repr(e))
+        return Snapshot.from_sources(self.root, stamp, digest)
+
+    def current(self) -> Snapshot:
+        if self._snap is not None and time.monotonic() - self._checked < self.check_every:
+            return self._snap
+        with self._mu:
+            if self._snap is None or time.monotonic() - self._checked >= self.check_every:
+                self._checked = time.monotonic()
+                stamp = self._stamp()
+                if self._snap is None:
+                    self._snap = self._load(stamp)      # se llama al arrancar: sin KB válido no arrancamos
+                    kb_loads.labels(self._snap.source).inc()
+                elif stamp != self._snap.stamp and stamp != self._failed:
+                    try:
+                        self._snap = self._load(stamp)
+                        kb_loads.labels(self._snap.source).inc()
+                        kb_reloads.labels("ok").inc()
+                    except Exception as e:
+                        self._failed = stamp
+                        kb_reloads.labels("error").inc()
+                        print("ERROR recarga KB:", repr(e))
+                kb_chunks.set(len(self._snap.index))
+        return self._snap
+
+    def texts(self) -> Dict[str, str]:
+        return self.current().texts
+
+    def digest(self) -> str:
+        return self.current().digest
+
+    def search(self, text: str, k: int) -> List[Chunk]:
+        snap = self.current()
+        t0 = time.perf_counter()
+        hits = snap.index.search(text or "", k) if k > 0 else []
+        kb_search_seconds.observe(time.perf_counter() - t0)
+        return [c for _, c in hits]
+
+    def snippets(self, text: str, k: Optional[int] = None) -> List[str]:
+        return [c.text for c in self.search(text, settings.KB_TOP_K if k is None else k)]
+
+    def context(self, text: str, prev: str = "", k: Optional[int] = None) -> List[str]:
+        """Fragmentos para el prompt. Se busca con la última línea del asesor (`prev`) + el texto
+        del cliente, así "sí" o "¿y para mi esposa?" heredan el tema de la pregunta; y la
+        política de precios va siempre, aunque la búsqueda no la traiga."""
+        hits = self.snippets(f"{prev}\n{text}" if prev else text, k)
+        pricing = self.texts().get("pricing")
+        if pricing and not any(pricing in h for h in hits):
+            hits.insert(0, pricing)
+        return hits
+
+def _artifact_path() -> Optional[Path]:
+    if not settings.KB_ARTIFACT:
+        return None
+    path = Path(settings.KB_ARTIFACT)
+    return path if path.is_absolute() else ROOT / path
+
+knowledge = Knowledge(KB_DIR, settings.KB_RELOAD_SECONDS, _artifact_path())
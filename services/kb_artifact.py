@@ -0,0 +1,174 @@
+import argparse, heapq, json, mmap, os, struct, sys, time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from services.kb import KB_DIR, ROOT, BM25, Chunk, Snapshot, content_hash, source_stamp, terms
+
+# Artefacto binario del KB: encabezado + secciones contiguas, little-endian, pensado para mmap.
+# Los arreglos numéricos se leen directo de las páginas mapeadas (memoryview.cast), así que
+# los workers de uvicorn comparten la misma copia en el page cache en vez de tener cada uno
+# su propio índice en el heap.
+MAGIC = b"BOTYKB\0\0"
+FORMAT = 1
+SECTIONS = ("meta", "chunk_off", "chunk_blob", "term_off", "term_blob", "post_off", "post_doc", "post_w")
+_HEAD = struct.Struct("<8sI32s" + "QQ" * len(SECTIONS))
+_SEP = "\x1f"           # separa fuente y texto dentro de cada fragmento
+_ARRAYS = ("chunk_off", "term_off", "post_off", "post_doc", "post_w")    # uint32 / float32
+
+def _offsets(blobs: List[bytes]) -> Tuple[bytes, bytes]:
+    off, pos = [0], 0
+    for b in blobs:
+        pos += len(b)
+        off.append(pos)
+    return struct.pack(f"<{len(off)}I", *off), b"".join(blobs)
+
+def write_artifact(snap: Snapshot, path: Path, root: Path = KB_DIR) -> int:
+    """Serializa un Snapshot construido desde fuentes. Escribe a un temporal y renombra: los
+    procesos que ya mapearon la versión anterior la siguen leyendo sin problema. Guarda también
+    (ruta, mtime, tamaño) de las fuentes: si no cambiaron, al cargar no hace falta re-hashearlas."""
+    index: BM25 = snap.index
+    meta = json.dumps({"texts": snap.texts, "answers": snap.answers, "built_at": int(time.time()),
+                       "sources": source_stamp(root)}, ensure_ascii=False).encode()
+    chunk_off, chunk_blob = _offsets([f"{c.source}{_SEP}{c.text}".encode() for c in index.chunks])
+    names = sorted(index.postings, key=str.encode)        # orden de bytes, como la búsqueda binaria
+    term_off, term_blob = _offsets([t.encode() for t in names])
+    docs, weights, post = [], [], [0]
+    for t in names:
+        for i, w in index.postings[t]:
+            docs.append(i)
+            weights.append(w)
+        post.append(len(docs))
+    parts = [meta, chunk_off, chunk_blob, term_off, term_blob,
+             struct.pack(f"<{len(post)}I", *post), struct.pack(f"<{len(docs)}I", *docs),
+             struct.pack(f"<{len(weights)}f", *weights)]
+
+    table, pos = [], _HEAD.size
+    for b in parts:
+        pos += (-pos) % 4                                  # arreglos alineados a 4 bytes
+        table += [pos, len(b)]
+        pos += len(b)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(_HEAD.pack(MAGIC, FORMAT, bytes.fromhex(snap.digest), *table))
+        for (off, _), b in zip(zip(table[::2], table[1::2]), parts):
+            f.write(b"\0" * (off - f.tell()))
+            f.write(b)
+        size = f.tell()
+    os.replace(tmp, path)
+    return size
+
+class MappedIndex:
+    """Misma búsqueda que BM25 pero sobre el artefacto mapeado: los términos se ubican por
+    búsqueda binaria en el bloque ordenado y los pesos ya vienen calculados."""
+    def __init__(self, mm: mmap.mmap, table: Dict[str, memoryview]):
+        self._mm = mm               # mantiene vivo el mapeo mientras haya vistas
+        self._chunk_off = table["chunk_off"].cast("I")
+        self._chunk_blob = table["chunk_blob"]
+        self._term_off = table["term_off"].cast("I")
+        self._term_blob = table["term_blob"]
+        self._post_off = table["post_off"].cast("I")
+        self._post_doc = table["post_doc"].cast("I")
+        self._post_w = table["post_w"].cast("f")
+
+    def __len__(self) -> int:
+        return len(self._chunk_off) - 1
+
+    def check(self):
+        """Coherencia de los arreglos (O(1)); ValueError si no cuadran."""
+        terms_n = len(self._term_off) - 1
+        ok = (len(self._chunk_off) >= 1 and terms_n >= 0
+              and self._chunk_off[-1] <= len(self._chunk_blob)
+              and self._term_off[-1] <= len(self._term_blob)
+              and len(self._post_off) == terms_n + 1
+              and len(self._post_doc) == len(self._post_w) == self._post_off[-1])
+        if not ok:
+            raise ValueError("artefacto corrupto (índices inconsistentes)")
+
+    def chunk(self, i: int) -> Chunk:
+        raw = bytes(self._chunk_blob[self._chunk_off[i]:self._chunk_off[i + 1]]).decode()
+        source, _, text = raw.partition(_SEP)
+        return Chunk(source, text)
+
+    def _find(self, term: bytes) -> int:
+        lo, hi = 0, len(self._term_off) - 1
+        off, blob = self._term_off, self._term_blob
+        while lo < hi:
+            mid = (lo + hi) // 2
+            t = blob[off[mid]:off[mid + 1]].tobytes()
+            if t < term:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(off) - 1 and blob[off[lo]:off[lo + 1]].tobytes() == term:
+            return lo
+        return -1
+
+    def search(self, query: str, k: int) -> List[Tuple[float, Chunk]]:
+        scores: Dict[int, float] = {}
+        for t in set(terms(query)):
+            j = self._find(t.encode())
+            if j < 0:
+                continue
+            a, b = self._post_off[j], self._post_off[j + 1]
+            for i, w in zip(self._post_doc[a:b], self._post_w[a:b]):
+                scores[i] = scores.get(i, 0.0) + w
+        best = heapq.nlargest(k, scores.items(), key=lambda kv: kv[1])
+        return [(s, self.chunk(i)) for i, s in best]
+
+def load_artifact(path: Path) -> Snapshot:
+    """Mapea el artefacto (sólo lectura). ValueError si no es un artefacto de este formato."""
+    if sys.byteorder != "little":
+        raise ValueError("el artefacto del KB es little-endian")
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if len(mm) < _HEAD.size:
+        raise ValueError(f"artefacto truncado: {path}")
+    head = _HEAD.unpack_from(mm, 0)
+    magic, fmt, digest, table = head[0], head[1], head[2], head[3:]
+    if magic != MAGIC or fmt != FORMAT:
+        raise ValueError(f"formato de artefacto desconocido: {path}")
+    if any(off + n > len(mm) for off, n in zip(table[::2], table[1::2])):
+        raise ValueError(f"artefacto truncado: {path}")
+    layout = dict(zip(SECTIONS, zip(table[::2], table[1::2])))
+    if any(layout[s][0] % 4 or layout[s][1] % 4 for s in _ARRAYS):
+        raise ValueError(f"artefacto corrupto (arreglos desalineados): {path}")
+    view = memoryview(mm)
+    sections = {name: view[off:off + n] for name, (off, n) in layout.items()}
+    try:
+        meta = json.loads(bytes(sections.pop("meta")))
+        texts, answers, sources = meta["texts"], meta["answers"], meta.get("sources", [])
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"artefacto corrupto (meta): {path}: {e!r}") from e
+    index = MappedIndex(mm, sections)
+    index.check()
+    return Snapshot(texts, answers, index, digest.hex(), source="artifact",
+                    sources=tuple(map(tuple, sources)))
+
+def main(argv: Optional[List[str]] = None):
+    from core.config import settings
+    ap = argparse.ArgumentParser(prog="python -m services.kb_artifact",
+                                 description="Compila KB/ a un índice binario mapeable (build-kb).")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="indexa KB/ y escribe el artefacto")
+    b.add_argument("--kb", default=str(KB_DIR))
+    b.add_argument("--out", default=settings.KB_ARTIFACT or "models/kb.bin")
+    i = sub.add_parser("info", help="muestra versión y tamaño de un artefacto")
+    i.add_argument("path", nargs="?", default=settings.KB_ARTIFACT or "models/kb.bin")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "build":
+        out = Path(args.out) if Path(args.out).is_absolute() else ROOT / args.out
+        t0 = time.perf_counter()
+        snap = Snapshot.from_sources(Path(args.kb))
+        size = write_artifact(snap, out, Path(args.kb))
+        print(f"{len(snap.index)} fragmentos, {len(snap.index.postings)} términos, {size:,} bytes "
+              f"en {(time.perf_counter() - t0) * 1e3:.1f} ms -> {out}")
+        print(f"sha256 {snap.digest}")
+        return
+    path = Path(args.path) if Path(args.path).is_absolute() else ROOT / args.path
+    snap = load_artifact(path)
+    state = "al día" if snap.digest == content_hash(KB_DIR) else "DESACTUALIZADO respecto a KB/"
+    print(f"{path}: {len(snap.index)} fragmentos, {path.stat().st_size:,} bytes, sha256 {snap.digest} ({state})")
+
+if __name__ == "__main__":
+    main()
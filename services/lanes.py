@@ -0,0 +1,158 @@
+import asyncio, threading, time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+from core.config import settings
+from monitoring import lane_depth, lane_active, lane_wait
+
+Job = Callable[[], Awaitable[None]]
+Dropped = Callable[[], Awaitable[None]]
+
+class _Lane:
+    __slots__ = ("lock", "users", "jobs", "task")
+    def __init__(self, lock):
+        self.lock = lock
+        self.users = 0
+        self.jobs: Deque[Tuple[float, Job, asyncio.Future, Optional[Dropped]]] = deque()
+        self.task: Optional[asyncio.Task] = None
+
+class Lanes:
+    """Serializa turnos por llave (wa_id): misma llave en orden FIFO, llaves distintas en paralelo.
+    `submit` encola en la fila de la llave y regresa; una sola tarea por llave la drena, así quien
+    encola (los workers de ingesta) nunca se queda esperando un turno ajeno. `limit` acota cuántos
+    jobs de `submit` corren a la vez entre todas las llaves. `hold` toma el mismo candado para
+    código que ya corre en su propia tarea (ráfagas, entregas humanas).
+    El estado de una llave se borra en cuanto no queda nadie esperando."""
+    kind = "async"
+
+    def __init__(self, limit: Optional[int] = None):
+        self._lanes: Dict[str, _Lane] = {}
+        self._slots = asyncio.Semaphore(limit) if limit else None
+        self._dropped: List[Dropped] = []
+
+    def _enter(self, key: str, lock_factory) -> _Lane:
+        lane = self._lanes.get(key)
+        if lane is None:
+            lane = self._lanes[key] = _Lane(lock_factory())
+            lane_active.labels(self.kind).inc()
+        lane.users += 1
+        lane_depth.labels(self.kind).inc()
+        return lane
+
+    def _leave(self, key: str, lane: _Lane):
+        lane.users -= 1
+        lane_depth.labels(self.kind).dec()
+        if lane.users == 0 and self._lanes.get(key) is lane:
+            del self._lanes[key]
+            lane_active.labels(self.kind).dec()
+
+    @asynccontextmanager
+    async def hold(self, key: str):
+        lane = self._enter(key, asyncio.Lock)   # asyncio.Lock despierta en orden de llegada
+        t0 = time.monotonic()
+        try:
+            async with lane.lock:
+                lane_wait.labels(self.kind).observe(time.monotonic() - t0)
+                yield
+        finally:
+            self._leave(key, lane)
+
+    def submit(self, key: str, job: Job, dropped: Optional[Dropped] = None) -> asyncio.Future:
+        """Encola `job` en la fila de `key` sin esperar. El future se resuelve cuando el job
+        termina, aunque falle (el error ya se registró). Si `drain` lo cancela antes de terminar, se llama `dropped`."""
+        lane = self._enter(key, asyncio.Lock)
+        fut = asyncio.get_running_loop().create_future()
+        lane.jobs.append((time.monotonic(), job, fut, dropped))
+        if lane.task is None:
+            lane.task = asyncio.create_task(self._drain(key, lane), name=f"lane-{key}")
+        return fut
+
+    async def _run(self, job: Job):
+        if self._slots is None:
+            return await job()
+        async with self._slots:
+            return await job()
+
+    async def _drain(self, key: str, lane: _Lane):
+        try:
+            while lane.jobs:
+                t0, job, fut, dropped = lane.jobs.popleft()
+                try:
+                    async with lane.lock:
+                        lane_wait.labels(self.kind).observe(time.monotonic() - t0)
+                        await self._run(job)
+                    fut.set_result(None)
+                except asyncio.CancelledError:
+                    fut.cancel()
+                    if dropped is not None:
+                        self._dropped.append(dropped)
+                    raise
+                except Exception as e:
+                    print(f"ERROR lane {key}:", repr(e))
+                    fut.set_result(None)
+                finally:
+                    self._leave(key, lane)
+        finally:
+            lane.task = None
+
+    async def drain(self, timeout: float):
+        """Espera (hasta `timeout` s) a que se vacíen las filas; lo que quede se cancela y se
+        avisa a su `dropped` (p.ej. para liberar el wamid y que Meta lo reintente)."""
+        tasks = [l.task for l in self._lanes.values() if l.task is not None]
+        if tasks:
+            done, pending = await asyncio.wait(tasks, timeout=timeout)
+            if pending:
+                print("WARN lanes: drain timeout, filas pendientes:", len(pending))
+                for t in pending:
+                    t.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+        for key, lane in list(self._lanes.items()):
+            while lane.jobs:
+                _, _, fut, dropped = lane.jobs.popleft()
+                fut.cancel()
+                if dropped is not None:
+                    self._dropped.append(dropped)
+                self._leave(key, lane)
+        dropped, self._dropped = self._dropped, []
+        for r in await asyncio.gather(*(d() for d in dropped), return_exceptions=True):
+            if isinstance(r, Exception):
+                print("ERROR lanes dropped:", repr(r))
+
+    def __len__(self):
+        return len(self._lanes)
+
+class _Ticket:
+    __slots__ = ("cond", "next", "serving")
+    def __init__(self, mu):
+        self.cond = threading.Condition(mu)
+        self.next = 0
+        self.serving = 0
+
+class ThreadLanes(Lanes):
+    """Variante para workers con hilos (Flask). Usa turnos numerados para respetar el orden
+    de llegada; threading.Lock no garantiza FIFO."""
+    kind = "thread"
+
+    def __init__(self):
+        super().__init__()
+        self._mu = threading.Lock()
+
+    @contextmanager
+    def hold(self, key: str):
+        t0 = time.monotonic()
+        with self._mu:
+            lane = self._enter(key, lambda: _Ticket(self._mu))
+            t = lane.lock
+            ticket = t.next; t.next += 1
+            while t.serving != ticket:
+                t.cond.wait()
+        lane_wait.labels(self.kind).observe(time.monotonic() - t0)
+        try:
+            yield
+        finally:
+            with self._mu:
+                t.serving += 1
+                t.cond.notify_all()
+                self._leave(key, lane)
+
+lanes = Lanes(settings.INGEST_WORKERS)     # turnos con LLM a la vez, como el pool de ingesta
@@ -0,0 +1,10 @@
+import asyncio
+from monitoring import loop_lag
+
+async def watch(interval: float):
+    """Mide cuánto tarde despierta el loop respecto a lo pedido; >0 = algo bloqueó el loop."""
+    loop = asyncio.get_running_loop()
+    while True:
+        t0 = loop.time()
+        await asyncio.sleep(interval)
+        loop_lag.observe(max(loop.time() - t0 - interval, 0.0))
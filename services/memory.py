@@ -1,60 +1,41 @@
-import os, json, sqlite3, time
+import os, json, time
 from typing import Any, Dict, List, Tuple
 from core.config import settings
+from services.db import get_store
+from services.slot_cache import SlotCache
+from services.dialog_buffer import DialogBuffer
+from services.migrations import migrate
+from services.slots import SLOT_TEMPLATE
 
 DB_PATH = settings.DB_PATH
 
-def _conn():
-    con = sqlite3.connect(DB_PATH, check_same_thread=False)
-    con.execute("PRAGMA journal_mode=WAL;")
-    return con
+def _db():
+    return get_store(DB_PATH)
 
 def _init():
-    con = _conn()
-    con.executescript("""
-    CREATE TABLE IF NOT EXISTS slots (
-      wa_id TEXT PRIMARY KEY,
-      json  TEXT NOT NULL,
-      updated_at INTEGER NOT NULL
-    );
-    CREATE TABLE IF NOT EXISTS messages (
-      id INTEGER PRIMARY KEY AUTOINCREMENT,
-      wa_id TEXT NOT NULL,
-      role TEXT NOT NULL,  -- user|assistant|system
-      text TEXT NOT NULL,
-      ts   INTEGER NOT NULL
-    );
-    """)
-    con.commit(); con.close()
+    migrate(_db())
 _init()
 
-SLOT_TEMPLATE: Dict[str, Any] = {
-    "contact_name": None,
-    "stage": "new",  # new|ask_name|ask_need|dialog|cierre|escalado
-    "visa_type": None, "purpose":"turismo",
-    "persons_count": None, "employment_status": None, "monthly_income_mxn": None,
-    "assets": None, "debts": None, "passports_ready": None,
-    "travel_month": None, "stay_length_days": None,
-    "previous_visa": None, "previous_visa_expiry": None,
-    "legal_issues": None, "city": None,
-    "contact_email": None, "contact_phone": None,
-    "interested_in_renewal": None, "interested_in_expedite": None,
-    "last_intent": None, "last_question": None, "last_answered_at": None
-}
+_cache = SlotCache("memory", settings.SLOT_CACHE_SIZE, settings.SLOT_CACHE_TTL)
 
-def load_slots(wa_id: str) -> Dict[str, Any]:
-    con = _conn()
-    row = con.execute("SELECT json FROM slots WHERE wa_id=?", (wa_id,)).fetchone()
-    con.close()
-    if not row:
-        return json.loads(json.dumps(SLOT_TEMPLATE))
+def _parse(raw: str) -> Dict[str, Any]:
+    # plantilla aplicada una vez; sus valores son escalares, basta copia superficial
     try:
-        data = json.loads(row[0])
-        for k,v in SLOT_TEMPLATE.items():
-            data.setdefault(k, v)
-        return data
+        return {**SLOT_TEMPLATE, **json.loads(raw)}
     except Exception:
-        return json.loads(json.dumps(SLOT_TEMPLATE))
+        return dict(SLOT_TEMPLATE)
+
+def load_slots(wa_id: str) -> Dict[str, Any]:
+    s = _cache.get(wa_id)
+    if s is not None:
+        return s
+    row = _db().one("SELECT json FROM slots WHERE wa_id=?", (wa_id,))
+    s = _parse(row[0]) if row else dict(SLOT_TEMPLATE)
+    _cache.put(wa_id, s, only_if_absent=True)
+    return s
+
+def invalidate_slots(wa_id: str):
+    _cache.invalidate(wa_id)
 
 def merge_slots(wa_id: str, new: Dict[str, Any]) -> Dict[str, Any]:
     s = load_slots(wa_id)
@@ -64,26 +45,39 @@ def merge_slots(wa_id: str, new: Dict[str, Any]) -> Dict[str, Any]:
             if s.get(k) != v:
                 s[k] = v; changed = True
     if changed:
-        con = _conn()
-        con.execute(
+        _db().execute(
             "INSERT INTO slots(wa_id,json,updated_at) VALUES(?,?,?) "
             "ON CONFLICT(wa_id) DO UPDATE SET json=excluded.json, updated_at=excluded.updated_at",
             (wa_id, json.dumps(s, ensure_ascii=False), int(time.time()))
         )
-        con.commit(); con.close()
+        _cache.put(wa_id, s)
     return s
 
+def insert_turn(con, wa_id: str, role: str, text: str) -> int:
+    """INSERT del turno dentro de una operación del Store; quien llama avisa luego a note_turn."""
+    return con.execute("INSERT INTO messages(wa_id,role,text,ts) VALUES(?,?,?,?)",
+                       (wa_id, role, text, int(time.time()))).lastrowid
+
+def note_turn(wa_id: str, role: str, text: str):
+    _dialog.append(wa_id, f"{role}: {text}")
+
 def log_turn(wa_id: str, role: str, text: str):
-    con = _conn()
-    con.execute("INSERT INTO messages(wa_id,role,text,ts) VALUES(?,?,?,?)",
-                (wa_id, role, text, int(time.time())))
-    con.commit(); con.close()
+    _db().execute(lambda con: insert_turn(con, wa_id, role, text))
+    note_turn(wa_id, role, text)
 
-def recent_dialog(wa_id: str, limit: int = 10) -> List[str]:
-    con = _conn()
-    rows = con.execute(
+def forget_turn(wa_id: str):
+    """Tras borrar un turno ya registrado: el buffer de ese wa_id se vuelve a leer de la BD."""
+    _dialog.invalidate(wa_id)
+
+def _dialog_from_db(wa_id: str, limit: int) -> List[str]:
+    rows = _db().query(
         "SELECT role||': '||text FROM messages WHERE wa_id=? ORDER BY id DESC LIMIT ?",
         (wa_id, limit)
-    ).fetchall()
-    con.close()
+    )
     return list(reversed([r[0] for r in rows]))
+
+_dialog = DialogBuffer("memory", settings.DIALOG_BUFFER_TURNS, settings.DIALOG_BUFFER_CONVOS, _dialog_from_db)
+
+def recent_dialog(wa_id: str, limit: int = 10) -> List[str]:
+    rows = _dialog.recent(wa_id, limit)
+    return rows if rows is not None else _dialog_from_db(wa_id, limit)
@@ -0,0 +1,35 @@
+from typing import Any, Dict, List, Optional, Tuple
+from services.backend import backend
+
+# Misma API que services.memory pero awaitable y sobre el backend configurado
+# (STORAGE_BACKEND): SQLite corre en un executor, Postgres con pool async.
+
+async def load_slots(wa_id: str) -> Dict[str, Any]:
+    return await backend().load_slots(wa_id)
+
+async def merge_slots(wa_id: str, new: Dict[str, Any]) -> Dict[str, Any]:
+    return await backend().merge_slots(wa_id, new)
+
+async def log_turn(wa_id: str, role: str, text: str):
+    await backend().log_turn(wa_id, role, text)
+
+async def recent_dialog(wa_id: str, limit: int = 10) -> List[str]:
+    return await backend().recent_dialog(wa_id, limit)
+
+async def load_summary(wa_id: str) -> Optional[str]:
+    row = await backend().load_summary(wa_id)
+    return row[0] if row else None
+
+async def dialog_context(wa_id: str, limit: int = 10, tail_max: int = 200) -> Tuple[Optional[str], List[str]]:
+    """(resumen, historial). Con resumen, el historial es todo lo posterior a lo que éste cubre
+    (upto_id), sin huecos aunque el resumen vaya atrasado; el presupuesto de tokens del prompt
+    recorta lo más viejo. Sin resumen, los últimos `limit`."""
+    b = backend()
+    row = await b.load_summary(wa_id)
+    if not row:
+        return None, await b.recent_dialog(wa_id, limit)
+    text, upto = row
+    rows = await b.dialog_after(wa_id, upto, tail_max)
+    if len(rows) >= tail_max:           # resumen muy atrasado: quedarse con lo más nuevo
+        return text, await b.recent_dialog(wa_id, tail_max)
+    return text, [line for _, line in rows]
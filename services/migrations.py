@@ -0,0 +1,81 @@
+from typing import List, Tuple
+from services.db import Store
+
+# (versión, SQL). Se aplican en orden sobre PRAGMA user_version; nunca editar una ya publicada.
+MIGRATIONS: List[Tuple[int, str]] = [
+    (1, """
+    CREATE TABLE IF NOT EXISTS slots (
+      wa_id TEXT PRIMARY KEY,
+      json  TEXT NOT NULL,
+      updated_at INTEGER NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS messages (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      wa_id TEXT NOT NULL,
+      role TEXT NOT NULL,  -- user|assistant|system
+      text TEXT NOT NULL,
+      ts   INTEGER NOT NULL
+    );
+    """),
+    (2, """
+    CREATE INDEX IF NOT EXISTS idx_messages_wa_id_id ON messages(wa_id, id);
+    """),
+    (3, """
+    CREATE TABLE IF NOT EXISTS dedupe (
+      key TEXT PRIMARY KEY,
+      expires_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_dedupe_expires ON dedupe(expires_at);
+    CREATE TABLE IF NOT EXISTS overrides (
+      wa_id TEXT PRIMARY KEY,
+      expires_at REAL NOT NULL,
+      reply TEXT            -- NULL mientras el humano no conteste
+    );
+    """),
+    (4, """
+    CREATE TABLE IF NOT EXISTS summaries (
+      wa_id TEXT PRIMARY KEY,
+      text  TEXT NOT NULL,
+      upto_id INTEGER NOT NULL,   -- último messages.id ya resumido
+      updated_at INTEGER NOT NULL
+    );
+    """),
+    (5, """
+    CREATE TABLE IF NOT EXISTS outbox (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      key TEXT NOT NULL UNIQUE,    -- idempotencia: "<wamid entrante>:<parte>", "read:<wamid>"...
+      wa_id TEXT NOT NULL,
+      kind TEXT NOT NULL,          -- text|read
+      body TEXT NOT NULL,          -- texto, o el wamid a marcar leído
+      log_text TEXT,               -- lo que se registra en messages al entregarse (NULL = nada)
+      status TEXT NOT NULL,        -- pending|sending|sent|dead
+      attempts INTEGER NOT NULL DEFAULT 0,
+      next_at REAL NOT NULL,       -- pending: no antes de; sending: vence el lease
+      last_error TEXT,
+      provider_id TEXT,            -- wamid que devuelve Graph
+      created_at REAL NOT NULL,
+      sent_at REAL
+    );
+    CREATE INDEX IF NOT EXISTS idx_outbox_status_next ON outbox(status, next_at);
+    CREATE INDEX IF NOT EXISTS idx_outbox_wa_id_id ON outbox(wa_id, id);
+    CREATE VIEW IF NOT EXISTS outbox_dead AS
+      SELECT id, key, wa_id, kind, body, attempts, last_error, created_at
+      FROM outbox WHERE status = 'dead';
+    """),
+    (6, """
+    -- la respuesta se registra en messages al encolarse (orden de la conversación); si la fila
+    -- termina en dead-letter se borra ese mensaje, y si se reintenta se vuelve a registrar
+    ALTER TABLE outbox ADD COLUMN msg_id INTEGER;
+    """),
+]
+
+def migrate(store: Store) -> int:
+    """Lleva la BD a la última versión; cada migración corre en su propia transacción."""
+    def run(con):
+        cur = con.execute("PRAGMA user_version").fetchone()[0]
+        for ver, sql in MIGRATIONS:
+            if ver > cur:
+                con.executescript(f"BEGIN;\n{sql}\nPRAGMA user_version={ver};\nCOMMIT;")
+                cur = ver
+        return cur
+    return store.alone(run)
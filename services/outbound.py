@@ -0,0 +1,226 @@
+import asyncio, concurrent.futures, threading, time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+from core.config import settings
+from monitoring import outbound_depth, outbound_wait, outbound_send, outbound_sent
+
+Send = Callable[[str, Any], Awaitable[Any]]     # (wa_id, payload): texto, o id de fila del outbox
+
+class TokenBucket:
+    """Límite global de envíos: `rate` por segundo con ráfagas de hasta `burst`. rate <= 0 = sin límite."""
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.t = time.monotonic()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.t) * self.rate)
+            self.t = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class _Item:
+    __slots__ = ("payload", "delay", "fut")
+    def __init__(self, payload: Any, delay: float, fut: asyncio.Future):
+        self.payload = payload
+        self.delay = delay
+        self.fut = fut
+
+class _Peer:
+    __slots__ = ("items", "handle")
+    def __init__(self):
+        self.items: Deque[_Item] = deque()
+        self.handle: Optional[asyncio.TimerHandle] = None
+
+class Dispatcher:
+    """Envíos salientes: un mensaje en vuelo por destinatario (FIFO), límite global con token
+    bucket y `workers` envíos concurrentes. `delay` cuenta desde que el mensaje llega al frente de
+    su fila (p. ej. 0.6 s después del anterior al mismo número) y se espera con un timer del loop."""
+    def __init__(self, name: str, rate: float, burst: int, workers: int):
+        self.name = name
+        self.workers = workers
+        self.bucket = TokenBucket(rate, burst)
+        self._send: Optional[Send] = None
+        self._peers: Dict[str, _Peer] = {}
+        self._ready: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._pending = 0
+        self._idle: Optional[asyncio.Event] = None
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self, send: Send):
+        if self.running:
+            return
+        self._send = send
+        self._ready = asyncio.Queue()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._tasks = [asyncio.create_task(self._worker(i), name=f"outbound-{self.name}-{i}")
+                       for i in range(self.workers)]
+
+    def submit(self, wa_id: str, payload: Any, delay: float = 0.0) -> asyncio.Future:
+        """Encola sin esperar; el future se resuelve con lo que devuelva `send` al salir el mensaje."""
+        fut = asyncio.get_running_loop().create_future()
+        fut.add_done_callback(lambda f: f.cancelled() or f.exception())    # ya se registró el error
+        peer = self._peers.get(wa_id)
+        if peer is None:
+            peer = self._peers[wa_id] = _Peer()
+        peer.items.append(_Item(payload, max(0.0, delay), fut))
+        self._pending += 1
+        self._idle.clear()
+        outbound_depth.labels(self.name).set(self._pending)
+        if len(peer.items) == 1:
+            self._arm(wa_id, peer)
+        return fut
+
+    async def send(self, wa_id: str, text: str, delay: float = 0.0) -> Any:
+        """Encola y espera a que salga. Sin start() (scripts, pruebas) envía directo."""
+        if not self.running:
+            if delay > 0:
+                await asyncio.sleep(delay)
+            return await self._send_direct(wa_id, text)
+        return await self.submit(wa_id, text, delay)
+
+    async def _send_direct(self, wa_id: str, text: str) -> Any:
+        from services.whatsapp import send_text
+        return await (self._send or send_text)(wa_id, text)
+
+    def _arm(self, wa_id: str, peer: _Peer):
+        # el frente de la fila queda listo ya o cuando venza su retraso
+        delay = peer.items[0].delay
+        if delay > 0:
+            loop = asyncio.get_running_loop()
+            peer.handle = loop.call_later(delay, self._ready.put_nowait, (wa_id, loop.time() + delay))
+        else:
+            self._ready.put_nowait((wa_id, asyncio.get_running_loop().time()))
+
+    async def _worker(self, n: int):
+        loop = asyncio.get_running_loop()
+        while True:
+            wa_id, due = await self._ready.get()
+            peer = self._peers[wa_id]
+            peer.handle = None
+            item = peer.items[0]
+            await self.bucket.acquire()
+            outbound_wait.labels(self.name).observe(max(0.0, loop.time() - due))
+            t0 = time.monotonic()
+            try:
+                res = await self._send(wa_id, item.payload)
+                outbound_sent.labels(self.name, "ok").inc()
+                if not item.fut.done():
+                    item.fut.set_result(res)
+            except Exception as e:
+                outbound_sent.labels(self.name, "error").inc()
+                print(f"ERROR outbound-{self.name}-{n}:", wa_id, repr(e))
+                if not item.fut.done():
+                    item.fut.set_exception(e)
+            finally:
+                outbound_send.labels(self.name).observe(time.monotonic() - t0)
+                peer.items.popleft()
+                self._pending -= 1
+                outbound_depth.labels(self.name).set(self._pending)
+                if peer.items:
+                    self._arm(wa_id, peer)
+                else:
+                    del self._peers[wa_id]
+                    if not self._pending:
+                        self._idle.set()
+
+    async def stop(self, timeout: float):
+        """Espera (hasta `timeout` s) a que salga lo pendiente, incluidos los programados."""
+        if not self.running:
+            return
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            print(f"WARN outbound-{self.name}: drain timeout, pendientes:", self._pending)
+        for peer in self._peers.values():
+            if peer.handle:
+                peer.handle.cancel()
+            for item in peer.items:
+                item.fut.cancel()
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks, self._peers, self._pending = [], {}, 0
+        outbound_depth.labels(self.name).set(0)
+
+class ThreadedDispatcher:
+    """El mismo Dispatcher corriendo en su propio hilo con event loop, para los workers síncronos
+    de Flask: el request encola y regresa; los retrasos no bloquean el hilo del request. Sin
+    `send`, el Dispatcher lo arranca quien lo use desde el loop del hilo (p. ej. un Outbox)."""
+    def __init__(self, dispatcher: Dispatcher, send: Optional[Callable[[str, str], Any]] = None):
+        self.dispatcher = dispatcher
+        self._send_sync = send
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._mu = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._loop is not None
+
+    async def _send(self, wa_id: str, text: str) -> Any:
+        return await asyncio.to_thread(self._send_sync, wa_id, text)
+
+    def _run(self, ready: threading.Event):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        if self._send_sync is not None:
+            loop.run_until_complete(self.dispatcher.start(self._send))
+        self._loop = loop
+        ready.set()
+        try:
+            loop.run_forever()
+        finally:
+            loop.close()
+
+    def _ensure(self) -> asyncio.AbstractEventLoop:
+        with self._mu:
+            if self._loop is None:
+                ready = threading.Event()
+                self._thread = threading.Thread(target=self._run, args=(ready,), daemon=True,
+                                                name=f"outbound-{self.dispatcher.name}")
+                self._thread.start()
+                ready.wait()
+        return self._loop
+
+    def submit(self, wa_id: str, text: str, delay: float = 0.0) -> "concurrent.futures.Future":
+        """Encola desde cualquier hilo; `.result()` bloquea hasta que sale, si hace falta."""
+        return asyncio.run_coroutine_threadsafe(self.dispatcher.send(wa_id, text, delay), self._ensure())
+
+    def run(self, coro) -> "concurrent.futures.Future":
+        """Corre una corrutina en el loop del hilo (p. ej. arrancar otro Dispatcher ahí)."""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure())
+
+    def call(self, fn: Callable, *args):
+        """Llama `fn(*args)` en el loop del hilo, sin esperar."""
+        self._ensure().call_soon_threadsafe(fn, *args)
+
+    def close(self, timeout: float):
+        """Drena lo encolado (incluidos los retrasos pendientes, hasta `timeout` s), detiene el
+        loop y espera al hilo. Para atexit / salida del worker: el hilo es daemon y sin esto lo
+        pendiente se pierde al reciclar el proceso."""
+        with self._mu:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self.dispatcher.stop(timeout), loop).result(timeout + 5)
+        except Exception as e:
+            print(f"WARN outbound-{self.dispatcher.name}: cierre:", repr(e))
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout=5)
+
+outbound = Dispatcher("api", settings.OUTBOUND_RATE, settings.OUTBOUND_BURST, settings.OUTBOUND_WORKERS)
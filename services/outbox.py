@@ -0,0 +1,126 @@
+import asyncio, random, time, uuid
+from typing import Awaitable, Callable, Optional, Set, Union
+from core.config import settings
+from services.backend import Backend, backend
+from services.outbound import Dispatcher, outbound
+from services.whatsapp import GraphError, HOLD, PERMANENT, send_text
+from monitoring import outbox_results, outbox_errors, outbox_due
+
+Send = Callable[[str, str], Awaitable[Optional[str]]]  # (wa_id, texto) -> wamid; falla con GraphError
+
+class Outbox:
+    """Todo texto saliente (respuestas, followups, avisos) se registra primero en la tabla `outbox`
+    y luego lo entrega el Dispatcher. `key` hace el envío idempotente: reprocesar el mismo wamid
+    entrante no vuelve a mandar su respuesta. Los fallos reintentan con backoff + jitter según la
+    clase de error de Graph; los permanentes o agotados quedan en dead-letter (vista outbox_dead).
+    El texto a registrar entra a messages al encolarse, no al entregarse: así una respuesta que se
+    reintenta no queda después del siguiente mensaje del cliente. Si termina en dead-letter se borra.
+    Las filas que quedaron pendientes al reiniciar las retoma el sondeo. `store` y `send` permiten
+    usar otra BD y otro cliente de Graph (app.py, Flask)."""
+    def __init__(self, dispatcher: Dispatcher, max_attempts: int, base: float, cap: float,
+                 poll_every: float, lease: float, store: Callable[[], Backend] = backend,
+                 send: Optional[Send] = None):
+        self.dispatcher = dispatcher
+        self.store = store
+        self.send_fn = send
+        self.max_attempts = max_attempts
+        self.base = base
+        self.cap = cap
+        self.poll_every = poll_every
+        self.lease = lease
+        self._inflight: Set[int] = set()      # ids ya entregados al dispatcher en este proceso
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        await self.dispatcher.start(self.attempt)
+        if self._task is None:
+            self._task = asyncio.create_task(self._poll_forever(), name="outbox-poll")
+
+    async def stop(self, timeout: float):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.dispatcher.stop(timeout)     # lo que no salga queda pending para el próximo arranque
+
+    def backoff(self, attempts: int) -> float:
+        """Exponencial con "equal jitter": la mitad fija y la otra mitad al azar."""
+        d = min(self.cap, self.base * 2 ** max(0, attempts - 1))
+        return d / 2 + random.uniform(0, d / 2)
+
+    async def put(self, wa_id: str, body: str, key: Optional[str] = None, delay: float = 0.0,
+                  kind: str = "text", log: Union[bool, str] = True) -> Optional[asyncio.Future]:
+        """Registra el envío y lo programa. `log`: True registra `body` en messages (ya, en el orden
+        del diálogo), un str registra ese texto, False nada. None si `key` ya estaba (no se vuelve
+        a mandar ni a registrar)."""
+        log_text = body if log is True else (log or None)
+        delay = max(0.0, delay)
+        id = await self.store().outbox_put(key or f"auto:{uuid.uuid4().hex}", wa_id, kind, body,
+                                        log_text, time.time() + delay)
+        if id is None:
+            outbox_results.labels(kind, "duplicate").inc()
+            return None
+        return self._dispatch(wa_id, id, delay)
+
+    async def send(self, wa_id: str, body: str, key: Optional[str] = None, delay: float = 0.0,
+                   log: Union[bool, str] = True) -> bool:
+        """put + esperar el primer intento. False si no salió ahora (queda en reintento o dead-letter);
+        True también si la llave ya estaba registrada."""
+        fut = await self.put(wa_id, body, key, delay, log=log)
+        return True if fut is None else bool(await fut)
+
+    def _dispatch(self, wa_id: str, id: int, delay: float = 0.0) -> asyncio.Future:
+        self._inflight.add(id)
+        if self.dispatcher.running:
+            return self.dispatcher.submit(wa_id, id, delay)
+        return asyncio.ensure_future(self._direct(wa_id, id, delay))    # sin start(): scripts/pruebas
+
+    async def _direct(self, wa_id: str, id: int, delay: float) -> bool:
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return await self.attempt(wa_id, id)
+
+    async def attempt(self, wa_id: str, id: int) -> bool:
+        """Un intento de entrega (lo llama el Dispatcher, que aplica límite global y FIFO)."""
+        try:
+            row = await self.store().outbox_claim(id, self.lease)
+            if row is None:
+                return False        # ya salió, lo tiene otro worker o espera a un texto anterior
+            kind, body, attempts = row
+            try:
+                provider_id = await (self.send_fn or send_text)(wa_id, body)
+            except Exception as e:
+                err = e.kind if isinstance(e, GraphError) else "TRANSIENT"
+                outbox_errors.labels(err).inc()
+                if err in PERMANENT or (attempts >= self.max_attempts and err not in HOLD):
+                    await self.store().outbox_fail(id, f"{err}: {e}"[:500], None)
+                    outbox_results.labels(kind, "dead").inc()
+                    print("ERROR outbox dead-letter:", id, wa_id, repr(e))
+                else:
+                    # configuración (token, endpoint): reintentar espaciado hasta que la arreglen
+                    wait = self.backoff(self.max_attempts if err in HOLD else attempts)
+                    await self.store().outbox_fail(id, f"{err}: {e}"[:500], time.time() + wait)
+                    outbox_results.labels(kind, "retry").inc()
+                return False
+            await self.store().outbox_sent(id, provider_id)
+            outbox_results.labels(kind, "sent").inc()
+            return True
+        finally:
+            self._inflight.discard(id)
+
+    async def _poll_forever(self):
+        last_purge = 0.0
+        while True:
+            await asyncio.sleep(self.poll_every)
+            try:
+                due = [(id, wa) for id, wa in await self.store().outbox_due(500) if id not in self._inflight]
+                outbox_due.set(len(due))
+                for id, wa_id in due:
+                    self._dispatch(wa_id, id)
+                if time.time() - last_purge > 600:
+                    last_purge = time.time()
+                    await self.store().outbox_purge(time.time() - settings.OUTBOX_KEEP_HOURS * 3600)
+            except Exception as e:
+                print("ERROR outbox poll:", repr(e))
+
+outbox = Outbox(outbound, settings.OUTBOX_MAX_ATTEMPTS, settings.OUTBOX_BACKOFF_BASE,
+                settings.OUTBOX_BACKOFF_CAP, settings.OUTBOX_POLL_SECONDS, settings.OUTBOX_LEASE_SECONDS)
@@ -1,26 +1,114 @@
-import time, queue
-from typing import Dict, Optional
-
-_QUEUES: Dict[str, queue.Queue] = {}
-_TTL: Dict[str, float] = {}
-
-def request_human(wa_id: str, ttl: int = 300) -> Optional[str]:
-    q = _QUEUES.setdefault(wa_id, queue.Queue())
-    _TTL[wa_id] = time.time() + ttl
-    try:
-        return q.get(timeout=ttl)
-    except queue.Empty:
-        _TTL.pop(wa_id, None)
-        return None
-
-def submit_human(wa_id: str, text: str) -> bool:
-    q = _QUEUES.get(wa_id)
-    exp = _TTL.get(wa_id, 0)
-    if not q or time.time() > exp:
-        return False
-    q.put(text); _TTL.pop(wa_id, None)
-    return True
-
-def pending() -> Dict[str, int]:
-    now = time.time()
-    return {k: int(_TTL[k] - now) for k in list(_TTL.keys()) if _TTL[k] > now}
+import asyncio, time
+from typing import Awaitable, Callable, Dict, Optional, Set
+from core.config import settings
+from services.backend import backend
+from services.broker import console
+from monitoring import handoff_events, handoff_timers
+
+# Las ventanas viven en el backend, así que /reply puede caer en cualquier worker: ese worker
+# entrega la respuesta. El vencimiento lo agenda el worker que escaló (o el que arranca después).
+
+Deliver = Callable[[str, str, str], Awaitable[None]]     # (wa_id, texto, llave del outbox)
+
+class Handoffs:
+    """Escalamientos a humano por eventos: escalar abre la ventana y regresa de inmediato, la
+    respuesta se entrega cuando llega /reply y el vencimiento es un timer del loop. No hay hilos
+    ni tareas esperando por conversación; al arrancar se retoman las ventanas guardadas."""
+    def __init__(self):
+        self._deliver: Optional[Deliver] = None
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def start(self, deliver: Deliver):
+        self._deliver = deliver
+        for wa_id, exp, reply in await backend().override_load():
+            if reply is not None:
+                # contestada pero sin entregar (el proceso cayó en medio)
+                self._spawn(self._take_and_deliver(wa_id))
+            else:
+                self._schedule(wa_id, exp)
+
+    async def stop(self):
+        for h in self._timers.values():
+            h.cancel()
+        self._timers.clear()
+        handoff_timers.set(0)
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    async def escalate(self, wa_id: str, ttl: Optional[float] = None):
+        ttl = settings.OVERRIDE_TTL_SECONDS if ttl is None else ttl
+        await backend().override_open(wa_id, ttl)
+        expires_at = time.time() + ttl
+        self._schedule(wa_id, expires_at)
+        handoff_events.labels("escalated").inc()
+        console.publish("escalated", {"wa_id": wa_id, "expires_at": int(expires_at)})
+
+    async def submit(self, wa_id: str, text: str) -> bool:
+        """Registra la respuesta del humano; la entrega corre aparte. False si no hay ventana."""
+        if not await backend().override_submit(wa_id, text):
+            return False
+        h = self._timers.pop(wa_id, None)
+        if h:
+            h.cancel()
+            handoff_timers.set(len(self._timers))
+        self._spawn(self._take_and_deliver(wa_id))
+        return True
+
+    async def pending(self) -> Dict[str, int]:
+        return await backend().override_pending()
+
+    def _schedule(self, wa_id: str, expires_at: float):
+        old = self._timers.pop(wa_id, None)
+        if old:
+            old.cancel()
+        delay = max(0.0, expires_at - time.time())
+        self._timers[wa_id] = asyncio.get_running_loop().call_later(delay, self._fire, wa_id)
+        handoff_timers.set(len(self._timers))
+
+    def _fire(self, wa_id: str):
+        self._timers.pop(wa_id, None)
+        handoff_timers.set(len(self._timers))
+        self._spawn(self._expire(wa_id))
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _expire(self, wa_id: str):
+        try:
+            # condicional: si otro worker renovó la ventana o ya contestaron, no se toca
+            if await backend().override_expire(wa_id):
+                await self._resume(wa_id)
+                handoff_events.labels("expired").inc()
+                console.publish("expired", {"wa_id": wa_id})
+        except Exception as e:
+            print("ERROR handoff expire:", wa_id, repr(e))
+
+    async def _take_and_deliver(self, wa_id: str):
+        if self._deliver is None:
+            return      # queda en el backend; se entrega en el próximo start()
+        try:
+            row = await backend().override_reply(wa_id)
+            if row is None:
+                return
+            text, expires_at = row
+            # primero al outbox y luego se cierra la ventana: si el proceso cae en medio, el
+            # próximo start() la vuelve a entregar y la llave (una por ventana) evita el doble
+            # envío; también si dos workers llegan a la vez
+            await self._deliver(wa_id, text, f"override:{wa_id}:{expires_at}")
+            if await backend().override_take(wa_id) is None:
+                return      # otro worker ya la cerró (y la anunció)
+            await self._resume(wa_id)
+            handoff_events.labels("replied").inc()
+            console.publish("replied", {"wa_id": wa_id, "text": text})
+        except Exception as e:
+            print("ERROR handoff deliver:", wa_id, repr(e))
+
+    async def _resume(self, wa_id: str):
+        # la ventana se cerró: la conversación vuelve al bot. Sin esto "escalado" se queda para
+        # siempre y cada turno sigue yendo a la consola y saltándose la caché de respuestas
+        await backend().merge_slots(wa_id, {"stage": "dialog"})
+
+handoffs = Handoffs()
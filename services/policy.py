@@ -1,35 +1,64 @@
-import re
+import re, time
+from pathlib import Path
 from typing import Optional
+from core.config import settings
+from services.intents import IntentEngine
+from services.classifier import OTHER, Model
+from services.kb import ROOT, knowledge
+from monitoring import classifier_decisions, classifier_seconds
 
-PRICING_TEXT = ("MRV ~185 USD por persona; honorarios desde $1,500 MXN; "
-                "adelanto opcional desde $5,000 MXN (sujeto a cambios).")
-PROCESS_TEXT = "DS-160 → pago MRV → citas CAS/Consulado → acompañamiento hasta la decisión."
-DOCS_TEXT    = "Pasaporte vigente, comprobante de ingresos/empleo o info de negocio, plan tentativo de viaje."
+# patrones en KB/intents.json; se compilan una vez al importar
+intents = IntentEngine.load(settings.INTENTS_PATH)
 
-INTENTS = [
-    ("costos", re.compile(r"\b(costo|cu[aá]nto|precio|tarifa|honorarios|cobra[n]?)\b", re.I)),
-    ("proceso", re.compile(r"\b(proceso|paso|flujo|cita[s]?|ds-?160|mrv)\b", re.I)),
-    ("docs",    re.compile(r"\b(docu|papel|requisito[s]?)\b", re.I)),
-    ("renov",   re.compile(r"\b(renov|venci[oó]|sin entrevista|iw)\b", re.I)),
-]
+def _reply(label: str) -> Optional[str]:
+    """Respuesta fija de un intent con plantilla o de una entrada del FAQ. Los datos
+    ({pricing}, {process}, {docs}) salen de KB/politica.md, releído si cambia."""
+    kb = knowledge.current()
+    if label in intents.replies:
+        return intents.replies[label].format(**kb.texts)
+    return kb.answers.get(label)
 
 def quick_intent_router(wa_id: str, text: str) -> Optional[str]:
     """Respuestas deterministas rápidas. Devuelve None si no matchea."""
-    for label, rx in INTENTS:
-        if rx.search(text or ""):
-            if label == "costos":
-                return f"{PRICING_TEXT}\n¿Para cuántas personas sería?"
-            if label == "proceso":
-                return f"{PROCESS_TEXT}\n¿Ya cuentan con pasaportes?"
-            if label == "docs":
-                return f"{DOCS_TEXT}\n¿Quieres que te mande un checklist breve?"
-            if label == "renov":
-                return "Si tu visa venció hace ≤48 meses podrías aplicar a 'sin entrevista'. ¿Cuándo venció la última?"
-    return None
+    label = intents.best(text or "", with_reply=True)
+    return _reply(label) if label else None
+
+_MODEL: Optional[Model] = None
+
+def load_classifier() -> bool:
+    """Carga el modelo de CLASSIFIER_PATH una vez; sin archivo el desvío queda apagado. Lee y
+    descomprime el archivo: llamarlo al arrancar, fuera del event loop."""
+    global _MODEL
+    if _MODEL is None and settings.CLASSIFIER_PATH:
+        path = Path(settings.CLASSIFIER_PATH)
+        path = path if path.is_absolute() else ROOT / path
+        if not path.exists():
+            print("classifier: sin", path, "- desvío apagado; usa `python -m services.classifier train`")
+            return False
+        try:
+            _MODEL = Model.load(path)
+        except Exception as e:
+            print("ERROR classifier:", path, repr(e))
+    return _MODEL is not None
+
+def deflect(text: str) -> Optional[str]:
+    """Respuesta determinista si el clasificador local está seguro; None = ir al LLM
+    (también mientras no haya modelo cargado)."""
+    model = _MODEL
+    if model is None or not text:
+        return None
+    t0 = time.perf_counter()
+    label, p = model.predict(text)
+    classifier_seconds.observe(time.perf_counter() - t0)
+    reply = _reply(label) if label != OTHER and p >= settings.CLASSIFIER_THRESHOLD else None
+    classifier_decisions.labels("deflect" if reply else "llm").inc()
+    return reply
+
+_MONEY_MXN = re.compile(r"\$\s*\d{5,}")
+_MONEY_USD = re.compile(r"\b\d{3,5}\s*usd\b", re.I)
 
 def grounding(text: str) -> str:
     """Evita números inventados; si detecta montos “raros” reemplaza por política."""
-    import re as _r
-    if _r.search(r"\$\s*\d{5,}", text) or _r.search(r"\b\d{3,5}\s*usd\b", text, _r.I):
-        return PRICING_TEXT
+    if _MONEY_MXN.search(text) or _MONEY_USD.search(text):
+        return knowledge.texts()["pricing"]
     return text
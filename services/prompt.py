@@ -0,0 +1,98 @@
+import json, math
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from monitoring import prompt_tokens, prompt_dialog_dropped, llm_prompt_tokens
+
+Messages = List[Dict[str, str]]
+
+_ENCODE: Optional[Callable[[str], list]] = None
+
+def load_encoder() -> bool:
+    """Carga tiktoken una vez. Puede bajar su vocabulario (bloquea): llamarlo al arrancar, fuera
+    del event loop. Mientras no termine, o si tiktoken no está, count_tokens estima."""
+    global _ENCODE
+    if _ENCODE is None:
+        try:
+            import tiktoken
+            try:
+                enc = tiktoken.get_encoding("o200k_base")
+            except ValueError:
+                enc = tiktoken.get_encoding("cl100k_base")
+            _ENCODE = enc.encode
+        except Exception:
+            _ENCODE = False
+    return bool(_ENCODE)
+
+def _encoder() -> Optional[Callable[[str], list]]:
+    return _ENCODE or None
+
+def count_tokens(text: str) -> int:
+    enc = _encoder()
+    if enc:
+        return len(enc(text))
+    # heurística para español: ~3.5 caracteres por token, palabras largas cuentan de más
+    return math.ceil(len(text) / 3.5) if text else 0
+
+def compact_slots(slots: Dict[str, Any], template: Dict[str, Any]) -> Dict[str, Any]:
+    """Sólo lo que sabemos del cliente: sin nulos/vacíos ni valores iguales a la plantilla."""
+    return {k: v for k, v in (slots or {}).items()
+            if v not in (None, "", [], {}) and template.get(k) != v}
+
+def _msg_tokens(m: Dict[str, str]) -> int:
+    return count_tokens(m["content"]) + 4      # sobrecosto aproximado por mensaje
+
+def build_messages(agent: str, prefix: Messages, slots: Dict[str, Any], template: Dict[str, Any],
+                   dialog: List[str], user_text: str, budget: int,
+                   line_chars: int = 400, summary: Optional[str] = None,
+                   context: Optional[List[str]] = None) -> Tuple[Messages, int]:
+    """Arma el prompt con el prefijo estable primero (system + few-shots, idéntico entre turnos,
+    así el caché de prompts del proveedor lo reutiliza) y lo variable al final. El historial se
+    recorta de lo más viejo a lo más nuevo hasta caber en `budget` tokens; `summary` cubre lo
+    anterior al historial y `context` son fragmentos del KB para este turno. Devuelve
+    (mensajes, tokens estimados)."""
+    slots_msg = {"role": "system",
+                 "content": "Slots: " + json.dumps(compact_slots(slots, template), ensure_ascii=False,
+                                                   separators=(",", ":"))}
+    user_msg = {"role": "user", "content": user_text or ""}
+    summary_msg = {"role": "system", "content": "Resumen de la conversación:\n" + summary} if summary else None
+    context_msg = ({"role": "system", "content": "Información del KB (única fuente de datos):\n"
+                    + "\n".join("- " + c for c in context)} if context else None)
+    fixed = sum(_msg_tokens(m) for m in prefix)
+    used = fixed + _msg_tokens(slots_msg) + _msg_tokens(user_msg) + count_tokens("Historial:\n") + 4
+    if summary_msg:
+        used += _msg_tokens(summary_msg)
+    if context_msg:
+        used += _msg_tokens(context_msg)
+        prompt_tokens.labels(agent, "context").observe(_msg_tokens(context_msg))
+
+    kept: List[str] = []
+    for line in reversed(dialog or []):
+        if len(line) > line_chars:
+            line = line[:line_chars] + "…"
+        cost = count_tokens(line) + 1
+        if used + cost > budget:
+            break
+        kept.append(line)
+        used += cost
+    kept.reverse()
+    if len(kept) < len(dialog or []):
+        prompt_dialog_dropped.labels(agent).inc(len(dialog) - len(kept))
+
+    # el resumen cambia cada N turnos, el KB y los slots casi cada turno: en ese orden tras el prefijo
+    messages = [*prefix, *(m for m in (summary_msg, context_msg) if m), slots_msg]
+    if kept:
+        messages.append({"role": "system", "content": "Historial:\n" + "\n".join(kept)})
+    messages.append(user_msg)
+
+    prompt_tokens.labels(agent, "prefix").observe(fixed)
+    prompt_tokens.labels(agent, "total").observe(used)
+    return messages, used
+
+def record_usage(agent: str, usage: Optional[Dict[str, Any]]):
+    """Tokens reales que reporta OpenAI, incluidos los servidos desde su caché de prompts."""
+    if not usage:
+        return
+    llm_prompt_tokens.labels(agent, "input").inc(usage.get("prompt_tokens", 0))
+    cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0)
+    if cached:
+        llm_prompt_tokens.labels(agent, "cached").inc(cached)
+    llm_prompt_tokens.labels(agent, "output").inc(usage.get("completion_tokens", 0))
@@ -0,0 +1,70 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from core.config import settings
+from services.outbound import Dispatcher
+from monitoring import receipts_marked
+
+MarkRead = Callable[[str, bool], Awaitable[Any]]     # (wamid, typing)
+
+class Receipts:
+    """Acuses de lectura diferidos, fuera del camino de la respuesta. `mark` sólo anota el último
+    wamid de la conversación y arma un timer de `window` s; lo que llegue mientras tanto lo
+    reemplaza, así una ráfaga cuesta un solo llamado a Graph (marcar el último basta para todos).
+    Salen por su propio Dispatcher: no ocupan la fila ni el cupo de los textos. Son de mejor
+    esfuerzo: si uno falla, el siguiente de la conversación lo cubre."""
+    def __init__(self, dispatcher: Dispatcher, window: float, send: Optional[MarkRead] = None):
+        self.dispatcher = dispatcher
+        self.window = window
+        self._send = send
+        self._latest: Dict[str, Tuple[str, bool]] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+
+    async def start(self):
+        await self.dispatcher.start(self._deliver)
+
+    def mark(self, wa_id: str, wamid: Optional[str], typing: bool = False):
+        """No bloquea. `typing` pide además el indicador de "escribiendo…" (se quita al llegar la
+        respuesta o a los ~25 s); ése sale sin esperar la ventana, para que llegue antes que la
+        respuesta, y se lleva el acuse que estuviera pendiente."""
+        if not (wa_id and wamid):
+            return
+        prev = self._latest.get(wa_id)
+        self._latest[wa_id] = (wamid, typing or bool(prev and prev[1]))
+        receipts_marked.labels("collapsed" if prev else "queued").inc()
+        if typing:
+            h = self._timers.pop(wa_id, None)
+            if h:
+                h.cancel()
+            self._flush(wa_id)
+        elif wa_id not in self._timers:
+            self._timers[wa_id] = asyncio.get_running_loop().call_later(self.window, self._flush, wa_id)
+
+    def _flush(self, wa_id: str):
+        self._timers.pop(wa_id, None)
+        item = self._latest.pop(wa_id, None)
+        if item is None:
+            return
+        if self.dispatcher.running:
+            self.dispatcher.submit(wa_id, item)
+        else:
+            asyncio.ensure_future(self._deliver(wa_id, item)).add_done_callback(
+                lambda f: f.cancelled() or f.exception())      # sin start(): scripts/pruebas
+
+    async def _deliver(self, wa_id: str, item: Tuple[str, bool]):
+        wamid, typing = item
+        if self._send is None:
+            from services.whatsapp import mark_as_read
+            return await mark_as_read(wamid, typing)
+        return await self._send(wamid, typing)
+
+    async def stop(self, timeout: float):
+        """Manda ya lo que esperaba su ventana y drena."""
+        for h in self._timers.values():
+            h.cancel()
+        for wa_id in list(self._latest):
+            self._flush(wa_id)
+        self._timers.clear()
+        await self.dispatcher.stop(timeout)
+
+receipts = Receipts(Dispatcher("receipts", settings.RECEIPTS_RATE, settings.RECEIPTS_RATE,
+                               settings.RECEIPTS_WORKERS), settings.RECEIPTS_WINDOW_SECONDS)
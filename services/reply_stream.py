@@ -0,0 +1,88 @@
+import re
+from typing import Optional
+
+_ESC = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+class ReplyScanner:
+    """Lee un objeto JSON que llega en pedazos y va decodificando el valor string de una llave
+    de primer nivel (`reply`) sin esperar a que cierre el objeto. No valida el resto: al
+    terminar el stream se parsea el JSON completo como siempre."""
+    def __init__(self, key: str = "reply"):
+        self.key = key
+        self.text = ""          # lo decodificado hasta ahora del valor
+        self.done = False       # ya cerró la comilla del valor
+        self._depth = 0
+        self._in_str = False
+        self._esc = False
+        self._uni: Optional[str] = None   # hex acumulado de un \uXXXX
+        self._hi = 0                      # primera mitad de un par sustituto (emojis)
+        self._buf = ""          # string (llave) en curso, sólo a profundidad 1
+        self._last_key: Optional[str] = None
+        self._expect_value = False        # vimos `"key":` y falta el valor
+        self._capturing = False
+
+    def feed(self, chunk: str):
+        for ch in chunk:
+            if self._in_str:
+                self._string_char(ch)
+            elif ch == '"':
+                self._in_str = True
+                self._buf = ""
+                self._capturing = self._expect_value and self._depth == 1 and self._last_key == self.key
+                self._expect_value = False
+            elif ch in "{[":
+                self._depth += 1
+                self._expect_value = False
+            elif ch in "}]":
+                self._depth -= 1
+            elif ch == ":" and self._depth == 1:
+                self._expect_value = True
+            elif ch == ",":
+                self._last_key = None
+                self._expect_value = False
+
+    def _string_char(self, ch: str):
+        if self._uni is not None:
+            self._uni += ch
+            if len(self._uni) == 4:
+                cp, self._uni = int(self._uni, 16), None
+                if 0xD800 <= cp < 0xDC00:
+                    self._hi = cp
+                elif 0xDC00 <= cp < 0xE000 and self._hi:
+                    self._emit(chr(0x10000 + ((self._hi - 0xD800) << 10) + (cp - 0xDC00)))
+                    self._hi = 0
+                else:
+                    self._emit(chr(cp))
+        elif self._esc:
+            self._esc = False
+            if ch == "u":
+                self._uni = ""
+            else:
+                self._emit(_ESC.get(ch, ch))
+        elif ch == "\\":
+            self._esc = True
+        elif ch == '"':
+            self._in_str = False
+            if self._capturing:
+                self._capturing = False
+                self.done = True
+            elif self._depth == 1 and not self._expect_value and self._last_key is None:
+                self._last_key = self._buf
+        else:
+            self._emit(ch)
+
+    def _emit(self, ch: str):
+        if self._capturing:
+            self.text += ch
+        elif self._depth == 1:
+            self._buf += ch
+
+# fin de oración: signo final seguido de espacio (evita cortar "3.5" o "B1/B2.")
+_SENTENCE_END = re.compile(r"[.!?…]+[\"”»)]*\s")
+
+def first_sentence(text: str, min_chars: int = 0) -> Optional[str]:
+    """Primera oración completa de `text` con al menos `min_chars`, o None si aún no hay."""
+    for m in _SENTENCE_END.finditer(text):
+        if m.end() >= min_chars:
+            return text[:m.end()].strip()
+    return None
@@ -0,0 +1,86 @@
+import hashlib, re, threading, time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Sequence
+from services.text_norm import normalize
+from monitoring import response_cache_lookups, response_cache_tokens_saved, response_cache_size
+
+# slots que entran a la llave: lo que cambia la respuesta "genérica" del asesor
+KEY_SLOTS = ("stage", "visa_type", "persons_count", "last_question")
+# slots que una respuesta cacheada puede traer; si el LLM extrajo otra cosa (nombre, correo,
+# ingresos...), la respuesta es de esa persona y no se reutiliza
+SAFE_OUT_SLOTS = {"stage", "visa_type", "purpose", "last_intent", "last_question"}
+# temas que pueden terminar en escalamiento: siempre van al LLM
+SENSITIVE_RX = re.compile(r"\b(deport|asilo|fraude|antecedente|abogad|legal|polic|arrest|detenid|castig|"
+                          r"negad|rechaz|queja|supervisor|humano|persona real)", re.I)
+
+def last_assistant(dialog: Sequence[str]) -> str:
+    """Última línea del asesor en el historial ("assistant: ..."), sin el prefijo."""
+    for line in reversed(dialog or ()):
+        if line.startswith("assistant:"):
+            return line[len("assistant:"):].strip()
+    return ""
+
+def prompt_version(*parts: Any) -> str:
+    """Huella del prompt; forma parte de la llave, así que cambiar el prompt invalida todo."""
+    return hashlib.sha1(repr(parts).encode()).hexdigest()[:12]
+
+class ResponseCache:
+    """LRU + TTL de respuestas del LLM para turnos genéricos ("cuánto cuesta", "hola"):
+    llave = texto normalizado + slots de KEY_SLOTS + última línea del asesor + versión del prompt
+    + huella del KB. La línea previa importa: "sí", "no" o "2" significan otra cosa según la
+    pregunta a la que responden."""
+    def __init__(self, name: str, maxsize: int, ttl: float, version: str, max_chars: int = 80):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.version = version
+        self.max_chars = max_chars
+        self._d: "OrderedDict[str, tuple]" = OrderedDict()   # llave -> (expira, out, tokens)
+        self._mu = threading.Lock()
+
+    def key(self, text: str, slots: Dict[str, Any], kb: str = "", prev: str = "") -> Optional[str]:
+        """None = este turno no usa caché (desactivada, texto largo, tema sensible o escalado).
+        `kb` es la huella del contenido del KB: al cambiar el KB las respuestas viejas ya no se sirven.
+        `prev` es la última línea del asesor (last_assistant(dialog))."""
+        if self.maxsize <= 0 or slots.get("stage") == "escalado" or SENSITIVE_RX.search(text or ""):
+            return None
+        norm = normalize(text)
+        if not norm or len(norm) > self.max_chars:
+            return None
+        sig = "|".join(str(slots.get(k)) for k in KEY_SLOTS)
+        return hashlib.sha1(f"{self.version}|{kb}|{sig}|{normalize(prev)}|{norm}".encode()).hexdigest()
+
+    def get(self, key: Optional[str]) -> Optional[Dict[str, Any]]:
+        if key is None:
+            return None
+        with self._mu:
+            hit = self._d.get(key)
+            if hit is not None and hit[0] > time.monotonic():
+                self._d.move_to_end(key)
+                response_cache_lookups.labels(self.name, "hit").inc()
+                response_cache_tokens_saved.labels(self.name).inc(hit[2])
+                return dict(hit[1])
+            if hit is not None:
+                del self._d[key]
+        response_cache_lookups.labels(self.name, "miss").inc()
+        return None
+
+    def put(self, key: Optional[str], out: Dict[str, Any], tokens: int = 0, contact_name: Optional[str] = None):
+        """Guarda `out` (dict de AgentOut) salvo que sea personal o de escalamiento."""
+        if key is None or out.get("escalate_to_human"):
+            return
+        if set(out.get("slots") or {}) - SAFE_OUT_SLOTS:
+            return
+        if contact_name and contact_name.lower() in (out.get("reply") or "").lower():
+            return
+        with self._mu:
+            self._d[key] = (time.monotonic() + self.ttl, dict(out), tokens)
+            self._d.move_to_end(key)
+            while len(self._d) > self.maxsize:
+                self._d.popitem(last=False)
+            response_cache_size.labels(self.name).set(len(self._d))
+
+    def clear(self):
+        with self._mu:
+            self._d.clear()
+            response_cache_size.labels(self.name).set(0)
@@ -0,0 +1,57 @@
+import copy, threading, time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from monitoring import slot_cache_hits, slot_cache_misses, slot_cache_evictions, slot_cache_size
+
+_SCALARS = (str, int, float, bool, type(None))
+
+def _copy(slots: Dict[str, Any]) -> Dict[str, Any]:
+    # copia profunda sólo de los valores anidados (listas/dicts de la IA); los escalares,
+    # que son casi todos, se comparten porque no se pueden mutar
+    return {k: v if isinstance(v, _SCALARS) else copy.deepcopy(v) for k, v in slots.items()}
+
+class SlotCache:
+    """LRU + TTL de slots ya parseados por wa_id. Entrega copias para que nadie mute la entrada."""
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._d: "OrderedDict[str, tuple]" = OrderedDict()   # wa_id -> (expira, slots)
+        self._mu = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._mu:
+            hit = self._d.get(key)
+            if hit is not None:
+                if hit[0] > time.monotonic():
+                    self._d.move_to_end(key)
+                    slot_cache_hits.labels(self.name).inc()
+                    return _copy(hit[1])
+                del self._d[key]
+                slot_cache_evictions.labels(self.name, "ttl").inc()
+                slot_cache_size.labels(self.name).set(len(self._d))
+        slot_cache_misses.labels(self.name).inc()
+        return None
+
+    def put(self, key: str, slots: Dict[str, Any], only_if_absent: bool = False):
+        """Escritura (write-through). Con only_if_absent, una lectura de BD no pisa
+        lo que un merge concurrente ya dejó en caché."""
+        with self._mu:
+            if only_if_absent and key in self._d:
+                return
+            self._d[key] = (time.monotonic() + self.ttl, _copy(slots))
+            self._d.move_to_end(key)
+            while len(self._d) > self.maxsize:
+                self._d.popitem(last=False)
+                slot_cache_evictions.labels(self.name, "lru").inc()
+            slot_cache_size.labels(self.name).set(len(self._d))
+
+    def invalidate(self, key: str):
+        with self._mu:
+            if self._d.pop(key, None) is not None:
+                slot_cache_size.labels(self.name).set(len(self._d))
+
+    def clear(self):
+        with self._mu:
+            self._d.clear()
+            slot_cache_size.labels(self.name).set(0)
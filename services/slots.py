@@ -0,0 +1,15 @@
+from typing import Any, Dict
+
+SLOT_TEMPLATE: Dict[str, Any] = {
+    "contact_name": None,
+    "stage": "new",  # new|ask_name|ask_need|dialog|cierre|escalado
+    "visa_type": None, "purpose":"turismo",
+    "persons_count": None, "employment_status": None, "monthly_income_mxn": None,
+    "assets": None, "debts": None, "passports_ready": None,
+    "travel_month": None, "stay_length_days": None,
+    "previous_visa": None, "previous_visa_expiry": None,
+    "legal_issues": None, "city": None,
+    "contact_email": None, "contact_phone": None,
+    "interested_in_renewal": None, "interested_in_expedite": None,
+    "last_intent": None, "last_question": None, "last_answered_at": None
+}
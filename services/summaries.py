@@ -0,0 +1,90 @@
+import asyncio, time
+from collections import OrderedDict
+from typing import Optional, Set
+from core.config import settings
+from services.backend import backend
+from services.http_clients import client
+from monitoring import summary_runs, summary_seconds
+
+PROMPT = """
+Resume la conversación de un asesor de visas con un cliente para que otro asesor la retome.
+Conserva: qué visa busca, para cuántas personas, fechas, situación laboral/ingresos, dudas
+pendientes, objeciones y acuerdos. Omite saludos y cortesías. Máximo 80 palabras, en español.
+"""
+
+class Summarizer:
+    """Resumen acumulado por wa_id, fuera del camino de respuesta: cada `every` turnos se
+    agenda una tarea que junta el resumen previo + los turnos nuevos y lo reescribe. La cuenta
+    es sólo un disparador (aproximado, LRU de `max_tracked` conversaciones): el prompt no depende
+    de ella porque lleva todo lo posterior al resumen."""
+    def __init__(self, every: int, batch: int = 40, max_tracked: int = 10000):
+        self.every = every
+        self.batch = batch
+        self.max_tracked = max_tracked
+        self._count: "OrderedDict[str, int]" = OrderedDict()
+        self._running: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+    def note(self, wa_id: str, turns: int = 1):
+        """Cuenta turnos registrados; al llegar a `every` dispara el resumen (sin esperar)."""
+        if self.every <= 0:
+            return
+        n = self._count.pop(wa_id, 0) + turns
+        if n < self.every or wa_id in self._running:
+            self._count[wa_id] = n
+            while len(self._count) > self.max_tracked:
+                self._count.popitem(last=False)
+            return
+        self._count.pop(wa_id, None)
+        self._running.add(wa_id)
+        task = asyncio.create_task(self._run(wa_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, wa_id: str):
+        t0 = time.monotonic()
+        try:
+            await self.update(wa_id)
+            summary_runs.labels("ok").inc()
+        except Exception as e:
+            summary_runs.labels("error").inc()
+            print("ERROR summary:", wa_id, repr(e))
+            self._count[wa_id] = max(self._count.get(wa_id, 0), self.every - 1)   # reintentar el próximo turno
+        finally:
+            self._running.discard(wa_id)
+            summary_seconds.observe(time.monotonic() - t0)
+
+    async def update(self, wa_id: str) -> Optional[str]:
+        """Avanza el resumen de `batch` en `batch` líneas hasta alcanzar lo más reciente."""
+        b = backend()
+        prev = await b.load_summary(wa_id)
+        text, upto = prev if prev else ("", 0)
+        while True:
+            rows = await b.dialog_after(wa_id, upto, self.batch)
+            if not rows:
+                return text or None
+            new = await self._summarize(text, rows)
+            if not new:
+                return text or None
+            await b.save_summary(wa_id, new, rows[-1][0])
+            text, upto = new, rows[-1][0]
+            if len(rows) < self.batch:
+                return text
+
+    async def _summarize(self, text: str, rows) -> str:
+        content = (f"Resumen previo:\n{text}\n\n" if text else "") + \
+                  "Turnos nuevos:\n" + "\n".join(line for _, line in rows)
+        r = await client("openai").post("/chat/completions", json={
+            "model": settings.OPENAI_MODEL,
+            "messages": [{"role": "system", "content": PROMPT}, {"role": "user", "content": content}],
+            "temperature": 0.2,
+            "max_tokens": 200,
+        })
+        r.raise_for_status()
+        return (r.json()["choices"][0]["message"]["content"] or "").strip()
+
+    async def drain(self):
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+summarizer = Summarizer(settings.SUMMARY_EVERY_TURNS)
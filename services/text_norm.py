@@ -0,0 +1,27 @@
+import re, unicodedata
+
+# acentos del español con una regex (rápido); lo demás cae a unicodedata
+_ACCENTS = dict(zip("áéíóúüàèìòùâêîôûäëïö", "aeiouuaeiouaeiouaeio"))
+_ACCENT_RX = re.compile("[" + "".join(_ACCENTS) + "]")
+_NON_WORD = re.compile(r"[^\w\s]+")
+_REPEAT = re.compile(r"([a-zñ])\1\1+")     # "holaaa" -> "hola"
+
+def _strip_es(text: str) -> str:
+    text = text.lower()
+    return text if text.isascii() else _ACCENT_RX.sub(lambda m: _ACCENTS[m.group()], text)
+
+def fold(text: str) -> str:
+    """minúsculas y sin acentos (la ñ se conserva)."""
+    text = _strip_es(text or "")
+    if text.replace("ñ", "").isascii():
+        return text
+    text = unicodedata.normalize("NFD", text)
+    text = "".join(c for c in text if unicodedata.category(c) != "Mn" or c == "̃")
+    return unicodedata.normalize("NFC", text)
+
+def normalize(text: str) -> str:
+    """Forma canónica para comparar textos de usuario: sin acentos, puntuación, emojis,
+    letras repetidas ni espacios de más. "¿¿Cuánto cuestaaa??" -> "cuanto cuesta"."""
+    text = _NON_WORD.sub(" ", _strip_es(text or ""))
+    text = _REPEAT.sub(r"\1", fold(text))
+    return " ".join(text.split())
@@ -1,11 +1,10 @@
-import os, re, httpx
-from tenacity import retry, wait_exponential, stop_after_attempt
+import os, re
+from typing import Any, Dict, Optional
+import httpx
 from core.config import settings
+from services.http_clients import client
 
-GRAPH = settings.GRAPH_VER
 PHONE_ID = settings.WHATSAPP_PHONE_ID
-TOKEN = settings.WHATSAPP_TOKEN
-HEAD = {"Authorization": f"Bearer {settings.WA_ACCESS_TOKEN}"}
 
 def normalize_mx(num: str) -> str:
     s = re.sub(r"\D", "", num or "")
@@ -14,30 +13,62 @@ def normalize_mx(num: str) -> str:
     if len(s) == 10: s = "52" + s
     return s
 
-@retry(wait=wait_exponential(min=1, max=8), stop=stop_after_attempt(3))
-async def send_text(to: str, body: str):
-    url = f"https://graph.facebook.com/{GRAPH}/{PHONE_ID}/messages"
+# Clases de error de Graph (mismos nombres que la clasificación de whatsapp.py) y qué hacer con cada una:
+#   TOKEN_EXPIRED / BAD_ENDPOINT   configuración: reintentar espaciado sin agotar intentos
+#   RATE_LIMITED / TRANSIENT        reintentar con backoff
+#   RECIPIENT_NOT_ALLOWED / PERMANENT   no tiene caso reintentar: dead-letter
+_RATE_CODES = {4, 80007, 130429, 131048, 131056}
+_RECIPIENT_CODES = {131030, 131026, 131047, 131051}
+HOLD = {"TOKEN_EXPIRED", "BAD_ENDPOINT"}
+PERMANENT = {"RECIPIENT_NOT_ALLOWED", "PERMANENT"}
+
+class GraphError(Exception):
+    def __init__(self, kind: str, status: int = 0, code: Optional[int] = None, detail: str = ""):
+        super().__init__(f"{kind} status={status} code={code} {detail[:300]}")
+        self.kind = kind
+        self.status = status
+        self.code = code
+
+def classify(status: int, body: Dict[str, Any]) -> str:
+    err = (body or {}).get("error") or {}
+    code, msg = err.get("code"), str(err.get("message", ""))
+    if code == 190 or status == 401:
+        return "TOKEN_EXPIRED"
+    if "Unsupported post request" in msg or (code == 100 and "does not exist" in msg):
+        return "BAD_ENDPOINT"
+    if status == 429 or code in _RATE_CODES:
+        return "RATE_LIMITED"
+    if code in _RECIPIENT_CODES:
+        return "RECIPIENT_NOT_ALLOWED"
+    if status >= 500 or code in (1, 2, 131000, 131016):
+        return "TRANSIENT"
+    return "PERMANENT"
+
+async def _post(payload: dict) -> Dict[str, Any]:
+    try:
+        r = await client("graph").post(f"/{PHONE_ID}/messages", json=payload)
+    except httpx.HTTPError as e:
+        raise GraphError("TRANSIENT", detail=repr(e)) from e
+    try:
+        body = r.json()
+    except ValueError:
+        body = {}
+    if r.status_code != 200:
+        err = body.get("error") or {}
+        raise GraphError(classify(r.status_code, body), r.status_code, err.get("code"), r.text)
+    return body
+
+async def send_text(to: str, body: str) -> Optional[str]:
+    """Un intento; los reintentos los hace services.outbox. Devuelve el wamid del mensaje enviado."""
     payload = {"messaging_product":"whatsapp",
                "to": normalize_mx(to),
                "type":"text",
                "text":{"body": (body or "")[:4096]}}
-    headers = {"Authorization": f"Bearer {TOKEN}", "Content-Type": "application/json"}
-    async with httpx.AsyncClient(timeout=20) as client:
-        r = await client.post(url, headers=headers, json=payload)
-        r.raise_for_status()
-
-async def send_text(to: str, body: str) -> dict:
-    payload = {"messaging_product":"whatsapp","to":to,"type":"text","text":{"body":body}}
-    async with httpx.AsyncClient(timeout=20) as c:
-        r = await c.post(GRAPH, headers={**HEAD, "Content-Type":"application/json"}, json=payload)
-        if r.status_code >= 300:
-            print("WA SEND ERROR:", r.status_code, r.text)
-        return {"status": r.status_code, "body": r.text}
-    
-async def mark_as_read(wamid: str):
-    url = f"https://graph.facebook.com/{GRAPH}/{PHONE_ID}/messages"
+    res = await _post(payload)
+    return ((res.get("messages") or [{}])[0]).get("id")
+
+async def mark_as_read(wamid: str, typing: bool = False):
     payload = {"messaging_product":"whatsapp","status":"read","message_id": wamid}
-    headers = {"Authorization": f"Bearer {TOKEN}", "Content-Type": "application/json"}
-    async with httpx.AsyncClient(timeout=20) as client:
-        r = await client.post(url, headers=headers, json=payload)
-        r.raise_for_status()
+    if typing:
+        payload["typing_indicator"] = {"type": "text"}
+    await _post(payload)
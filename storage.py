@@ -1,32 +1,19 @@
 # storage.py
-import os, json, sqlite3, time
-from typing import Any, Dict, Tuple
+import os, json, time
+from typing import Any, Dict, List, Tuple
+from core.config import settings
+from services.db import get_store
+from services.slot_cache import SlotCache
+from services.dialog_buffer import DialogBuffer
+from services.migrations import migrate
 
 DB_PATH = os.getenv("DB_PATH", "agent.db")
 
-def _conn():
-    con = sqlite3.connect(DB_PATH, check_same_thread=False)
-    con.execute("PRAGMA journal_mode=WAL;")
-    return con
+def _db():
+    return get_store(DB_PATH)
 
 def init_db():
-    con = _conn()
-    con.executescript("""
-    CREATE TABLE IF NOT EXISTS slots (
-      wa_id TEXT PRIMARY KEY,
-      json  TEXT NOT NULL,
-      updated_at INTEGER NOT NULL
-    );
-    CREATE TABLE IF NOT EXISTS messages (
-      id INTEGER PRIMARY KEY AUTOINCREMENT,
-      wa_id TEXT NOT NULL,
-      role TEXT NOT NULL,      -- user|assistant|system
-      text TEXT NOT NULL,
-      ts   INTEGER NOT NULL
-    );
-    """)
-    con.commit()
-    con.close()
+    migrate(_db())
 
 SLOT_TEMPLATE: Dict[str, Any] = {
     "contact_name": None,
@@ -54,20 +41,25 @@ SLOT_TEMPLATE: Dict[str, Any] = {
     "last_answered_at": None
 }
 
-def get_slots(wa_id: str) -> Dict[str, Any]:
-    con = _conn()
-    cur = con.execute("SELECT json FROM slots WHERE wa_id=?", (wa_id,))
-    row = cur.fetchone()
-    con.close()
-    if not row:
-        return json.loads(json.dumps(SLOT_TEMPLATE))
+_cache = SlotCache("storage", settings.SLOT_CACHE_SIZE, settings.SLOT_CACHE_TTL)
+
+def _parse(raw: str) -> Dict[str, Any]:
     try:
-        data = json.loads(row[0])
-        for k, v in SLOT_TEMPLATE.items():
-            data.setdefault(k, v)
-        return data
+        return {**SLOT_TEMPLATE, **json.loads(raw)}
     except Exception:
-        return json.loads(json.dumps(SLOT_TEMPLATE))
+        return dict(SLOT_TEMPLATE)
+
+def get_slots(wa_id: str) -> Dict[str, Any]:
+    s = _cache.get(wa_id)
+    if s is not None:
+        return s
+    row = _db().one("SELECT json FROM slots WHERE wa_id=?", (wa_id,))
+    s = _parse(row[0]) if row else dict(SLOT_TEMPLATE)
+    _cache.put(wa_id, s, only_if_absent=True)
+    return s
+
+def invalidate_slots(wa_id: str):
+    _cache.invalidate(wa_id)
 
 def merge_slots(wa_id: str, new_slots: Dict[str, Any]) -> Dict[str, Any]:
     s = get_slots(wa_id)
@@ -77,31 +69,40 @@ def merge_slots(wa_id: str, new_slots: Dict[str, Any]) -> Dict[str, Any]:
             s[k] = v
             changed = True
     if changed:
-        con = _conn()
-        con.execute(
+        _db().execute(
             "INSERT INTO slots(wa_id,json,updated_at) VALUES(?,?,?) "
             "ON CONFLICT(wa_id) DO UPDATE SET json=excluded.json, updated_at=excluded.updated_at",
             (wa_id, json.dumps(s, ensure_ascii=False), int(time.time()))
         )
-        con.commit()
-        con.close()
+        _cache.put(wa_id, s)
     return s
 
-def log_message(wa_id: str, role: str, text: str):
-    con = _conn()
-    con.execute(
+def insert_turn(con, wa_id: str, role: str, text: str) -> int:
+    """INSERT del turno dentro de una operación del Store (outbox); luego va note_turn."""
+    return con.execute(
         "INSERT INTO messages(wa_id,role,text,ts) VALUES(?,?,?,?)",
         (wa_id, role, text, int(time.time()))
-    )
-    con.commit()
-    con.close()
+    ).lastrowid
 
-def recent_dialog(wa_id: str, limit: int = 10) -> Tuple[str, ...]:
-    con = _conn()
-    cur = con.execute(
+def note_turn(wa_id: str, role: str, text: str):
+    _dialog.append(wa_id, f"{role}: {text}")
+
+def forget_turn(wa_id: str):
+    _dialog.invalidate(wa_id)
+
+def log_message(wa_id: str, role: str, text: str):
+    _db().execute(lambda con: insert_turn(con, wa_id, role, text))
+    note_turn(wa_id, role, text)
+
+def _dialog_from_db(wa_id: str, limit: int) -> List[str]:
+    rows = [r[0] for r in _db().query(
         "SELECT role||': '||text FROM messages WHERE wa_id=? ORDER BY id DESC LIMIT ?",
         (wa_id, limit)
-    )
-    rows = [r[0] for r in cur.fetchall()]
-    con.close()
-    return tuple(reversed(rows))
+    )]
+    return list(reversed(rows))
+
+_dialog = DialogBuffer("storage", settings.DIALOG_BUFFER_TURNS, settings.DIALOG_BUFFER_CONVOS, _dialog_from_db)
+
+def recent_dialog(wa_id: str, limit: int = 10) -> Tuple[str, ...]:
+    rows = _dialog.recent(wa_id, limit)
+    return tuple(rows if rows is not None else _dialog_from_db(wa_id, limit))
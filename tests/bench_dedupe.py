@@ -0,0 +1,59 @@
+import sys, time, tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from services.dedupe import LRUSet
+from services import bloom
+from services.bloom import RotatingBloom
+
+# Compara memoria y costo por consulta: LRUSet (exacto, OrderedDict) vs RotatingBloom.
+# Las N llaves se reparten a lo largo de un horizonte de 24h simulado (en producción el horizonte
+# es el TTL del dedupe; el costo por llave no cambia).
+# Uso: python tests/bench_dedupe.py [N]
+
+HORIZON = 86400.0
+
+class Clock:
+    now = 1_700_000_000.0
+    @classmethod
+    def time(cls): return cls.now
+
+bloom.time = Clock
+
+def wamid(i: int) -> str:
+    return f"wamid.HBgNNTIxODEyODc5Mzg4MhUCABIYFjNFQjA{i:012d}"
+
+def measure(make, add, contains, n: int):
+    tracemalloc.start()
+    s = make()
+    t0 = time.perf_counter()
+    start = Clock.now
+    for i in range(n):
+        Clock.now = start + HORIZON * 0.999 * i / n
+        add(s, wamid(i))
+    t_add = time.perf_counter() - t0
+    mem = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    t0 = time.perf_counter()
+    for i in range(n, 2 * n):      # llaves nuevas: el caso común
+        contains(s, wamid(i))
+    t_new = time.perf_counter() - t0
+    fp = 0
+    for i in range(n, 2 * n):
+        fp += contains(s, wamid(i + n))
+    return mem, t_add / n, t_new / n, fp / n
+
+if __name__ == "__main__":
+    N = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    rows = {
+        "LRUSet": measure(lambda: LRUSet(N), lambda s, k: s.add_if_new(k), lambda s, k: k in s.d, N),
+        "Bloom fp=1e-3": measure(lambda: RotatingBloom(HORIZON, 4, N, 0.001), lambda s, k: s.add(k),
+                                 lambda s, k: k in s, N),
+        "Bloom fp=1e-4": measure(lambda: RotatingBloom(HORIZON, 4, N, 0.0001), lambda s, k: s.add(k),
+                                 lambda s, k: k in s, N),
+    }
+    print(f"N={N:,}")
+    print(f"{'impl':<15}{'mem MB':>10}{'B/id':>8}{'add µs':>9}{'lookup µs':>11}{'fp obs':>9}")
+    for name, (mem, add, look, fp) in rows.items():
+        print(f"{name:<15}{mem / 1e6:>10.1f}{mem / N:>8.1f}{add * 1e6:>9.2f}{look * 1e6:>11.2f}{fp:>9.4f}")
@@ -0,0 +1,88 @@
+import random, re, string, sys, time
+from collections import Counter
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from services.intents import IntentEngine
+
+# Costo por mensaje y tasa de aciertos: regexes en serie (router anterior) vs motor compilado.
+# Uso: python tests/bench_intents.py [repeticiones]
+
+SERIAL = [
+    ("costos", re.compile(r"\b(costo|cu[aá]nto|precio|tarifa|honorarios|cobra[n]?)\b", re.I)),
+    ("proceso", re.compile(r"\b(proceso|paso|flujo|cita[s]?|ds-?160|mrv)\b", re.I)),
+    ("docs",    re.compile(r"\b(docu|papel|requisito[s]?)\b", re.I)),
+    ("renov",   re.compile(r"\b(renov|venci[oó]|sin entrevista|iw)\b", re.I)),
+]
+GREET_RX = re.compile(r"^\s*(hola+|buen[oa]s?\s*(d[ií]as|tardes|noches)?)\s*[!.…]*\s*$", re.I)
+
+# (mensaje, intent esperada o None)
+CORPUS = [
+    ("¿Cuánto cuesta la visa?", "costos"), ("qto cuesta", "costos"), ("cuanto cobran?", "costos"),
+    ("precios porfa", "costos"), ("Kuanto sale el tramite", "costos"), ("cuál es el costo", "costos"),
+    ("Cómo es el proceso?", "proceso"), ("qué pasos siguen", "proceso"), ("ya llené el DS160", "proceso"),
+    ("cuando son las citas", "proceso"), ("como funciona", "proceso"),
+    ("qué documentos ocupo", "docs"), ("Requisitos?", "docs"), ("que papeles necesito", "docs"),
+    ("rekisitos para niños", "docs"), ("documetos", "docs"),
+    ("quiero renovar mi visa", "renov"), ("se me venció en 2022", "renov"), ("renovación sin entrevista", "renov"),
+    ("mi visa ya vencio", "renov"), ("renobar", "renov"),
+    ("Hola", "saludo"), ("holaaa!!", "saludo"), ("Buenas tardes", "saludo"), ("buenos días", "saludo"),
+    ("Soy Karla", "nombre"), ("me llamo Juan Pérez", "nombre"),
+    ("vivo en Monterrey", None), ("somos 3 personas", None), ("trabajo en una empresa desde 2019", None),
+    ("gracias!", None), ("ok perfecto", None), ("en marzo", None), ("sí, me interesa", None),
+]
+
+def serial(text: str):
+    for label, rx in SERIAL:
+        if rx.search(text):
+            return label
+    if GREET_RX.match(text):
+        return "saludo"
+    return None
+
+def bench(fn, reps: int):
+    t0 = time.perf_counter()
+    for _ in range(reps):
+        for text, _ in CORPUS:
+            fn(text)
+    dt = time.perf_counter() - t0
+    got = [(fn(t), want) for t, want in CORPUS]
+    ok = sum(g == w for g, w in got)
+    hits = Counter(g for g, _ in got if g)
+    return dt / (reps * len(CORPUS)), ok / len(CORPUS), hits
+
+def scaling(n_intents: int, reps: int):
+    """Sólo el matching (texto ya normalizado, 8 palabras por intent): N regexes en serie vs
+    la regex única del motor."""
+    rnd = random.Random(n_intents)
+    words = ["".join(rnd.choices(string.ascii_lowercase, k=rnd.randint(4, 9))) for _ in range(n_intents * 8)]
+    spec = {"intents": [{"name": f"i{i}", "keywords": words[i * 8:(i + 1) * 8]} for i in range(n_intents)]}
+    engine = IntentEngine(spec)
+    serial_rx = [re.compile(r"\b(?:" + "|".join(spec["intents"][i]["keywords"]) + r")\b")
+                 for i in range(n_intents)]
+    texts = [engine.normalize(t) for t, _ in CORPUS]
+    def one(fn):
+        t0 = time.perf_counter()
+        for _ in range(reps):
+            for t in texts:
+                fn(t)
+        return (time.perf_counter() - t0) / (reps * len(texts)) * 1e6
+    return (one(lambda t: [rx.search(t) for rx in serial_rx]),
+            one(engine.match))
+
+if __name__ == "__main__":
+    reps = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    engine = IntentEngine.load("KB/intents.json")
+    rows = {"serial regex": bench(serial, reps), "compiled engine": bench(engine.best, reps)}
+    print(f"{len(CORPUS)} mensajes x {reps}")
+    print(f"{'impl':<17}{'µs/msg':>8}{'correctas':>11}  hits")
+    for name, (per, acc, hits) in rows.items():
+        print(f"{name:<17}{per * 1e6:>8.2f}{acc:>10.0%}  {dict(hits)}")
+    misses = [(t, w, engine.best(t)) for t, w in CORPUS if engine.best(t) != w]
+    for t, w, g in misses:
+        print(f"  motor: {t!r} esperaba {w}, dio {g}")
+
+    print("\nsin coincidencias, sólo matching (µs/msg):")
+    for n in (4, 16, 64):
+        ser, comp = scaling(n, max(reps // 10, 50))
+        print(f"  {n:>3} intents  serie {ser:>6.2f}  compilada {comp:>6.2f}")
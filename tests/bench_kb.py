@@ -0,0 +1,49 @@
+import sys, tempfile, time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from services.kb import KB_DIR, Knowledge, Snapshot
+from services.kb_artifact import write_artifact
+
+# Latencia de búsqueda BM25 sobre el KB, desde fuentes (índice en el heap) y desde el artefacto
+# mapeado, y costo de arranque de cada uno (lo que paga cada worker al iniciar o recargar).
+# Uso: python tests/bench_kb.py [N]
+
+QUERIES = ["cuánto cuesta la visa para 3 personas", "qué documentos necesito", "cómo les pago",
+           "cuánto tardan las citas con adelanto", "cuál es el proceso", "hola buenas tardes",
+           "se me venció la visa hace 2 años", "quiero ir a disney con mi esposa y mis hijos"]
+
+def latency(kb: Knowledge, n: int):
+    lat = []
+    for i in range(n):
+        q = QUERIES[i % len(QUERIES)]
+        t0 = time.perf_counter()
+        kb.search(q, 3)
+        lat.append(time.perf_counter() - t0)
+    lat.sort()
+    return lat[n // 2] * 1e6, lat[int(n * .99)] * 1e6
+
+def startup(fn, reps: int = 50) -> float:
+    t0 = time.perf_counter()
+    for _ in range(reps):
+        fn()
+    return (time.perf_counter() - t0) / reps * 1e3
+
+if __name__ == "__main__":
+    N = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    art = Path(tempfile.mkdtemp()) / "kb.bin"
+    size = write_artifact(Snapshot.from_sources(KB_DIR), art)
+    src = Knowledge(KB_DIR, check_every=3600)
+    mapped = Knowledge(KB_DIR, check_every=3600, artifact=art)
+    snap = mapped.current()
+    print(f"fragmentos={len(snap.index)} origen={snap.source} sha256={snap.digest[:12]} artefacto={size:,} B")
+    for q in QUERIES:
+        a, b = [c.source for c in src.search(q, 3)], [c.source for c in mapped.search(q, 3)]
+        print(f"  {q!r:<50} -> {a}{'' if a == b else '  != ' + str(b)}")
+
+    print(f"{'origen':<10}{'p50 µs':>9}{'p99 µs':>9}{'arranque ms':>13}")
+    # arranque = Knowledge.current() completo: incluye revisar mtimes y, si hace falta, hashear KB/
+    for name, kb, load in (("fuentes", src, lambda: Knowledge(KB_DIR, 3600).current()),
+                           ("artefacto", mapped, lambda: Knowledge(KB_DIR, 3600, artifact=art).current())):
+        p50, p99 = latency(kb, N)
+        print(f"{name:<10}{p50:>9.1f}{p99:>9.1f}{startup(load):>13.2f}")
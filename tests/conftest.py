@@ -0,0 +1,22 @@
+import asyncio
+import pytest
+from services import backend as backend_mod, db as db_mod, memory
+from services.backend_sqlite import SQLiteBackend
+from services.dialog_buffer import DialogBuffer
+from services.slot_cache import SlotCache
+from services.migrations import migrate
+
+@pytest.fixture
+def be(tmp_path, monkeypatch):
+    """SQLiteBackend sobre una BD temporal, instalado como backend() del proceso."""
+    path = str(tmp_path / "t.db")
+    migrate(db_mod.get_store(path))
+    monkeypatch.setattr(memory, "DB_PATH", path)
+    # cachés del módulo vacías: cada prueba trae su propia BD
+    monkeypatch.setattr(memory, "_cache", SlotCache("memory", 100, 60))
+    monkeypatch.setattr(memory, "_dialog", DialogBuffer("memory", 20, 100, memory._dialog_from_db))
+    b = SQLiteBackend(path)
+    monkeypatch.setattr(backend_mod, "_BACKEND", b)
+    yield b
+    asyncio.run(b.close())
+    db_mod._STORES.pop(path).close()
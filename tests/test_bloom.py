@@ -0,0 +1,57 @@
+import asyncio
+import pytest
+from monitoring import bloom_false_positive
+from services.bloom import BloomDedupe, RotatingBloom
+from services.dedupe import MemoryDedupe
+
+def _bloom(exact, horizon=3600.0, ttl=3600.0):
+    return BloomDedupe(exact, RotatingBloom(horizon, 4, 1000, 0.001), horizon, 1000, ttl)
+
+def test_horizon_shorter_than_ttl_is_rejected():
+    with pytest.raises(ValueError):
+        _bloom(MemoryDedupe(7200, 100), horizon=3600, ttl=7200)
+
+def test_cold_filter_checks_the_exact_store():
+    async def main():
+        exact = MemoryDedupe(3600, 100)
+        await exact.add_if_new("a")
+        bd = _bloom(exact)
+        assert not bd.warm
+        assert await bd.add_if_new("a") is False
+        assert await bd.add_if_new("b") is True
+        assert await exact.add_if_new("b") is False       # quedó registrado en el store
+    asyncio.run(main())
+
+def test_warm_filter_answers_seen_keys_from_the_store():
+    async def main():
+        exact = MemoryDedupe(3600, 100)
+        await exact.add_if_new("a")
+        bd = _bloom(exact)
+        await bd.start()
+        assert bd.warm and "a" in bd.bloom
+        assert await bd.add_if_new("a") is False
+    asyncio.run(main())
+
+def test_miss_is_new_and_registered_in_background():
+    async def main():
+        exact = MemoryDedupe(3600, 100)
+        bd = _bloom(exact)
+        await bd.start()
+        assert await bd.add_if_new("x") is True
+        assert await bd.add_if_new("x") is False          # reintento con el registro en vuelo
+        await asyncio.sleep(0)
+        assert await exact.add_if_new("x") is False
+        await bd.discard("x")
+        assert await bd.add_if_new("x") is True           # discard libera también el store
+    asyncio.run(main())
+
+def test_false_positive_falls_back_to_the_store():
+    async def main():
+        bd = _bloom(MemoryDedupe(3600, 100))
+        await bd.start()
+        bd.bloom.add("y")                                 # el filtro "cree" haberla visto
+        before = bloom_false_positive._value.get()
+        assert await bd.add_if_new("y") is True
+        assert bloom_false_positive._value.get() == before + 1
+        assert await bd.add_if_new("y") is False
+    asyncio.run(main())
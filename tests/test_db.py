@@ -0,0 +1,35 @@
+import sqlite3
+import pytest
+from services.db import Store
+
+@pytest.fixture
+def store(tmp_path):
+    s = Store(str(tmp_path / "t.db"), batch_ms=50)
+    s.execute("CREATE TABLE t (x INTEGER UNIQUE)")
+    yield s
+    s.close()
+
+def test_failed_op_is_rolled_back_alone(store):
+    def partial(con):
+        con.execute("INSERT INTO t VALUES (1)")
+        con.execute("INSERT INTO t VALUES (1)")     # viola UNIQUE después de escribir
+    futs = [store.submit("INSERT INTO t VALUES (0)"), store.submit(partial), store.submit("INSERT INTO t VALUES (2)")]
+    assert futs[0].result() == 1 and futs[2].result() == 1
+    with pytest.raises(sqlite3.IntegrityError):
+        futs[1].result()
+    assert [x for (x,) in store.query("SELECT x FROM t ORDER BY x")] == [0, 2]
+
+def test_script_runs_outside_the_batch(store):
+    futs = [store.submit("INSERT INTO t VALUES (?)", (i,)) for i in range(3)]
+    store.script("CREATE TABLE u (y); INSERT INTO u VALUES (1);")
+    futs.append(store.submit(lambda con: con.execute("INSERT INTO t VALUES (9)").rowcount))
+    assert [f.result() for f in futs] == [1, 1, 1, 1]
+    assert store.one("SELECT COUNT(*) FROM u")[0] == 1
+    assert store.one("SELECT COUNT(*) FROM t")[0] == 4
+
+def test_commit_inside_batch_is_reported(store):
+    fut = store.submit(lambda con: con.execute("COMMIT"))
+    after = store.submit("INSERT INTO t VALUES (5)")
+    with pytest.raises(RuntimeError):
+        fut.result()
+    assert after.result() == 1
@@ -0,0 +1,77 @@
+import asyncio, os, time, uuid
+import pytest
+from services.dedupe import MemoryDedupe, SQLiteDedupe, StoreDedupe, TTLSet
+
+def test_memory_ttl_expires_and_discard_forgets(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    s = TTLSet(60, 100)
+    assert s.add_if_new("a") is True
+    assert s.add_if_new("a") is False
+    now[0] += 30
+    assert s.add_if_new("b") is True
+    assert s.recent(1020) == ["b"]
+    now[0] += 31                                  # "a" ya venció, "b" no
+    assert s.purge() == 1
+    assert s.add_if_new("a") is True
+    assert s.add_if_new("b") is False
+    s.discard("b")
+    assert s.add_if_new("b") is True
+
+def test_memory_cap_drops_the_oldest():
+    async def main():
+        d = MemoryDedupe(3600, 2)
+        for k in ("a", "b", "c"):
+            assert await d.add_if_new(k) is True
+        assert await d.purge() == 2
+        assert await d.add_if_new("a") is True          # se fue por el tope, no por el TTL
+        assert await d.recent(0, 10) == ["c", "a"]
+    asyncio.run(main())
+
+def test_sqlite_ttl_expires_and_discard_forgets(be):
+    d = SQLiteDedupe(be.path, 60)
+    assert d.add_if_new("a") is True
+    assert d.add_if_new("a") is False
+    assert d.insert("old", -1) is True               # registrada ya vencida
+    assert d.add_if_new("old") is True               # el upsert la toma como nueva
+    assert d.insert("gone", -1) is True
+    assert d.purge() == 2
+    assert sorted(d.recent(time.time(), 10)) == ["a", "old"]
+    d.discard("a")
+    assert d.add_if_new("a") is True
+    assert d.add_if_new("") is True                  # sin wamid no se deduplica
+
+def test_store_dedupe_goes_through_the_backend(be):
+    async def main():
+        d = StoreDedupe(60)
+        assert await d.add_if_new("a") is True
+        assert await d.add_if_new("a") is False
+        await d.discard("a")
+        assert await d.add_if_new("a") is True
+        await be.dedupe_add_if_new("gone", -1)
+        assert await d.purge() == 1
+        assert await d.recent(time.time() - 5, 10) == ["a"]
+    asyncio.run(main())
+
+REDIS_URL = os.getenv("TEST_REDIS_URL")
+
+@pytest.mark.skipif(not REDIS_URL, reason="sin Redis (TEST_REDIS_URL)")
+def test_redis_counts_only_its_own_keys():
+    pytest.importorskip("redis")
+    from services.dedupe import RedisDedupe
+    async def main():
+        prefix = f"t_{uuid.uuid4().hex[:12]}:"
+        d = RedisDedupe(REDIS_URL, 60, prefix)
+        await d.r.set(prefix[:-1] + "-ajena", 1, ex=60)     # otra llave en la misma BD
+        try:
+            assert await d.add_if_new("a") is True
+            assert await d.add_if_new("a") is False
+            assert await d.add_if_new("b") is True
+            assert await d.purge() == 2
+            await d.discard("a")
+            assert await d.recent(0, 10) == ["b"]
+            assert await d.add_if_new("a") is True
+        finally:
+            await d.r.delete(prefix + "a", prefix + "b", prefix[:-1] + "-ajena")
+            await d.r.aclose()
+    asyncio.run(main())
@@ -0,0 +1,56 @@
+import threading, time
+from services import archive, memory
+from services.dialog_buffer import DialogBuffer
+
+class SlowDisk:
+    """Loader cuyo primer read devuelve las filas de ese momento y se queda esperando a `go`."""
+    def __init__(self):
+        self.rows, self.go, self.reading, self.reads = [], threading.Event(), threading.Event(), 0
+    def __call__(self, wa_id, limit):
+        self.reads += 1
+        rows = list(self.rows)[-limit:]
+        if self.reads == 1:
+            self.reading.set()
+            self.go.wait(5)
+        return rows
+
+def _warm_in_background(buf, wa_id):
+    t = threading.Thread(target=buf.recent, args=(wa_id, 5))
+    t.start()
+    return t
+
+def test_turn_logged_while_a_warmer_reads_is_not_lost():
+    disk = SlowDisk()
+    buf = DialogBuffer("t", 5, 10, disk)
+    t = _warm_in_background(buf, "521")
+    disk.reading.wait(5)
+    disk.rows.append("user: hola")
+    buf.append("521", "user: hola")
+    assert buf.recent("521", 5) == ["user: hola"]    # segundo warmer: ve la fila nueva
+    disk.go.set()
+    t.join()
+    assert buf.recent("521", 5) == ["user: hola"]    # el lento (vacío) no pisó el buffer
+    assert buf._warming == {}
+
+def test_invalidate_during_warm_discards_the_stale_read():
+    disk = SlowDisk()
+    disk.rows = ["user: viejo"]
+    buf = DialogBuffer("t", 5, 10, disk)
+    t = _warm_in_background(buf, "521")
+    disk.reading.wait(5)
+    disk.rows = []                                   # p. ej. el archivo borró el turno
+    buf.invalidate("521")
+    disk.go.set()
+    t.join()
+    assert buf.recent("521", 5) == []
+    assert disk.reads == 2
+
+def test_archive_invalidates_the_dialog_buffer(be, tmp_path):
+    memory.log_turn("521", "user", "viejo")
+    memory.log_turn("521", "user", "nuevo")
+    assert memory.recent_dialog("521") == ["user: viejo", "user: nuevo"]
+    store = be._db()
+    store.execute("UPDATE messages SET ts=?", (int(time.time()) - 90 * 86400,))
+    res = archive.compact(store, str(tmp_path / "archive"), 30, keep_last=1, forget=memory.forget_turn)
+    assert res["moved"] == 1
+    assert memory.recent_dialog("521") == ["user: nuevo"]
@@ -0,0 +1,48 @@
+import asyncio
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from routers import webhook
+from services.dedupe import MemoryDedupe
+from services.ingest import IngestQueue
+
+def test_capacity_counts_work_still_running():
+    async def main():
+        q, gate = IngestQueue(maxsize=2, workers=1), asyncio.Event()
+        async def handler(item):
+            return asyncio.ensure_future(gate.wait())      # sigue en su fila después del worker
+        await q.start(handler)
+        assert q.offer(1) and q.offer(2)
+        await asyncio.sleep(0.01)                          # el worker ya las sacó de la cola
+        assert not q.offer(3)
+        gate.set()
+        await asyncio.sleep(0.01)
+        assert q.offer(4)
+        assert await q.stop(1) == []
+    asyncio.run(main())
+
+def test_stop_returns_items_never_taken():
+    async def main():
+        q, gate = IngestQueue(maxsize=10, workers=1), asyncio.Event()
+        async def handler(item):
+            await gate.wait()
+        await q.start(handler)
+        for i in range(3):
+            q.offer(i)
+        assert await q.stop(0.05) == [1, 2]
+    asyncio.run(main())
+
+class _Full:
+    def offer(self, item):
+        return False
+
+def test_full_queue_answers_503_and_releases_the_wamid(monkeypatch):
+    dd = MemoryDedupe(60, 100)
+    monkeypatch.setattr(webhook, "dedupe", dd)
+    monkeypatch.setattr(webhook, "ingest", _Full())
+    app = FastAPI()
+    app.include_router(webhook.router)
+    body = {"object": "whatsapp_business_account",
+            "entry": [{"changes": [{"value": {"messages": [{"id": "wamid.1", "from": "521"}]}}]}]}
+    r = TestClient(app).post("/webhook", json=body)
+    assert r.status_code == 503
+    assert asyncio.run(dd.add_if_new("wamid.1"))           # el reintento de Meta se procesa
@@ -0,0 +1,55 @@
+import pytest
+from services.intents import IntentEngine
+
+@pytest.fixture(scope="module")
+def engine():
+    return IntentEngine.load("KB/intents.json")
+
+@pytest.mark.parametrize("text, norm", [
+    ("¿Cuánto cuesta?", "cuanto cuesta"),
+    ("holaaa!!", "hola"),
+    ("Buenos DÍAS", "buenos dias"),
+    ("qto cuesta", "cuanto cuesta"),           # typo de la tabla
+    ("Kuanto sale el trámite", "cuanto sale el tramite"),
+    ("ya llené el DS160", "ya llene el ds 160"),
+    ("porfa", "por favor"),
+    ("bn", "bn"),                              # sin regla: "bn" es ambiguo (bien/buenas)
+])
+def test_normalize(engine, text, norm):
+    assert engine.normalize(text) == norm
+
+@pytest.mark.parametrize("text, intents", [
+    ("hola, cuánto cuesta", ["costos"]),                 # el saludo es de mensaje completo
+    ("cuánto cuesta el proceso?", ["costos", "proceso"]),
+    ("requisitos para renovar", ["docs", "renov"]),
+    ("Soy Karla y quiero saber precios", ["costos", "nombre"]),
+    ("holaaa!!", ["saludo"]),
+    ("Buenas tardes", ["saludo"]),
+    ("hola buenos días", ["saludo"]),
+    ("bueno", ["saludo"]),
+    ("Bueno, y los requisitos?", ["docs"]),
+    ("bn", []),
+    ("bn dias", []),
+    ("buen dia", []),                                    # "buen* dias" pide el plural
+    ("el costo", ["costos"]),
+    ("escoston", []),                                    # los prefijos respetan el inicio de palabra
+    ("soya", []),                                        # y las palabras sin '*' el final
+])
+def test_classify(engine, text, intents):
+    assert engine.classify(text) == intents
+
+def test_best_skips_intents_without_reply(engine):
+    assert engine.best("me llamo Ana, qué documentos ocupo") == "docs"
+    assert engine.best("me llamo Ana") == "nombre"
+    assert engine.best("me llamo Ana", with_reply=True) is None
+
+def test_duplicate_keyword_is_rejected():
+    spec = {"intents": [{"name": "a", "keywords": ["costo*", "precio"]},
+                        {"name": "b", "keywords": ["precio"]}]}
+    with pytest.raises(ValueError, match="precio"):
+        IntentEngine(spec)
+
+def test_same_keyword_may_be_whole_and_word():
+    spec = {"intents": [{"name": "a", "keywords": ["hola"], "whole": True},
+                        {"name": "b", "keywords": ["hola"], "priority": 1}]}
+    assert IntentEngine(spec).classify("hola") == ["b", "a"]
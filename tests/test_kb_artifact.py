@@ -0,0 +1,66 @@
+import pytest
+from services.kb import KB_DIR, Knowledge, Snapshot
+from services.kb_artifact import _HEAD, SECTIONS, load_artifact, write_artifact
+
+@pytest.fixture(scope="module")
+def snap():
+    return Snapshot.from_sources(KB_DIR)
+
+@pytest.fixture
+def artifact(tmp_path, snap):
+    path = tmp_path / "kb.bin"
+    write_artifact(snap, path, KB_DIR)
+    return path
+
+def _patch_section(path, name, delta):
+    """Cambia la longitud registrada de una sección en el encabezado."""
+    raw = bytearray(path.read_bytes())
+    head = list(_HEAD.unpack_from(raw, 0))
+    i = 3 + 2 * SECTIONS.index(name) + 1
+    head[i] += delta
+    _HEAD.pack_into(raw, 0, *head)
+    path.write_bytes(bytes(raw))
+
+def test_roundtrip_matches_bm25(artifact, snap):
+    mapped = load_artifact(artifact)
+    assert mapped.digest == snap.digest
+    assert len(mapped.index) == len(snap.index)
+    for q in ("cuánto cuesta", "qué documentos necesito", "renovación de pasaporte"):
+        assert [c for _, c in mapped.index.search(q, 3)] == [c for _, c in snap.index.search(q, 3)]
+
+def test_truncated_artifact_is_rejected(artifact):
+    artifact.write_bytes(artifact.read_bytes()[:-64])
+    with pytest.raises(ValueError):
+        load_artifact(artifact)
+
+@pytest.mark.parametrize("name", ["chunk_off", "post_w"])
+def test_odd_length_section_is_rejected(artifact, name):
+    _patch_section(artifact, name, -1)
+    with pytest.raises(ValueError):
+        load_artifact(artifact)
+
+def test_inconsistent_sections_are_rejected(artifact):
+    _patch_section(artifact, "post_doc", -4)
+    with pytest.raises(ValueError):
+        load_artifact(artifact)
+
+def test_corrupt_artifact_falls_back_to_sources(artifact, snap):
+    _patch_section(artifact, "chunk_off", -1)
+    kb = Knowledge(KB_DIR, check_every=60, artifact=artifact)
+    assert kb.current().source == "sources"
+    assert kb.digest() == snap.digest
+    assert kb.search("cuánto cuesta", 1)
+
+def test_fresh_artifact_is_used_without_rehashing(artifact, monkeypatch):
+    import services.kb as kb_mod
+    monkeypatch.setattr(kb_mod, "content_hash", lambda root=KB_DIR: pytest.fail("re-hash"))
+    assert Knowledge(KB_DIR, check_every=60, artifact=artifact).current().source == "artifact"
+
+def test_missing_required_section_fails_the_load(tmp_path):
+    import shutil
+    root = tmp_path / "KB"
+    shutil.copytree(KB_DIR, root)
+    pol = root / "politica.md"
+    pol.write_text(pol.read_text(encoding="utf-8").split("## Tiempos")[0], encoding="utf-8")
+    with pytest.raises(ValueError, match="tiempos"):
+        Knowledge(root).current()
@@ -0,0 +1,71 @@
+import asyncio
+from services.lanes import Lanes
+
+def test_busy_wa_id_does_not_block_others():
+    async def main():
+        lanes, done = Lanes(), []
+        gate = asyncio.Event()
+        async def slow(i):
+            await gate.wait()
+            done.append(("a", i))
+        async def fast():
+            done.append(("b", 0))
+        for i in range(20):                     # más filas ocupadas que workers de ingesta
+            lanes.submit("a", lambda i=i: slow(i))
+        lanes.submit("b", fast)
+        await asyncio.sleep(0.01)
+        assert done == [("b", 0)]
+        gate.set()
+        await lanes.drain(1)
+        assert done[1:] == [("a", i) for i in range(20)]     # FIFO dentro del wa_id
+        assert len(lanes) == 0                               # filas vacías se borran
+    asyncio.run(main())
+
+def test_submit_and_hold_share_the_lane():
+    async def main():
+        lanes, order = Lanes(), []
+        async with lanes.hold("a"):
+            lanes.submit("a", lambda: asyncio.sleep(0, order.append("job")))
+            await asyncio.sleep(0.01)
+            order.append("hold")
+        await lanes.drain(1)
+        assert order == ["hold", "job"]
+    asyncio.run(main())
+
+def test_failing_job_does_not_stop_the_lane():
+    async def main():
+        lanes, done = Lanes(), []
+        async def boom():
+            raise RuntimeError("x")
+        lanes.submit("a", boom)
+        lanes.submit("a", lambda: asyncio.sleep(0, done.append(1)))
+        await lanes.drain(1)
+        assert done == [1]
+    asyncio.run(main())
+
+def test_limit_caps_jobs_across_lanes():
+    async def main():
+        lanes, running, peak = Lanes(limit=2), [0], [0]
+        async def job():
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+            await asyncio.sleep(0.01)
+            running[0] -= 1
+        futs = [lanes.submit(str(i), job) for i in range(6)]
+        await asyncio.gather(*futs)
+        assert peak[0] == 2
+    asyncio.run(main())
+
+def test_drain_reports_jobs_it_cancels():
+    async def main():
+        lanes, dropped = Lanes(), []
+        async def dropper(i):
+            dropped.append(i)
+        gate = asyncio.Event()
+        futs = [lanes.submit("a", gate.wait, dropped=lambda i=i: dropper(i)) for i in range(3)]
+        lanes.submit("b", lambda: asyncio.sleep(0), dropped=lambda: dropper("b"))
+        await lanes.drain(0.05)
+        assert sorted(dropped) == [0, 1, 2]          # el que corría y los que esperaban
+        assert all(f.cancelled() for f in futs)
+        assert len(lanes) == 0
+    asyncio.run(main())
@@ -0,0 +1,156 @@
+import asyncio, time
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from routers import outbox as outbox_router
+from services import memory, outbox as outbox_mod
+from services.outbound import Dispatcher
+from services.whatsapp import GraphError
+
+@pytest.fixture
+def sent(monkeypatch):
+    """Graph falso: cada envío toma el siguiente error de `fail` (si hay) o sale bien."""
+    log, fail = [], []
+    async def send_text(wa_id, body):
+        if fail:
+            raise fail.pop(0)
+        log.append((wa_id, body))
+        return f"wamid.{len(log)}"
+    monkeypatch.setattr(outbox_mod, "send_text", send_text)
+    return log, fail
+
+def _outbox(**kw):
+    # Dispatcher sin start(): put/attempt van directo, sin sondeo
+    return outbox_mod.Outbox(Dispatcher("test", 100.0, 10, 1), **{"max_attempts": 3, "base": 0.01, "cap": 0.01,
+                                                    "poll_every": 60, "lease": 30, **kw})
+
+def _status(be, id):
+    return be._db().one("SELECT status FROM outbox WHERE id=?", (id,))[0]
+
+def test_reply_is_logged_in_order_even_if_delivered_late(be, sent):
+    _, fail = sent
+    ob = _outbox()
+    async def run():
+        await be.log_turn("521", "user", "hola")
+        fail.append(GraphError("TRANSIENT"))
+        assert await ob.send("521", "qué tal", "m1:r") is False      # queda en reintento
+        await be.log_turn("521", "user", "¿sigues?")
+        id = be._db().one("SELECT id FROM outbox WHERE key='m1:r'")[0]
+        assert await ob.attempt("521", id) is True
+    asyncio.run(run())
+    assert memory.recent_dialog("521") == ["user: hola", "assistant: qué tal", "user: ¿sigues?"]
+
+def test_duplicate_key_is_not_sent_or_logged_twice(be, sent):
+    log, _ = sent
+    ob = _outbox()
+    async def run():
+        assert await ob.send("522", "hola", "m1:r") is True
+        assert await ob.put("522", "hola", "m1:r") is None
+    asyncio.run(run())
+    assert log == [("522", "hola")]
+    assert memory.recent_dialog("522") == ["assistant: hola"]
+
+def test_claim_keeps_fifo_per_wa_id(be):
+    async def run():
+        a = await be.outbox_put("k1", "523", "text", "uno", None, time.time())
+        b = await be.outbox_put("k2", "523", "text", "dos", None, time.time())
+        r = await be.outbox_put("read:x", "523", "read", "x", None, time.time())
+        other = await be.outbox_put("k3", "524", "text", "otro", None, time.time())
+        assert await be.outbox_claim(b, 30) is None            # espera a "uno"
+        assert await be.outbox_claim(r, 30) is not None        # los acuses no llevan orden
+        assert await be.outbox_claim(other, 30) is not None    # otro wa_id no espera
+        assert await be.outbox_claim(a, 30) == ("text", "uno", 1)
+        assert await be.outbox_claim(a, 30) is None            # ya está tomada
+        assert await be.outbox_claim(b, 30) is None            # "uno" sigue en sending
+        await be.outbox_sent(a, "wamid.1")
+        assert await be.outbox_claim(b, 30) == ("text", "dos", 1)
+    asyncio.run(run())
+
+def test_due_recovers_expired_leases(be):
+    async def run():
+        id = await be.outbox_put("k1", "525", "text", "uno", None, time.time())
+        assert await be.outbox_claim(id, -1) is not None       # lease ya vencido: el worker murió
+        assert await be.outbox_due(10) == [(id, "525")]
+        assert _status(be, id) == "pending"
+        assert await be.outbox_claim(id, 30) == ("text", "uno", 2)
+        assert await be.outbox_due(10) == []                   # lease vigente: no se retoma
+    asyncio.run(run())
+
+def test_permanent_error_goes_to_dead_letter_and_drops_the_turn(be, sent):
+    _, fail = sent
+    ob = _outbox()
+    async def run():
+        fail.append(GraphError("RECIPIENT_NOT_ALLOWED"))
+        assert await ob.send("526", "hola", "m1:r") is False
+    asyncio.run(run())
+    dead = asyncio.run(be.outbox_dead())
+    assert [(d["wa_id"], d["body"], d["attempts"]) for d in dead] == [("526", "hola", 1)]
+    assert dead[0]["last_error"].startswith("RECIPIENT_NOT_ALLOWED")
+    assert memory.recent_dialog("526") == []
+
+def test_exhausted_attempts_go_to_dead_letter(be, sent):
+    _, fail = sent
+    ob = _outbox(max_attempts=2)
+    async def run():
+        fail.extend([GraphError("TRANSIENT"), GraphError("TRANSIENT")])
+        id = await be.outbox_put("k1", "527", "text", "hola", None, time.time())
+        assert await ob.attempt("527", id) is False
+        assert _status(be, id) == "pending"
+        await asyncio.sleep(0.02)
+        assert await ob.attempt("527", id) is False
+        return id
+    id = asyncio.run(run())
+    assert _status(be, id) == "dead"
+
+def test_retry_route_requeues_dead_letters(be, sent):
+    _, fail = sent
+    ob = _outbox()
+    async def dead():
+        fail.append(GraphError("PERMANENT"))
+        await ob.send("528", "hola", "m1:r")
+    asyncio.run(dead())
+    app = FastAPI()
+    app.include_router(outbox_router.router, prefix="/outbox")
+    with TestClient(app) as client:
+        id = client.get("/outbox/dead").json()[0]["id"]
+        assert client.post(f"/outbox/dead/{id}/retry").json() == {"ok": True}
+        assert client.post(f"/outbox/dead/{id}/retry").status_code == 404    # ya no está en dead-letter
+        assert client.get("/outbox/dead").json() == []
+    assert _status(be, id) == "pending"
+    assert memory.recent_dialog("528") == ["assistant: hola"]
+    assert asyncio.run(ob.attempt("528", id)) is True
+    assert _status(be, id) == "sent"
+
+def test_due_skips_rows_waiting_on_an_earlier_text(be):
+    async def run():
+        now = time.time()
+        a = await be.outbox_put("k1", "529", "text", "uno", None, now)
+        b = await be.outbox_put("k2", "529", "text", "dos", None, now)
+        r = await be.outbox_put("read:x", "529", "read", "x", None, now)
+        await be.outbox_claim(a, 30)
+        await be.outbox_fail(a, "TOKEN_EXPIRED: x", now + 3600)      # atorado en reintento
+        assert await be.outbox_due(10) == [(r, "529")]               # "dos" no se despacha
+        await be.outbox_fail(a, "PERMANENT: x", None)
+        assert await be.outbox_due(10) == [(b, "529"), (r, "529")]
+    asyncio.run(run())
+
+def test_custom_store_and_sender(tmp_path, be):
+    from services.backend_sqlite import SQLiteBackend
+    from services.db import get_store, _STORES
+    from services.migrations import migrate
+    import storage
+    path = str(tmp_path / "flask.db")
+    migrate(get_store(path))
+    other, sent = SQLiteBackend(path, turns=storage), []
+    async def send(wa_id, body):
+        sent.append(body)
+        return "wamid.x"
+    ob = outbox_mod.Outbox(Dispatcher("test", 100.0, 10, 1), 3, 0.01, 0.01, 60, 30,
+                           store=lambda: other, send=send)
+    assert asyncio.run(ob.send("530", "hola", "m1:r")) is True
+    assert sent == ["hola"]
+    assert get_store(path).one("SELECT status FROM outbox WHERE key='m1:r'")[0] == "sent"
+    assert get_store(path).one("SELECT text FROM messages WHERE wa_id='530'")[0] == "hola"
+    assert be._db().one("SELECT COUNT(*) FROM outbox")[0] == 0
+    asyncio.run(other.close())
+    _STORES.pop(path).close()
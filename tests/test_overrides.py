@@ -0,0 +1,59 @@
+import asyncio, time
+import human_override
+from services.overrides import Handoffs
+
+def test_flask_claim_can_be_reopened(be, monkeypatch):
+    monkeypatch.setattr(human_override, "DB_PATH", be.path)
+    human_override.open_handoff("521", 60)
+    exp = human_override.submit_human_reply("521", "hola")
+    assert exp is not None and exp > time.time()
+    assert human_override.submit_human_reply("521", "otra") is None      # ya la tomaron
+    human_override.reopen_handoff("521", exp)                          # el envío falló
+    assert human_override.pending_requests().keys() == {"521"}
+    assert human_override.claim_handoff("521") == exp
+
+def test_flask_pending_skips_expired_without_writing(be, monkeypatch):
+    monkeypatch.setattr(human_override, "DB_PATH", be.path)
+    human_override.open_handoff("521", -1)
+    human_override.open_handoff("522", 60)
+    assert human_override.pending_requests().keys() == {"522"}
+    assert be._db().one("SELECT COUNT(*) FROM overrides")[0] == 2
+
+def test_reply_is_queued_before_the_window_closes(be):
+    sent, fail = [], [RuntimeError("outbox caído")]
+    async def deliver(wa_id, text, key):
+        if fail:
+            raise fail.pop()
+        sent.append((wa_id, text, key))
+    async def main():
+        h = Handoffs()
+        await h.start(deliver)
+        await h.escalate("521", 60)
+        assert await h.submit("521", "te llamo") is True
+        await h.stop()
+        assert sent == [] and await be.override_reply("521") is not None    # no se perdió
+        h = Handoffs()
+        await h.start(deliver)                       # al arrancar se retoma la contestada
+        await h.stop()
+        assert await be.override_reply("521") is None
+        assert await be.override_pending() == {}
+    asyncio.run(main())
+    assert len(sent) == 1 and sent[0][:2] == ("521", "te llamo")
+    assert sent[0][2].startswith("override:521:")
+
+def test_closing_the_window_hands_the_chat_back_to_the_bot(be):
+    async def deliver(wa_id, text, key):
+        pass
+    async def main():
+        h = Handoffs()
+        await h.start(deliver)
+        for wa_id in ("521", "522"):
+            await be.merge_slots(wa_id, {"stage": "escalado"})
+        await h.escalate("521", 60)
+        await h.escalate("522", 0)
+        assert await h.submit("521", "te llamo") is True
+        await asyncio.sleep(0.05)                    # vence la de 522
+        await h.stop()
+        assert (await be.load_slots("521"))["stage"] == "dialog"    # contestada
+        assert (await be.load_slots("522"))["stage"] == "dialog"    # vencida
+    asyncio.run(main())
@@ -0,0 +1,26 @@
+from services.slot_cache import SlotCache
+
+def test_nested_values_are_not_shared():
+    c = SlotCache("t", 10, 60)
+    slots = {"stage": "dialog", "assets": ["casa"], "extra": {"hijos": [1]}}
+    c.put("521", slots)
+    slots["assets"].append("auto")                   # el caller sigue usando su dict
+    got = c.get("521")
+    assert got == {"stage": "dialog", "assets": ["casa"], "extra": {"hijos": [1]}}
+    got["assets"].append("auto")
+    got["extra"]["hijos"].append(2)
+    got["stage"] = "cierre"
+    assert c.get("521") == {"stage": "dialog", "assets": ["casa"], "extra": {"hijos": [1]}}
+
+def test_ttl_and_lru():
+    c = SlotCache("t", 2, 60)
+    c.put("a", {"stage": "new"})
+    c.put("b", {"stage": "new"})
+    assert c.get("a") is not None                    # "a" pasa al final
+    c.put("c", {"stage": "new"})
+    assert c.get("b") is None
+    c.put("a", {"stage": "dialog"}, only_if_absent=True)
+    assert c.get("a") == {"stage": "new"}
+    c = SlotCache("t", 2, -1)
+    c.put("a", {"stage": "new"})
+    assert c.get("a") is None
@@ -51,13 +51,15 @@ def send_text(to: str, body: str) -> Tuple[bool, str]:
             return False, "BAD_ENDPOINT"
         return False, txt
 
-def mark_as_read(wamid: str) -> Tuple[bool, str]:
+def mark_as_read(wamid: str, typing: bool = False) -> Tuple[bool, str]:
     url = f"https://graph.facebook.com/{GRAPH_VER}/{WHATSAPP_PHONE_ID}/messages"
     payload = {
         "messaging_product": "whatsapp",
         "status": "read",
         "message_id": wamid
     }
+    if typing:
+        payload["typing_indicator"] = {"type": "text"}
     try:
         r = _post(url, payload)
         return True, r.text